@@ -1,12 +1,12 @@
 import os
 import sys
-from pathlib import Path
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from dotenv import find_dotenv, load_dotenv
 
 from podology.dashboard import init_dashboard
-from config import PROJECT_NAME, BASE_PATH
+from podology.frontend.media import media
+from config import BASE_PATH
 
 
 load_dotenv(find_dotenv())
@@ -16,10 +16,7 @@ server = Flask(__name__)
 
 route = BASE_PATH
 
-@server.route(f"{route}audio/<eid>")
-def serve_audio(eid):
-    audio_dir = Path("data") / PROJECT_NAME / "audio"
-    return send_from_directory(audio_dir, f"{eid}.mp3")
+server.register_blueprint(media, url_prefix=route)
 
 app = init_dashboard(server, route=route)
 if app is None:
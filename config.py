@@ -58,7 +58,13 @@ TRANSCRIBER_ARGS = {
     "model": "distil-large-v3",
     "min_speakers": 2,
     "max_speakers": 5,
+    # Seconds between status checks of asynchronous jobs:
+    "poll_interval": 10,
 }
+# Episodes transcribed in bulk (python -m podology.data.batching) are grouped into
+# batches of up to this many seconds of audio, which the transcriber gets together:
+TRANSCRIBE_BATCH_SECONDS = 4 * 3600
+TRANSCRIBE_BATCH_MAX_EPISODES = 8
 
 #
 # Settings about sentence embeddings and vector search
@@ -111,6 +117,50 @@ STOPWORDS = [
 # transcript scrollbar:
 HITS_PLOT_BINS = 500
 
+# Word clouds in the episode table's tooltip are either images rendered by the stats
+# pipeline ("image"), or drawn in the browser from the episode's most frequent named
+# entities ("json"), which skips the pipeline's word cloud stage altogether:
+WORDCLOUD_MODE = "image"
+WORDCLOUD_TOP_N = 40
+
+# Images are rendered at the size they are displayed at. Format is "webp" (smaller)
+# or "png":
+WORDCLOUD_WIDTH = 400
+WORDCLOUD_HEIGHT = 200
+WORDCLOUD_FORMAT = "webp"
+
+# Width in seconds of the time window shown by the scroll animation (the ticker).
+# Tickers are precomputed for this width by the stats pipeline:
+TICKER_WINDOW_WIDTH = 120
+
+# Two named entities count towards their types' proximity score if they occur within
+# this many seconds of each other. Scores decay with 1/distance², so anything much
+# farther apart hardly contributes anyway:
+PROXIMITY_WINDOW = 300
+
+# Audio prefetching (python -m podology.data.prefetch, or the "download" queue):
+# number of concurrent downloads, and a cap on their total rate in bytes per second
+# (None for no cap):
+PREFETCH_WORKERS = 4
+PREFETCH_MAX_BANDWIDTH = None
+
+# Once an episode's audio is downloaded, make a mono low-bitrate rendition for the
+# dashboard's audio player, and an HLS variant of it (needs ffmpeg on the workers).
+# Episodes without renditions are played from the original file:
+AUDIO_RENDITIONS = False
+RENDITION_BITRATE = "48k"
+RENDITION_SAMPLE_RATE = 24000
+HLS_SEGMENT_SECONDS = 10
+
+# Named entity recognition engine. NLTKBackend tags every segment with NLTK; the much
+# faster GazetteerBackend matches names already found in earlier episodes, plus
+# capitalized words in mid-sentence. Compare both on your own episodes with
+# `python -m podology.stats.ner_benchmark` before switching.
+NER_BACKEND_CLASS = "podology.stats.nlp.NLTKBackend"
+NER_BACKEND_ARGS = {}
+# NER_BACKEND_CLASS = "podology.stats.nlp.GazetteerBackend"
+# NER_BACKEND_ARGS = {"min_count": 2, "capitalization": True}
+
 
 # -----------------------------------------------------------------------------
 
@@ -126,16 +176,34 @@ AUDIO_DIR = DATA_DIR / PROJECT_NAME / "audio"
 TRANSCRIPT_DIR = DATA_DIR / PROJECT_NAME / "transcripts"
 CHUNKS_DIR = DATA_DIR / PROJECT_NAME / "chunks"
 WORDCLOUD_DIR = DATA_DIR / PROJECT_NAME / "wordclouds"
+RENDITIONS_DIR = DATA_DIR / PROJECT_NAME / "renditions"
 ASSETS_DIR = Path("podology") / "assets"
 
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 TRANSCRIPT_DIR.mkdir(parents=True, exist_ok=True)
 CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
 WORDCLOUD_DIR.mkdir(parents=True, exist_ok=True)
+RENDITIONS_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 ES_PORT = int(os.getenv("ELASTICSEARCH_PORT", 0))
 
+# Threads of the gunicorn worker (read by gunicorn.conf.py):
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", 16))
+
+# Audio is served by the app itself (""), or handed to a fronting proxy to stream,
+# so that long downloads don't hold the app's threads:
+# - "x-sendfile": Apache/lighttpd with X-Sendfile; the proxy reads AUDIO_DIR itself.
+# - "x-accel-redirect": nginx; AUDIO_ACCEL_PREFIX and RENDITIONS_ACCEL_PREFIX must be
+#   `internal` locations aliased to AUDIO_DIR and RENDITIONS_DIR, see
+#   nginx.example.conf.
+AUDIO_OFFLOAD = os.getenv("AUDIO_OFFLOAD", "")
+# Served by the app itself, each audio stream holds a thread for as long as it lasts;
+# beyond this many at once, requests get a 503 so that threads are left for Dash:
+AUDIO_STREAMS_MAX = int(os.getenv("AUDIO_STREAMS_MAX", GUNICORN_THREADS // 2))
+AUDIO_ACCEL_PREFIX = os.getenv("AUDIO_ACCEL_PREFIX", "/protected-audio/")
+RENDITIONS_ACCEL_PREFIX = os.getenv("RENDITIONS_ACCEL_PREFIX", "/protected-renditions/")
+
 def get_class(class_path):
     module_name, class_name = class_path.rsplit(".", 1)
     module = importlib.import_module(module_name)
@@ -150,3 +218,8 @@ def get_connector():
 def get_transcriber():
     cls = get_class(TRANSCRIBER_CLASS)
     return cls(**TRANSCRIBER_ARGS)
+
+
+def get_ner_backend():
+    cls = get_class(NER_BACKEND_CLASS)
+    return cls(**NER_BACKEND_ARGS)
@@ -0,0 +1,8 @@
+"""
+gunicorn settings that the app's config shares; gunicorn loads this file from the
+working directory.
+"""
+
+from config import GUNICORN_THREADS
+
+threads = GUNICORN_THREADS
@@ -25,6 +25,57 @@ function handleTranscriptClick(event) {
     }
 }
 
+// Segments of the rendered transcript, with their start and end times sorted by
+// start, so that the active segment can be found by binary search. Rebuilt once per
+// transcript render.
+let segmentIndex = { segments: [], starts: new Float64Array(0), ends: new Float64Array(0) };
+let activeSegment = null;
+
+function buildSegmentIndex() {
+    const segments = Array.from(document.querySelectorAll(".transcript-segment"));
+    segments.sort((a, b) => parseFloat(a.dataset.start) - parseFloat(b.dataset.start));
+
+    const starts = new Float64Array(segments.length);
+    const ends = new Float64Array(segments.length);
+    segments.forEach((seg, i) => {
+        starts[i] = parseFloat(seg.dataset.start);
+        ends[i] = parseFloat(seg.dataset.end);
+    });
+
+    segmentIndex = { segments, starts, ends };
+    activeSegment = null;
+    return segments.length;
+}
+
+// Index of the segment playing at time t, or -1:
+function findActiveSegment(t) {
+    const starts = segmentIndex.starts;
+    // Last segment that starts at or before t:
+    let lo = 0;
+    let hi = starts.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >>> 1;
+        if (starts[mid] <= t) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    const i = lo - 1;
+    return i >= 0 && t < segmentIndex.ends[i] ? i : -1;
+}
+
+// Only touches the previously and the newly active segment:
+function updateActiveSegment(t) {
+    const i = findActiveSegment(t);
+    const seg = i >= 0 ? segmentIndex.segments[i] : null;
+    if (seg === activeSegment) return;
+
+    if (activeSegment) activeSegment.classList.remove("active-segment");
+    if (seg) seg.classList.add("active-segment");
+    activeSegment = seg;
+}
+
 function highlightActiveSegment() {
     const audio = document.getElementById("audio-player");
     if (!audio) return false;
@@ -35,31 +86,25 @@ function highlightActiveSegment() {
     });
     currentAudioListeners = [];
 
-    const segments = document.querySelectorAll(".transcript-segment");
-    if (!segments.length) return false;
+    const nSegments = buildSegmentIndex();
+    if (!nSegments) return false;
 
     // Create new timeupdate listener
     const timeUpdateListener = function () {
-        const currentTime = audio.currentTime;
-        segments.forEach(seg => {
-            const start = parseFloat(seg.dataset.start);
-            const end = parseFloat(seg.dataset.end);
-            if (currentTime >= start && currentTime < end) {
-                seg.classList.add("active-segment");
-            } else {
-                seg.classList.remove("active-segment");
-            }
-        });
+        updateActiveSegment(audio.currentTime);
     };
 
     // Add the new listener and store reference
     audio.addEventListener("timeupdate", timeUpdateListener);
     currentAudioListeners.push(timeUpdateListener);
 
-    console.log("Audio highlight handler attached to", segments.length, "segments");
+    console.log("Audio highlight handler attached to", nSegments, "segments");
     return true;
 }
 
+// For the benchmark page in assets/bench:
+window.podologyAudioSync = { buildSegmentIndex, findActiveSegment, updateActiveSegment };
+
 function initAudioHandlers() {
     if (setupAudioClickHandler() && highlightActiveSegment()) {
         return true;
@@ -93,10 +138,12 @@ if (!initAudioHandlers()) {
 }
 
 // Also re-attach when transcript div content changes specifically
+// Changes within segments (search term highlights) don't count, as the segments stay.
 const transcriptObserver = new MutationObserver(function(mutations) {
-    const hasTranscriptChanges = mutations.some(mutation => 
-        mutation.target.id === "transcript" || 
-        (mutation.target.closest && mutation.target.closest("#transcript"))
+    const hasTranscriptChanges = mutations.some(mutation =>
+        mutation.target.id === "transcript" ||
+        (mutation.target.closest && mutation.target.closest("#transcript") &&
+            !mutation.target.closest(".transcript-segment"))
     );
     
     if (hasTranscriptChanges) {
@@ -1,11 +1,90 @@
 var dagcomponentfuncs = (window.dashAgGridComponentFunctions = window.dashAgGridComponentFunctions || {});
 
+// Word cloud data fetched so far, by URL, so that hovering an episode again doesn't
+// wait for the network:
+const wordcloudDataCache = new Map();
+
+const WORDCLOUD_COLORS = ["#4c72b0", "#3aba57", "#c53a5b", "#8172b3", "#bfa545", "#64b5cd", "#e37c4d"];
+
+function fetchWordcloudData(url) {
+    if (!wordcloudDataCache.has(url)) {
+        const request = fetch(url)
+            .then((response) => (response.ok ? response.json() : []))
+            .catch(() => []);
+        wordcloudDataCache.set(url, request);
+    }
+    return wordcloudDataCache.get(url);
+}
+
+// Lay out [name, count] pairs as words sized by sqrt(count), largest first:
+function WordcloudWords(props) {
+    const entities = props.entities;
+    if (entities.length === 0) {
+        return React.createElement("span", { style: { color: "#888" } }, "No named entities found");
+    }
+    const maxCount = entities[0][1];
+    return entities.map(([name, count], i) =>
+        React.createElement(
+            "span",
+            {
+                key: name,
+                title: `${name}: ${count}`,
+                style: {
+                    fontSize: `${12 + 24 * Math.sqrt(count / maxCount)}px`,
+                    lineHeight: 1.1,
+                    color: WORDCLOUD_COLORS[i % WORDCLOUD_COLORS.length],
+                    margin: "0 4px",
+                    whiteSpace: "nowrap",
+                },
+            },
+            name
+        )
+    );
+}
+
+function WordcloudFromData(props) {
+    const [entities, setEntities] = React.useState(null);
+
+    React.useEffect(() => {
+        let active = true;
+        fetchWordcloudData(props.url).then((data) => {
+            if (active) {
+                setEntities(data);
+            }
+        });
+        return () => {
+            active = false;
+        };
+    }, [props.url]);
+
+    if (entities === null) {
+        return null;
+    }
+    return React.createElement(
+        "div",
+        {
+            style: {
+                background: "white",
+                padding: "8px",
+                marginBottom: "8px",
+                width: "400px",
+                display: "flex",
+                flexWrap: "wrap",
+                justifyContent: "center",
+                alignItems: "center",
+            },
+        },
+        React.createElement(WordcloudWords, { entities: entities })
+    );
+}
+
 dagcomponentfuncs.CustomTooltip = function (props) {
     const cellValue = props.value || "";
     const titleValue = props.data?.title || "Untitled";
     const wordcloudUrl = props.data?.wordcloud_url;
+    const wordcloudDataUrl = props.data?.wordcloud_data_url;
 
-    let tooltipContent = "<div style='display:flex;flex-direction:column;align-items:center;'>";
+    let tooltipContent = "";
     if (wordcloudUrl) {
         tooltipContent += `
             <div style="background:white;border:0;padding:8px;margin-bottom:8px;">
@@ -20,10 +99,14 @@ dagcomponentfuncs.CustomTooltip = function (props) {
             <b>${titleValue}</b><br>${cellValue}
         </div>
     `;
-    tooltipContent += "</div>";
 
-    return React.createElement("div", {
-        className: "custom-tooltip",
-        dangerouslySetInnerHTML: { __html: tooltipContent },
-    });
+    return React.createElement(
+        "div",
+        {
+            className: "custom-tooltip",
+            style: { display: "flex", flexDirection: "column", alignItems: "center" },
+        },
+        wordcloudDataUrl ? React.createElement(WordcloudFromData, { url: wordcloudDataUrl }) : null,
+        React.createElement("div", { dangerouslySetInnerHTML: { __html: tooltipContent } })
+    );
 };
@@ -0,0 +1,104 @@
+// Search term highlighting in the transcript.
+//
+// The transcript is rendered once per episode, without highlights. Each segment
+// span holds its text as a single string (data-sid identifies it), and the server
+// sends the hits as [sid, start, end, colorid] character ranges. Highlighting a
+// segment replaces its text with text and highlight spans; clearing it puts the plain
+// text back. As React sets a single string child through textContent, re-rendering
+// the transcript simply overwrites whatever is there.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    highlighting: {
+        // Waits for the transcript that the latest hits belong to:
+        observer: null,
+
+        apply_term_hits: function (term_hits) {
+            if (!term_hits || !term_hits.eid) {
+                return window.dash_clientside.no_update;
+            }
+
+            const highlighting = window.dash_clientside.highlighting;
+            const transcript = document.getElementById("transcript");
+            const selector = `[data-eid="${CSS.escape(term_hits.eid)}"]`;
+
+            // Hits of an earlier request that are still waiting are outdated now:
+            if (highlighting.observer) {
+                highlighting.observer.disconnect();
+                highlighting.observer = null;
+            }
+            if (!transcript) {
+                return window.dash_clientside.no_update;
+            }
+
+            const container = transcript.querySelector(selector);
+            if (container) {
+                highlighting.highlight(container, term_hits.hits);
+                return window.dash_clientside.no_update;
+            }
+
+            // The hits may arrive before the episode's transcript is in the DOM
+            // (loading a long transcript takes a while); highlight it once it is:
+            highlighting.observer = new MutationObserver(() => {
+                const container = transcript.querySelector(selector);
+                if (container) {
+                    highlighting.observer.disconnect();
+                    highlighting.observer = null;
+                    highlighting.highlight(container, term_hits.hits);
+                }
+            });
+            highlighting.observer.observe(transcript, { childList: true, subtree: true });
+
+            return window.dash_clientside.no_update;
+        },
+
+        highlight: function (container, hits) {
+            // Clear the previous highlights:
+            container.querySelectorAll("[data-highlighted]").forEach((seg) => {
+                seg.textContent = seg.textContent;
+                delete seg.dataset.highlighted;
+            });
+
+            // Group the hits by segment:
+            const hitsBySid = new Map();
+            for (const [sid, start, end, colorid] of hits) {
+                if (!hitsBySid.has(sid)) {
+                    hitsBySid.set(sid, []);
+                }
+                hitsBySid.get(sid).push([start, end, colorid]);
+            }
+            if (hitsBySid.size === 0) {
+                return;
+            }
+
+            container.querySelectorAll(".transcript-segment[data-sid]").forEach((seg) => {
+                const segHits = hitsBySid.get(parseInt(seg.dataset.sid));
+                if (!segHits) {
+                    return;
+                }
+
+                // By start, longer hits first; hits overlapping an earlier one are
+                // skipped (e.g. "Alex" within "Alex Jones"):
+                segHits.sort((a, b) => a[0] - b[0] || b[1] - a[1]);
+
+                const text = seg.textContent;
+                const fragment = document.createDocumentFragment();
+                let pos = 0;
+                for (const [start, end, colorid] of segHits) {
+                    if (start < pos) {
+                        continue;
+                    }
+                    fragment.append(text.slice(pos, start));
+                    const span = document.createElement("span");
+                    span.className = `half-circle-highlight term-color-${colorid} highlight-color-${colorid}`;
+                    span.textContent = text.slice(start, end);
+                    fragment.append(span);
+                    pos = end;
+                }
+                fragment.append(text.slice(pos));
+
+                seg.replaceChildren(fragment);
+                seg.dataset.highlighted = "1";
+            });
+        },
+    },
+});
@@ -41,6 +41,32 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
             return window.dash_clientside.no_update;
         },
 
+        // Fetch the ticker of the selected episode. The server answers with the
+        // ticker's ETag, so the browser only downloads it again if it has changed.
+        fetch_ticker: async function (ticker_url) {
+            if (!ticker_url) {
+                return window.dash_clientside.no_update;
+            }
+            // The URL is set again whenever the transcript updates:
+            if (ticker_url === window.dash_clientside.ticker.lastTickerUrl) {
+                return window.dash_clientside.no_update;
+            }
+
+            try {
+                const response = await fetch(ticker_url);
+                if (!response.ok) {
+                    console.error("Ticker request failed:", response.status);
+                    return "";
+                }
+                const ticker_data = await response.json();
+                window.dash_clientside.ticker.lastTickerUrl = ticker_url;
+                return ticker_data;
+            } catch (error) {
+                console.error("Error fetching ticker:", error);
+                return "";
+            }
+        },
+
         // Function to parse duration string to seconds
         parseDurationToSeconds: function (durationString) {
             if (!durationString || durationString === "") {
@@ -201,96 +227,128 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
     },
 
     visible_span: {
+        // The visible time range of the transcript is computed from its scrollTop:
+        // once per render (and resize), a table of each segment's vertical extent
+        // and times is built; on scroll, two binary searches in it give the first and
+        // last visible segment. The store is only updated when the range changes, at
+        // most once per animation frame.
         get_visible_span: function (transcript_children) {
-            try {
-                if (!transcript_children || !window.IntersectionObserver) {
-                    return "No segments visible";
-                }
+            const vs = window.dash_clientside.visible_span;
+            if (!transcript_children) {
+                return window.dash_clientside.no_update;
+            }
+
+            const transcript = document.getElementById('transcript');
+            if (!transcript) {
+                return window.dash_clientside.no_update;
+            }
 
-                // Clean up existing observer
-                if (window.transcriptObserver) {
-                    window.transcriptObserver.disconnect();
-                    window.transcriptObserver = null;
+            // Set up once per transcript element:
+            if (vs.transcript !== transcript) {
+                if (vs.transcript) {
+                    vs.transcript.removeEventListener('scroll', vs.onScroll);
+                    vs.resizeObserver.disconnect();
                 }
+                vs.transcript = transcript;
+                vs.onScroll = () => vs.scheduleUpdate();
+                transcript.addEventListener('scroll', vs.onScroll, { passive: true });
+                vs.resizeObserver = new ResizeObserver(() => vs.buildTable(0));
+                vs.resizeObserver.observe(transcript);
+            }
+
+            // The new transcript may not be in the DOM yet:
+            vs.buildTable(0);
+
+            return window.dash_clientside.no_update;
+        },
 
-                const transcript = document.getElementById('transcript');
-                if (!transcript) {
-                    return "Transcript element not found";
+        buildTable: function (attempt) {
+            const vs = window.dash_clientside.visible_span;
+            const transcript = vs.transcript;
+            const segments = transcript.querySelectorAll('.transcript-segment[data-start]');
+            if (segments.length === 0) {
+                if (attempt < 50) {
+                    requestAnimationFrame(() => vs.buildTable(attempt + 1));
                 }
+                return;
+            }
 
-                // Set up observer after a delay
-                setTimeout(() => {
-                    const segments = transcript.querySelectorAll('span[data-start]');
-                    console.log(`Setting up observer for ${segments.length} segments`);
+            // Only reads layout, so the whole table costs a single layout pass:
+            const origin = transcript.getBoundingClientRect().top - transcript.scrollTop;
+            const n = segments.length;
+            const table = {
+                tops: new Float64Array(n),
+                bottoms: new Float64Array(n),
+                starts: new Float64Array(n),
+                ends: new Float64Array(n),
+            };
+            segments.forEach((seg, i) => {
+                const rect = seg.getBoundingClientRect();
+                table.tops[i] = rect.top - origin;
+                table.bottoms[i] = rect.bottom - origin;
+                table.starts[i] = parseFloat(seg.dataset.start);
+                table.ends[i] = parseFloat(seg.dataset.end);
+            });
+            vs.table = table;
+            vs.lastRange = null;
+            vs.scheduleUpdate();
+        },
 
-                    if (segments.length === 0) {
-                        return;
-                    }
+        scheduleUpdate: function () {
+            const vs = window.dash_clientside.visible_span;
+            if (vs.frameRequested) {
+                return;
+            }
+            vs.frameRequested = true;
+            requestAnimationFrame(() => {
+                vs.frameRequested = false;
+                vs.updateRange();
+            });
+        },
 
-                    let visibleSegments = new Set();
-
-                    window.transcriptObserver = new IntersectionObserver((entries) => {
-                        try {
-                            entries.forEach(entry => {
-                                const segmentStart = entry.target.dataset.start;
-                                const segmentEnd = entry.target.dataset.end;
-
-                                if (segmentStart && segmentEnd) {
-                                    const segmentId = `${segmentStart}-${segmentEnd}`;
-
-                                    if (entry.isIntersecting) {
-                                        visibleSegments.add(segmentId);
-                                    } else {
-                                        visibleSegments.delete(segmentId);
-                                    }
-                                }
-                            });
-
-                            // Update display
-                            const segments = Array.from(visibleSegments).sort((a, b) => {
-                                return parseFloat(a.split('-')[0]) - parseFloat(b.split('-')[0]);
-                            });
-
-                            if (segments.length > 0) {
-                                const firstTime = parseFloat(segments[0].split('-')[0]);
-                                const lastTime = parseFloat(segments[segments.length - 1].split('-')[1]);
-
-                                if (window.dash_clientside && window.dash_clientside.set_props) {
-                                    window.dash_clientside.set_props('visible-segments', {
-                                        data: [firstTime, lastTime]
-                                    });
-                                }
-
-                                console.log(`Visible range: ${firstTime} - ${lastTime}`);
-
-                            } else {
-                                if (window.dash_clientside && window.dash_clientside.set_props) {
-                                    window.dash_clientside.set_props('visible-segments', {
-                                        data: [null, null]
-                                    });
-                                }
-                            }
-                        } catch (e) {
-                            console.error("Error in intersection observer:", e);
-                        }
-                    }, {
-                        root: transcript,
-                        rootMargin: '-10px',
-                        threshold: 0.1
-                    });
+        updateRange: function () {
+            const vs = window.dash_clientside.visible_span;
+            const table = vs.table;
+            if (!table || !vs.transcript) {
+                return;
+            }
 
-                    segments.forEach(segment => {
-                        window.transcriptObserver.observe(segment);
-                    });
+            const margin = 10;
+            const viewTop = vs.transcript.scrollTop + margin;
+            const viewBottom = vs.transcript.scrollTop + vs.transcript.clientHeight - margin;
+
+            // First segment reaching below the top, last one starting above the bottom:
+            const first = vs.firstGreater(table.bottoms, viewTop);
+            const last = vs.firstGreater(table.tops, viewBottom) - 1;
 
-                }, 500);
+            let range = [null, null];
+            if (first < table.starts.length && last >= first) {
+                range = [table.starts[first], table.ends[last]];
+            }
 
-                return [null, null];
+            if (vs.lastRange && vs.lastRange[0] === range[0] && vs.lastRange[1] === range[1]) {
+                return;
+            }
+            vs.lastRange = range;
 
-            } catch (error) {
-                console.error("Error in visible segments callback:", error);
-                return [null, null];
+            if (window.dash_clientside.set_props) {
+                window.dash_clientside.set_props('visible-segments', { data: range });
+            }
+        },
+
+        // Index of the first value in the sorted array that is greater than x:
+        firstGreater: function (sorted, x) {
+            let lo = 0;
+            let hi = sorted.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >>> 1;
+                if (sorted[mid] <= x) {
+                    lo = mid + 1;
+                } else {
+                    hi = mid;
+                }
             }
+            return lo;
         },
 
         scroll_rect: function(visible_segments, episode_duration) {
@@ -1,5 +1,8 @@
 import os
 import json
+import sqlite3
+from contextlib import closing
+from functools import lru_cache
 from typing import List
 from pathlib import Path
 from urllib.parse import urljoin
@@ -18,8 +21,13 @@ from podology.data.EpisodeStore import EpisodeStore
 from podology.data.Transcript import Transcript
 from podology.search.search_classes import ResultSet, create_cards
 from podology.search.elasticsearch import get_es_client, TRANSCRIPT_INDEX_NAME
+from podology.stats.db import backlog_projection, job_statuses, wordcloud_files
 from podology.stats.preparation import post_process_pipeline
-from podology.stats.plotting import plot_transcript_hits_es, plot_word_freq
+from podology.stats.plotting import (
+    plot_audio_envelope,
+    plot_transcript_hits_es,
+    plot_word_freq,
+)
 from podology.frontend.utils import (
     clickable_tag,
     colorway,
@@ -28,9 +36,19 @@ from podology.frontend.utils import (
     empty_scroll_fig,
     empty_term_hit_fig,
     format_duration,
+    format_eta,
+    format_job_statuses,
+)
+from config import (
+    get_connector,
+    AUDIO_RENDITIONS,
+    DB_PATH,
+    READONLY,
+    BASE_PATH,
+    TICKER_WINDOW_WIDTH,
+    TRANSCRIPT_DIR,
+    WORDCLOUD_MODE,
 )
-from podology.frontend.renderers.wordticker import get_ticker_dict
-from config import get_connector, ASSETS_DIR, READONLY, BASE_PATH
 
 
 max_intervals = 1 if READONLY else None
@@ -51,7 +69,31 @@ def with_prefix(path: str) -> str:
     return urljoin(BASE_PATH, path.lstrip("/"))
 
 
+def get_transcript(eid: str) -> Transcript:
+    """Transcript of an episode, kept for the callbacks that need it in turn.
+
+    Kept until its file changes, e.g. when the episode is transcribed again or the
+    file is converted to the compact layout.
+    """
+    path = TRANSCRIPT_DIR / f"{eid}.json"
+    mtime = path.stat().st_mtime_ns if path.exists() else None
+    return _get_transcript(eid, mtime)
+
+
+@lru_cache(maxsize=8)
+def _get_transcript(eid: str, mtime: int | None) -> Transcript:
+    return Transcript(episode=episode_store[eid])
+
+
 def get_row_data(episode_store: EpisodeStore) -> List[dict]:
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        wordclouds = wordcloud_files(conn) if WORDCLOUD_MODE == "image" else {}
+        # Per-queue status of the episode's jobs, shown as the status' tooltip:
+        jobs = {
+            ep.eid: format_job_statuses(job_statuses(conn, ep.eid))
+            for ep in episode_store
+        }
+
     rowdata = []
     for ep in episode_store:
         row = {
@@ -69,13 +111,15 @@ def get_row_data(episode_store: EpisodeStore) -> List[dict]:
                 )
                 else Status.NOT_DONE.value
             ),
+            "jobs": jobs[ep.eid],
         }
-        wc_path = ASSETS_DIR / "wordclouds" / f"{ep.eid}.png"
-        if wc_path.exists():
-            wc_url = with_prefix(f"assets/wordclouds/{ep.eid}.png")
+        if ep.eid in wordclouds:
+            wc_url = with_prefix(f"wordclouds/{wordclouds[ep.eid]}")
         else:
             wc_url = ""
         row["wordcloud_url"] = wc_url
+        if WORDCLOUD_MODE == "json" and ep.transcript.wcstatus is Status.DONE:
+            row["wordcloud_data_url"] = with_prefix(f"wordcloud-data/{ep.eid}")
         rowdata.append(row)
     return rowdata
 
@@ -156,6 +200,7 @@ def init_dashboard(flask_app, route):
         {
             "headerName": "Status",
             "field": "status",
+            "tooltipField": "jobs",
             "maxWidth": 120,
             # "cellStyle": conditional_style,
             "filter": False,
@@ -319,6 +364,11 @@ def init_dashboard(flask_app, route):
                                     dmc.GridCol(
                                         [
                                             dmc.Title("Episodes", order=2),
+                                            dmc.Text(
+                                                id="backlog-projection",
+                                                size="sm",
+                                                c="dimmed",
+                                            ),
                                             dag.AgGrid(
                                                 id="transcribe-episode-list",
                                                 columnDefs=column_defs,
@@ -374,6 +424,14 @@ def init_dashboard(flask_app, route):
                                                     "staticPlot": True,
                                                 },
                                             ),
+                                            dcc.Store(
+                                                id="term-hits",
+                                                data={},
+                                            ),
+                                            dcc.Store(
+                                                id="ticker-url",
+                                                data="",
+                                            ),
                                             dcc.Store(
                                                 id="ticker-dict",
                                                 data="",
@@ -614,6 +672,20 @@ def init_callbacks(app):
         Input("pageload-trigger", "n_intervals"),
     )
 
+    # Highlight search terms in the transcript:
+    app.clientside_callback(
+        ClientsideFunction(namespace="highlighting", function_name="apply_term_hits"),
+        Output("term-hits", "id"),  # Dummy output
+        Input("term-hits", "data"),
+    )
+
+    # Load the ticker of the selected episode:
+    app.clientside_callback(
+        ClientsideFunction(namespace="ticker", function_name="fetch_ticker"),
+        Output("ticker-dict", "data"),
+        Input("ticker-url", "data"),
+    )
+
     # Add the ticker animation callback
     app.clientside_callback(
         ClientsideFunction(
@@ -733,17 +805,56 @@ def init_callbacks(app):
 
         elif ctx.triggered_id == "job-status-update":
             update_rows = []
-            for ep in episode_store:
-
-                # Find the corresponding row in the frontend data
-                row = next((r for r in row_data if r["eid"] == ep.eid), None)
-                if row and row["status"] != ep.transcript.status.value:
-                    row["status"] = ep.transcript.status.value
-                    update_rows.append(row)
+            with closing(sqlite3.connect(DB_PATH)) as conn:
+                for ep in episode_store:
+
+                    # Find the corresponding row in the frontend data
+                    row = next((r for r in row_data if r["eid"] == ep.eid), None)
+                    if not row:
+                        continue
+                    changed = row["status"] != ep.transcript.status.value
+                    # Other episodes' jobs only change once they are enqueued:
+                    pending = ep.transcript.status in (Status.QUEUED, Status.PROCESSING)
+                    if changed or pending:
+                        jobs = format_job_statuses(job_statuses(conn, ep.eid))
+                        changed = changed or row.get("jobs") != jobs
+                        row["jobs"] = jobs
+                    if changed:
+                        row["status"] = ep.transcript.status.value
+                        update_rows.append(row)
             if update_rows:
                 return {"update": update_rows}
             return no_update
 
+    @app.callback(
+        Output("backlog-projection", "children"),
+        Input("pageload-trigger", "n_intervals"),
+        Input("job-status-update", "n_intervals"),
+    )
+    def update_backlog_projection(pageload_trigger, n_update):
+        """
+        Hours of audio left to transcribe, and when they are projected to be through
+        at the rate of the last week's transcriptions. Refreshed every 30 seconds.
+        """
+        if ctx.triggered_id == "job-status-update" and (n_update or 0) % 30:
+            return no_update
+
+        # A connection of its own, as callbacks run on any of the server's threads:
+        with closing(sqlite3.connect(DB_PATH)) as conn:
+            projection = backlog_projection(conn)
+        parts = []
+        for label, hours, eta in [
+            ("queued", projection["queued_h"], projection["queued_eta_s"]),
+            ("untranscribed", projection["remaining_h"], projection["remaining_eta_s"]),
+        ]:
+            if hours:
+                part = f"{hours:.1f} h of audio {label}"
+                if eta is not None:
+                    part += f" (≈ {format_eta(eta)})"
+                parts.append(part)
+
+        return " · ".join(parts)
+
     @app.callback(
         Output("tab-container", "value"),
         Input("transcribe-episode-list", "cellClicked"),
@@ -971,58 +1082,69 @@ def init_callbacks(app):
         Output("transcript-episode-title", "children"),
         Output("transcript-episode-date", "children"),
         Output("episode-duration", "data"),
-        Output("ticker-dict", "data"),
+        Output("ticker-url", "data"),
         Output("audio-player", "src"),
         Output("scroll-position-store", "data"),
         Input("selected-episode", "data"),
-        State("selected-episode", "data"),
-        Input("terms-store", "data"),
-        State("terms-store", "data"),
         prevent_initial_call=True,
     )
-    def update_transcript(
-        selected_eid_input,
-        selected_eid_state,
-        terms_store_input,
-        terms_store_state,
-    ):
+    def update_transcript(eid):
         """
-        Callback that updates the displayed transcript and its highlights.
+        Callback that updates the displayed transcript. Search terms are highlighted
+        separately, see update_term_hits().
         """
-
-        # Unify input for both cases of each Input being the trigger:
-        eid = selected_eid_input or selected_eid_state
-        terms_store = terms_store_input or terms_store_state
-
         if not eid:
             return no_update
 
         episode = episode_store[eid]
-        entries = [entry for entry in terms_store["entries"] if entry[2] == "term"]
 
-        # Get the transcript of the selected episode as HTML:
-        diarized_script = Transcript(episode=episode)
-        diarized_script_element = diarized_script.to_html(entries)
+        # Get the transcript of the selected episode as HTML, without highlights:
+        diarized_script_element = html.Div(
+            get_transcript(eid).to_html(),
+            **{"data-eid": eid},
+        )
 
-        # Set the scroll animation word dict to the episode's words:
-        ticker_dict = get_ticker_dict(
+        # The scroll animation loads the episode's precomputed ticker from here:
+        ticker_url = url_for(
+            "media.serve_ticker",
             eid=episode.eid,
-            window_width=120,
+            window_width=TICKER_WINDOW_WIDTH,
         )
 
         # Get prefix-aware audio URL:
-        audio_url = url_for("serve_audio", eid=episode.eid)
+        if AUDIO_RENDITIONS:
+            audio_url = url_for("media.serve_audio", eid=episode.eid, q="low")
+        else:
+            audio_url = url_for("media.serve_audio", eid=episode.eid)
 
         return (
             diarized_script_element,
             episode.title,
             episode.pub_date,
             format_duration(episode.duration),
-            ticker_dict,
+            ticker_url,
             audio_url,
             0,
         )
 
+    @app.callback(
+        Output("term-hits", "data"),
+        Input("selected-episode", "data"),
+        Input("terms-store", "data"),
+        prevent_initial_call=True,
+    )
+    def update_term_hits(eid, terms_store):
+        """
+        Locate the search terms in the selected episode's transcript, for the client
+        to highlight. Costs a few numbers per hit instead of a re-rendered transcript.
+        """
+        if not eid:
+            return no_update
+
+        entries = [entry for entry in terms_store["entries"] if entry[2] == "term"]
+
+        return {"eid": eid, "hits": get_transcript(eid).term_hits(entries)}
+
     # Update search terms in the comparison list:
     @app.callback(
         Output("terms-store", "data"),
@@ -1121,8 +1243,10 @@ def init_callbacks(app):
         Update the transcript hits plot when adding/removing search terms or
         changing the selected episode.
         """
-        if not terms_store or terms_store["entries"] == [] or not eid:
+        if not eid:
             return empty_term_hit_fig
+        if not terms_store or terms_store["entries"] == []:
+            return plot_audio_envelope(eid)
 
         episode = episode_store[eid]
         logger.info(terms_store["entries"])
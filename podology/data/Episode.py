@@ -25,6 +25,8 @@ class TranscriptInfo:
 @dataclass
 class AudioInfo:
     status: Status
+    size: Optional[int] = None
+    sha256: Optional[str] = None
 
 
 @dataclass
@@ -1,26 +1,50 @@
 import os
-from typing import Iterator
+from typing import Iterator, Optional
 import sqlite3
 
 from loguru import logger
 import requests
 from rq import Queue
+from rq.job import Dependency, Job
 from redis import Redis
 
+from podology.data.audio import rendition_worker
+from podology.data.download import DownloadError, download
 from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
 from config import (
+    AUDIO_RENDITIONS,
     DB_PATH,
     DUMMY_AUDIO,
     AUDIO_DIR,
     TRANSCRIPT_DIR,
     WORDCLOUD_DIR,
+    WORDCLOUD_MODE,
     CHUNKS_DIR,
 )
-from podology.data.transcribers.transcription_worker import transcription_worker
+from podology.data.transcribers.transcription_worker import (
+    STAGE_DOWNLOAD,
+    STAGE_POSTPROCESS,
+    STAGE_TRANSCRIBE,
+    download_worker,
+    postprocess_worker,
+    transcribe_batch_worker,
+    transcribe_worker,
+)
+from podology.stats.db import (
+    STAGE_NAMED_ENTITY_TYPES,
+    connection,
+    done_eids,
+    job_enqueued,
+    migrate,
+    wordcloud_files,
+)
 
 
 redis_conn = Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT") or 6379))
-transcription_q = Queue(connection=redis_conn, name="transcription")
+# One queue per stage, see podology.data.transcribers.transcription_worker:
+download_q = Queue(connection=redis_conn, name="download")
+transcribe_q = Queue(connection=redis_conn, name="transcribe")
+postprocess_q = Queue(connection=redis_conn, name="postprocess")
 
 
 class EpisodeStore:
@@ -37,6 +61,7 @@ class EpisodeStore:
         self.chunks_dir = CHUNKS_DIR
         self.dummy_audio = DUMMY_AUDIO
         self._ensure_table()
+        migrate(self.db_path)
 
     def _connect(self):
         return sqlite3.connect(self.db_path)
@@ -55,10 +80,20 @@ class EpisodeStore:
                     transcript_status TEXT,
                     transcript_wcstatus TEXT,
                     audio_status TEXT,
-                    chunk_status TEXT
+                    chunk_status TEXT,
+                    audio_size INTEGER,
+                    audio_sha256 TEXT
                 )
             """
             )
+            # Columns added since the table was first created:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(episodes)")}
+            for column, sql_type in [
+                ("audio_size", "INTEGER"),
+                ("audio_sha256", "TEXT"),
+            ]:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE episodes ADD COLUMN {column} {sql_type}")
             conn.commit()
 
     def add_or_update(self, episode: Episode):
@@ -68,8 +103,8 @@ class EpisodeStore:
                 INSERT OR REPLACE INTO episodes (
                     eid, url, title, pub_date, description, duration,
                     transcript_status, transcript_wcstatus, audio_status,
-                    chunk_status
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    chunk_status, audio_size, audio_sha256
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     episode.eid,
@@ -82,6 +117,8 @@ class EpisodeStore:
                     episode.transcript.wcstatus.name if episode.transcript else None,
                     episode.audio.status.name if episode.audio else None,
                     episode.transcript.chunkstatus.name if episode.transcript else None,
+                    episode.audio.size if episode.audio else None,
+                    episode.audio.sha256 if episode.audio else None,
                 ),
             )
             conn.commit()
@@ -99,6 +136,8 @@ class EpisodeStore:
             transcript_wcstatus,
             audio_status,
             chunkstatus,
+            audio_size,
+            audio_sha256,
         ) = row
 
         transcript = TranscriptInfo(
@@ -113,6 +152,8 @@ class EpisodeStore:
 
         audio = AudioInfo(
             status=Status[audio_status] if audio_status else Status.UNKNOWN,
+            size=audio_size,
+            sha256=audio_sha256,
         )
 
         return Episode(
@@ -140,6 +181,10 @@ class EpisodeStore:
                 # Optionally: create new episode entry if not in DB
                 pass
 
+        with self._connect() as conn:
+            wordclouds = wordcloud_files(conn)
+            typed_eids = done_eids(conn, STAGE_NAMED_ENTITY_TYPES)
+
         # Scan transcript files
         for transcript_file in self.transcript_dir.glob("*.json"):
             eid = transcript_file.stem
@@ -154,19 +199,21 @@ class EpisodeStore:
                 if self.transcript_dir.joinpath(f"{eid}.json").exists()
                 else Status.NOT_DONE
             )
-            wordcloud_exists = (
-                Status.DONE
-                if self.wordcloud_dir.joinpath(f"{eid}.png").exists()
-                else Status.NOT_DONE
-            )
+            if WORDCLOUD_MODE == "json":
+                # The app serves the entity counts, and the browser renders them:
+                has_wordcloud = eid in typed_eids
+            else:
+                has_wordcloud = (
+                    eid in wordclouds
+                    and self.wordcloud_dir.joinpath(wordclouds[eid]).exists()
+                )
+            wordcloud_exists = Status.DONE if has_wordcloud else Status.NOT_DONE
             chunks_exist = (
                 Status.DONE
                 if self.chunks_dir.joinpath(f"{eid}_chunks.json").exists()
                 else Status.NOT_DONE
             )
 
-            audio_info = AudioInfo(status=audio_exists)
-
             transcript_info = TranscriptInfo(
                 status=transcript_exists,
                 wcstatus=wordcloud_exists,
@@ -175,18 +222,25 @@ class EpisodeStore:
 
             try:
                 episode = self[eid]
-                episode.audio = audio_info
+                episode.audio.status = audio_exists
                 episode.transcript = transcript_info
                 self.add_or_update(episode)
             except KeyError:
                 # Optionally: create new episode entry if not in DB
                 pass
 
-    def ensure_audio(self, episode: Episode):
+    def ensure_audio(self, episode: Episode, session=None, throttle=None):
         """
         Download the audio file from the episode's URL, save it to disk,
         update the episode's audio path and status, and persist to DB.
         Update status in the database before and after download.
+
+        Downloads are streamed to a .part file and resumed from there if interrupted;
+        the audio file only exists once it is complete. Its size and SHA-256 are
+        recorded in the episode table.
+
+        :param session: requests.Session to download with (see podology.data.prefetch).
+        :param throttle: Bandwidth limit, see podology.data.download.download.
         """
         audio_path = self.audio_dir / f"{episode.eid}.mp3"
         if audio_path.exists():
@@ -204,11 +258,14 @@ class EpisodeStore:
                 self.add_or_update(episode)
                 logger.info(f"{episode.eid}: Downloading audio from {episode.url}")
                 try:
-                    response = requests.get(episode.url, timeout=30)
-                    with open(audio_path, "wb") as file:
-                        file.write(response.content)
+                    result = download(
+                        episode.url, audio_path, session=session, throttle=throttle
+                    )
+                    episode.audio.size = result.size
+                    episode.audio.sha256 = result.sha256
                     episode.audio.status = Status.DONE
-                except requests.RequestException as e:
+                except (requests.RequestException, DownloadError) as e:
+                    logger.error(f"{episode.eid}: Audio download failed: {e}")
                     episode.audio.status = Status.ERROR
 
         # Persist changes to the database
@@ -216,19 +273,122 @@ class EpisodeStore:
 
     def enqueue_transcription_job(self, episode: Episode) -> str:
         """
-        Enqueue a transcription job for the episode and update DB with queue job ID.
+        Enqueue the jobs that download, transcribe and post-process the episode, each
+        on its own queue and depending on the one before, and update the DB.
+
+        :return: The ID of the transcription job.
         """
-        job = transcription_q.enqueue(
-            transcription_worker,
-            episode.eid,
+        eid = episode.eid
+        conn = connection()
+
+        download_job = self._enqueue_download(episode)
+
+        transcribe_job = transcribe_q.enqueue(
+            transcribe_worker,
+            eid,
+            depends_on=download_job,
             job_timeout=28800,
-            job_id=episode.eid,
-            result_ttl=1,  # we just care about side effects, not the result
+            job_id=eid,
+            result_ttl=3600,
         )
+        with conn:
+            job_enqueued(conn, eid, STAGE_TRANSCRIBE)
+        self.enqueue_postprocessing(eid, depends_on=transcribe_job)
+
         episode.transcript.status = Status.QUEUED
         self.add_or_update(episode)
 
-        return job.id
+        return transcribe_job.id
+
+    def enqueue_transcription_batch(self, episodes: list[Episode]) -> str:
+        """
+        Enqueue the episodes' downloads, and one job that transcribes them all at once
+        once the downloads are through (see podology.data.batching). The batch job
+        enqueues the post-processing of each episode it transcribed.
+
+        :return: The ID of the batch transcription job.
+        """
+        eids = [episode.eid for episode in episodes]
+        conn = connection()
+
+        download_jobs = [
+            job for job in map(self._enqueue_download, episodes) if job is not None
+        ]
+        # An episode whose download failed is skipped by the batch job, rather than
+        # holding up the others:
+        depends_on = (
+            Dependency(jobs=download_jobs, allow_failure=True)
+            if download_jobs
+            else None
+        )
+
+        batch_job = transcribe_q.enqueue(
+            transcribe_batch_worker,
+            eids,
+            depends_on=depends_on,
+            job_timeout=28800 * len(eids),
+            job_id=f"{eids[0]}-batch{len(eids)}",
+            result_ttl=1,
+        )
+        with conn:
+            for eid in eids:
+                job_enqueued(conn, eid, STAGE_TRANSCRIBE)
+
+        for episode in episodes:
+            episode.transcript.status = Status.QUEUED
+            self.add_or_update(episode)
+
+        return batch_job.id
+
+    def enqueue_postprocessing(self, eid: str, depends_on: Optional[Job] = None) -> Job:
+        """Enqueue the post-processing of the episode's transcript."""
+        job = postprocess_q.enqueue(
+            postprocess_worker,
+            eid,
+            depends_on=depends_on,
+            job_timeout=28800,
+            job_id=f"{eid}-postprocess",
+            result_ttl=1,  # we just care about side effects, not the result
+        )
+        conn = connection()
+        with conn:
+            job_enqueued(conn, eid, STAGE_POSTPROCESS)
+
+        return job
+
+    def _enqueue_download(self, episode: Episode) -> Optional[Job]:
+        """Enqueue the download of the episode's audio if needed, and its renditions.
+
+        :return: The download job, or None if the audio is there already.
+        """
+        eid = episode.eid
+
+        # Jobs that others depend on keep their result for a while, so that RQ can
+        # still check their status when enqueuing the dependents:
+        download_job = None
+        if not episode.audio.status:
+            download_job = download_q.enqueue(
+                download_worker,
+                eid,
+                job_timeout=3600,
+                job_id=f"{eid}-download",
+                result_ttl=3600,
+            )
+            conn = connection()
+            with conn:
+                job_enqueued(conn, eid, STAGE_DOWNLOAD)
+
+        if AUDIO_RENDITIONS and not self.dummy_audio:
+            postprocess_q.enqueue(
+                rendition_worker,
+                eid,
+                depends_on=download_job,
+                job_timeout=3600,
+                job_id=f"{eid}-renditions",
+                result_ttl=1,
+            )
+
+        return download_job
 
     def __getitem__(self, eid: str) -> Episode:
         with self._connect() as conn:
@@ -12,6 +12,7 @@ import pandas as pd
 from numpy import mean
 
 from podology.data.Episode import Episode
+from podology.data.transcript_io import read_transcript
 from podology.search.utils import format_time
 from config import TRANSCRIPT_DIR, EMBEDDER_ARGS, CHUNKS_DIR
 
@@ -34,7 +35,7 @@ class Transcript:
                     f"Transcript not available for episode {self.episode.eid}."
                 )
 
-            self.raw_segs = json.load(open(path, "r"))
+            self.raw_segs = read_transcript(path)
             self._set_transcript_data()
 
     def _set_transcript_data(self):
@@ -416,11 +417,46 @@ class Transcript:
 
         return df
 
+    def term_hits(self, termtuples: List[tuple]) -> List[list]:
+        """Locate search terms in the text of each segment.
+
+        This is what the client needs to highlight terms in a transcript rendered
+        by `to_html()` without terms: a few numbers per hit instead of a re-rendered
+        transcript. Offsets count UTF-16 code units, like JavaScript strings do.
+
+        :param termtuples: Search terms as (term, colorid, type) tuples.
+        :return: A list of [sid, start, end, colorid], one per hit, where start and
+            end delimit the hit in the segment's text.
+        """
+        if not termtuples:
+            return []
+
+        re_pattern_colorid = [
+            (re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE), colorid)
+            for term, colorid, _ in termtuples
+        ]
+
+        hits = []
+        for sid, text in self.segments(diarize=False)["text"].items():
+            for pattern, colorid in re_pattern_colorid:
+                for match in pattern.finditer(text):
+                    start, end = match.span()
+                    if not text.isascii():
+                        start = _utf16_len(text[:start])
+                        end = start + _utf16_len(match.group())
+                    hits.append([int(sid), start, end, colorid])
+
+        return hits
+
     def to_html(
         self,
         termtuples: List[tuple] | NoneType = None,
     ) -> list:
-        """HTML representation of the transcript, semantically structured."""
+        """HTML representation of the transcript, semantically structured.
+
+        Search terms in `termtuples` are highlighted in the markup. The dashboard
+        renders without them and highlights on the client instead (see `term_hits`).
+        """
 
         def speaker_class(speaker):
             return f"speaker-{speaker[-2:]}"
@@ -467,13 +503,19 @@ class Transcript:
 
                 return span_content
 
-            text = _highlight_text(seg["text"], re_pattern_colorid)
-            cids = seg["cid"].split(",")
+            if re_pattern_colorid:
+                text = _highlight_text(seg["text"], re_pattern_colorid)
+                children = _highlight_to_html_elements(text)
+            else:
+                # A plain string, so that the client can highlight search terms in
+                # it (see `term_hits`) without fighting React over text nodes:
+                children = seg["text"] + " "
 
             return html.Span(
-                _highlight_to_html_elements(text),
+                children,
                 className="transcript-segment",
                 **{
+                    "data-sid": int(seg["sid"]),
                     "data-start": seg["start"],
                     "data-end": seg["end"],
                     "data-speaker": seg["speaker"],
@@ -514,7 +556,9 @@ class Transcript:
         # Group by speaker turns, but render each segment as a span
         diarized_turns = self.segments(diarize=True).to_dict(orient="records")
         # Map each diarized turn to its original segments
-        all_segments = self.segments(diarize=False).to_dict(orient="records")
+        all_segments = (
+            self.segments(diarize=False).reset_index().to_dict(orient="records")
+        )
         for turn in diarized_turns:
             # Find all segments in this turn
             segs_in_turn = [
@@ -550,6 +594,11 @@ def _most_frequent(lst: pd.Series) -> str | None:
     return next(item for item in lst if counter[item] == max_count)
 
 
+def _utf16_len(s: str) -> int:
+    """Length of s in UTF-16 code units, as JavaScript counts."""
+    return len(s.encode("utf-16-le")) // 2
+
+
 def _in_csv(x: int, s: str) -> bool:
     """Check if integer x is in the comma-separated string s."""
     try:
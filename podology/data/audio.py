@@ -0,0 +1,223 @@
+"""
+Streaming renditions of episode audio.
+
+Listening along in the dashboard only needs speech quality, so instead of the
+original podcast MP3, the audio player can load a mono, low-bitrate AAC rendition
+("low"), which is a fraction of the size and starts playing sooner. The same audio is
+also cut into an HLS playlist of short segments ("hls") for players that support it.
+
+Renditions are made with ffmpeg, by an RQ job on the postprocess queue, which depends
+on the episode's download job (see AUDIO_RENDITIONS in config.py).
+
+The module also computes the loudness envelope that the dashboard draws behind the
+search hits column; the stats pipeline stores it (see store_audio_envelopes()).
+"""
+
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import tempfile
+from typing import Iterable
+
+from loguru import logger
+import numpy as np
+
+from config import (
+    AUDIO_DIR,
+    HLS_SEGMENT_SECONDS,
+    RENDITION_BITRATE,
+    RENDITION_SAMPLE_RATE,
+    RENDITIONS_DIR,
+)
+
+# Name of each rendition, with its file name (relative to the episode's
+# rendition directory) and mimetype:
+RENDITIONS = {
+    "low": ("low.m4a", "audio/mp4"),
+    "hls": ("index.m3u8", "application/vnd.apple.mpegurl"),
+}
+
+
+def rendition_dir(eid: str) -> Path:
+    return RENDITIONS_DIR / eid
+
+
+def rendition_path(eid: str, quality: str) -> Path:
+    """Path of the rendition's file (for HLS, the playlist), whether it exists or not.
+
+    :param eid: The episode ID.
+    :param quality: One of the keys of RENDITIONS.
+    """
+    filename, _ = RENDITIONS[quality]
+    return rendition_dir(eid) / filename
+
+
+def _ffmpeg(*args: str):
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args],
+        check=True,
+        capture_output=True,
+    )
+
+
+def make_low_rendition(source: Path, target: Path):
+    """Encode source as mono AAC at RENDITION_BITRATE.
+
+    The moov atom goes to the front of the file (faststart), so that playback can
+    begin before the file is downloaded.
+    """
+    tmp = target.with_name(f".{target.name}.tmp.m4a")
+    _ffmpeg(
+        "-i", str(source),
+        "-vn",
+        "-ac", "1",
+        "-ar", str(RENDITION_SAMPLE_RATE),
+        "-c:a", "aac",
+        "-b:a", RENDITION_BITRATE,
+        "-movflags", "+faststart",
+        str(tmp),
+    )  # fmt: skip
+    os.replace(tmp, target)
+
+
+def make_hls_rendition(source: Path, playlist: Path):
+    """Cut the (already encoded) source into HLS segments without re-encoding.
+
+    The playlist is written last, so that it only exists once all of its segments
+    do.
+    """
+    tmp = playlist.with_name(f".{playlist.name}.tmp")
+    _ffmpeg(
+        "-i", str(source),
+        "-c", "copy",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", str(playlist.parent / "seg%05d.ts"),
+        str(tmp),
+    )  # fmt: skip
+    os.replace(tmp, playlist)
+
+
+def rendition_worker(eid: str) -> bool:
+    """RQ job: make the episode's missing renditions.
+
+    :param eid: The episode ID.
+    :return: True if all renditions exist afterwards.
+    """
+    source = AUDIO_DIR / f"{eid}.mp3"
+    if not source.exists():
+        logger.error(f"{eid}: No audio to make renditions from")
+        return False
+
+    if shutil.which("ffmpeg") is None:
+        logger.error(f"{eid}: ffmpeg not found, can't make audio renditions")
+        return False
+
+    rendition_dir(eid).mkdir(parents=True, exist_ok=True)
+    low = rendition_path(eid, "low")
+    hls = rendition_path(eid, "hls")
+
+    try:
+        if not low.exists():
+            logger.debug(f"{eid}: Encoding low-bitrate rendition")
+            make_low_rendition(source, low)
+        if not hls.exists():
+            logger.debug(f"{eid}: Segmenting HLS rendition")
+            make_hls_rendition(low, hls)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"{eid}: ffmpeg failed: {e.stderr.decode(errors='replace')}")
+        return False
+
+    logger.info(f"{eid}: Audio renditions done")
+    return True
+
+
+# The envelope is computed from audio decoded to 16-bit mono at this rate, which is
+# plenty for loudness. Peak and sum of squares are kept per frame of 0.1 s, and only
+# binned once decoding is done and the duration is known:
+ENVELOPE_SAMPLE_RATE = 8000
+_FRAME_SAMPLES = 800
+# Decoded audio is read in blocks of this many frames (a minute, about 1 MB):
+_BLOCK_FRAMES = 600
+
+
+def audio_envelope(
+    path: Path, levels: Iterable[int]
+) -> tuple[float, dict[int, tuple[np.ndarray, np.ndarray]]]:
+    """Decode an audio file and compute its peak and RMS envelope.
+
+    ffmpeg's output is streamed in fixed-size blocks, so that decoding takes the
+    same memory however long the episode is; only the per-frame levels (a few
+    hundred KB for a long episode) are kept.
+
+    :param path: The audio file.
+    :param levels: Resolutions of the envelope, in number of bins over the episode.
+    :return: Duration of the audio in seconds, and peak and RMS level per bin (from 0
+      to 1) by number of bins.
+    :raises subprocess.CalledProcessError: If ffmpeg fails to decode the file.
+    """
+    block_bytes = _FRAME_SAMPLES * _BLOCK_FRAMES * 2
+    peaks, squares = [], []
+    n_samples = 0
+    # stderr goes to a file rather than a pipe, which ffmpeg could fill and then
+    # block on while we wait for stdout:
+    with tempfile.TemporaryFile() as stderr, subprocess.Popen(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", str(path),
+            "-vn", "-ac", "1", "-ar", str(ENVELOPE_SAMPLE_RATE),
+            "-f", "s16le", "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=stderr,
+    ) as process:  # fmt: skip
+        while block := process.stdout.read(block_bytes):
+            samples = np.frombuffer(block[: len(block) // 2 * 2], dtype="<i2")
+            n_samples += len(samples)
+
+            # Pad the last frame with silence:
+            samples = np.pad(samples, (0, -len(samples) % _FRAME_SAMPLES))
+            frames = samples.astype(np.float32).reshape(-1, _FRAME_SAMPLES) / 32768
+            peaks.append(np.abs(frames).max(axis=1))
+            squares.append(np.square(frames).sum(axis=1))
+
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(
+                process.returncode, "ffmpeg", stderr=stderr.read()
+            )
+
+    duration = n_samples / ENVELOPE_SAMPLE_RATE
+    peaks = np.concatenate(peaks) if peaks else np.empty(0, dtype=np.float32)
+    squares = np.concatenate(squares) if squares else np.empty(0, dtype=np.float32)
+
+    # Samples per frame, for the mean square; the last frame may be shorter:
+    counts = np.full(len(peaks), _FRAME_SAMPLES)
+    if len(counts):
+        counts[-1] = n_samples - (len(counts) - 1) * _FRAME_SAMPLES
+
+    return duration, {
+        bins: _bin_frames(peaks, squares, counts, bins) for bins in levels
+    }
+
+
+def _bin_frames(
+    peaks: np.ndarray, squares: np.ndarray, counts: np.ndarray, bins: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Aggregate per-frame levels into `bins` bins of equal duration."""
+    # Each frame goes to the bin that its center falls into:
+    n_samples = counts.sum()
+    centers = np.arange(len(peaks)) * _FRAME_SAMPLES + counts / 2
+    index = np.minimum((centers / max(n_samples, 1) * bins).astype(int), bins - 1)
+
+    peak = np.zeros(bins, dtype=np.float32)
+    np.maximum.at(peak, index, peaks)
+    square_sum = np.bincount(index, weights=squares, minlength=bins)
+    sample_count = np.bincount(index, weights=counts, minlength=bins)
+    rms = np.sqrt(
+        np.divide(square_sum, sample_count, where=sample_count > 0, out=np.zeros(bins))
+    )
+
+    return peak, rms.astype(np.float32)
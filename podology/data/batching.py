@@ -0,0 +1,138 @@
+"""
+Bulk transcription in batches of similar total duration.
+
+Episodes queued from the dashboard reach the transcription service one file per
+request, short and long ones in whatever order they were clicked. This groups the
+episodes to transcribe into batches of up to TRANSCRIBE_BATCH_SECONDS of audio (and
+TRANSCRIBE_BATCH_MAX_EPISODES episodes), and enqueues each batch as one job, whose
+files the transcriber submits together where it can.
+
+Run from the command line:
+
+    python -m podology.data.batching -n 40
+
+to enqueue the 40 newest untranscribed episodes, or with `--dry-run` to only show the
+batches. Either way, it prints when the backlog is projected to be through, at the
+rate of the last week's transcriptions.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from loguru import logger
+
+from podology.data.Episode import Episode, Status
+from podology.stats.db import backlog_projection, connection
+from config import TRANSCRIBE_BATCH_MAX_EPISODES, TRANSCRIBE_BATCH_SECONDS
+
+# What an episode of unknown duration counts as, if no other episode's is known:
+DEFAULT_EPISODE_SECONDS = 3600
+
+
+def duration_batches(
+    episodes: Iterable[Episode],
+    max_seconds: float = TRANSCRIBE_BATCH_SECONDS,
+    max_episodes: int = TRANSCRIBE_BATCH_MAX_EPISODES,
+) -> list[list[Episode]]:
+    """Group episodes into batches of at most `max_seconds` of audio each.
+
+    Episodes go into the first batch they fit, longest first, which leaves few
+    batches half empty. An episode longer than `max_seconds` gets a batch of its own.
+    Episodes of unknown duration count as long as the average known one.
+
+    :param episodes: The episodes to batch.
+    :param max_seconds: Cap on the total duration of a batch.
+    :param max_episodes: Cap on the number of episodes in a batch.
+    :return: The batches, longest first.
+    """
+    episodes = list(episodes)
+    known = [ep.duration for ep in episodes if ep.duration]
+    default = sum(known) / len(known) if known else DEFAULT_EPISODE_SECONDS
+
+    def seconds(episode: Episode) -> float:
+        return episode.duration or default
+
+    batches: list[list[Episode]] = []
+    totals: list[float] = []
+    for episode in sorted(episodes, key=seconds, reverse=True):
+        for i, batch in enumerate(batches):
+            fits = totals[i] + seconds(episode) <= max_seconds
+            if fits and len(batch) < max_episodes:
+                batch.append(episode)
+                totals[i] += seconds(episode)
+                break
+        else:
+            batches.append([episode])
+            totals.append(seconds(episode))
+
+    return batches
+
+
+def episodes_to_transcribe(episode_store, n: Optional[int] = None) -> list[Episode]:
+    """The newest `n` episodes that are neither transcribed nor queued."""
+    episodes = [
+        ep
+        for ep in episode_store
+        if ep.transcript.status not in (Status.DONE, Status.QUEUED, Status.PROCESSING)
+    ]
+    episodes.sort(key=lambda ep: ep.pub_date or "", reverse=True)
+
+    return episodes[:n]
+
+
+def enqueue_batches(episode_store, episodes: Iterable[Episode]) -> list[str]:
+    """Enqueue the transcription of the episodes in batches.
+
+    :return: The IDs of the batch jobs.
+    """
+    job_ids = []
+    for batch in duration_batches(episodes):
+        job_ids.append(episode_store.enqueue_transcription_batch(batch))
+        hours = sum(ep.duration or 0 for ep in batch) / 3600
+        logger.info(f"Batch {job_ids[-1]}: {len(batch)} episodes, {hours:.1f} h")
+
+    return job_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enqueue the transcription of untranscribed episodes in batches."
+    )
+    parser.add_argument("eids", nargs="*", help="episodes (default: newest first)")
+    parser.add_argument("-n", type=int, default=None, help="number of episodes")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="show the batches, don't enqueue them"
+    )
+    args = parser.parse_args()
+
+    from podology.data.EpisodeStore import EpisodeStore
+
+    episode_store = EpisodeStore()
+    if args.eids:
+        episodes = [episode_store[eid] for eid in args.eids]
+    else:
+        episodes = episodes_to_transcribe(episode_store, args.n)
+
+    if args.dry_run:
+        for batch in duration_batches(episodes):
+            hours = sum(ep.duration or 0 for ep in batch) / 3600
+            print(f"{hours:5.1f} h  {' '.join(ep.eid for ep in batch)}")
+    else:
+        enqueue_batches(episode_store, episodes)
+
+    projection = backlog_projection(connection())
+    for label, hours, eta in [
+        ("Queued", projection["queued_h"], projection["queued_eta_s"]),
+        ("Untranscribed", projection["remaining_h"], projection["remaining_eta_s"]),
+    ]:
+        through = (
+            f"through by {datetime.now() + timedelta(seconds=eta):%Y-%m-%d %H:%M}"
+            if eta is not None
+            else "no recent transcriptions to project from"
+        )
+        print(f"{label}: {hours:.1f} h of audio, {through}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Streaming, resumable file downloads.
+
+A download is written to `<target>.part` in chunks and only renamed to its target
+once it is complete, so that a file at the target path is always whole. If a
+previous attempt left a .part file behind, the download resumes from where it
+stopped, provided the server honours Range requests; otherwise it starts over.
+
+Downloads of the same target are serialized through a lock file, so that a prefetch
+job and an episode's download job never write the same .part file at once.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+import re
+from typing import Callable, Optional
+
+from loguru import logger
+import requests
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """The server sent fewer or more bytes than it announced."""
+
+
+@dataclass
+class Download:
+    size: int
+    sha256: str
+
+
+def part_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.part")
+
+
+def download(
+    url: str,
+    path: Path,
+    session: Optional[requests.Session] = None,
+    timeout: float = 30,
+    throttle: Optional[Callable[[int], None]] = None,
+) -> Download:
+    """Download url to path.
+
+    If path already exists once no other download of it is running, it is kept.
+
+    :param url: The URL to download.
+    :param path: Where to save the file. Its directory must exist.
+    :param session: Session to make the request with, for connection pooling.
+    :param timeout: Connect and read timeout in seconds.
+    :param throttle: Called with the size of each chunk received; may block to limit
+      bandwidth.
+    :return: Size and SHA-256 hex digest of the file.
+    :raises requests.RequestException: On connection errors and HTTP error statuses.
+      The .part file is kept, so that the next attempt can resume.
+    :raises DownloadError: If the size doesn't match the announced Content-Length.
+    """
+    with _lock(path):
+        if path.exists():
+            return Download(size=path.stat().st_size, sha256=file_sha256(path))
+        return _download(url, path, session or requests, timeout, throttle)
+
+
+@contextmanager
+def _lock(path: Path):
+    with open(path.with_name(f".{path.name}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _download(url, path, session, timeout, throttle) -> Download:
+    part = part_path(path)
+    offset = part.stat().st_size if part.exists() else 0
+
+    # Uncompressed, so that Content-Length and Range are in bytes of the file:
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if offset and response.status_code == 416:
+            # The .part file is either complete already, or not of this file:
+            if _content_range_total(response) != offset:
+                part.unlink()
+                return _download(url, path, session, timeout, throttle)
+            sha256 = _sha256(part)
+            size = expected = offset
+        else:
+            response.raise_for_status()
+
+            resumed = (
+                response.status_code == 206 and _content_range_start(response) == offset
+            )
+            if offset and not resumed:
+                logger.debug(f"{url}: Server doesn't resume, starting over")
+                offset = 0
+
+            length = response.headers.get("Content-Length")
+            expected = offset + int(length) if length is not None else None
+
+            sha256 = _sha256(part) if offset else hashlib.sha256()
+            with open(part, "ab" if offset else "wb") as file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
+                    sha256.update(chunk)
+                    if throttle is not None:
+                        throttle(len(chunk))
+                size = file.tell()
+
+    if expected is not None and size != expected:
+        if size > expected:
+            part.unlink()
+        raise DownloadError(f"{url}: Got {size} bytes, expected {expected}")
+
+    os.replace(part, path)
+
+    return Download(size=size, sha256=sha256.hexdigest())
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 hex digest of a file."""
+    return _sha256(path).hexdigest()
+
+
+def _sha256(path: Path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256
+
+
+def _content_range_start(response: requests.Response) -> Optional[int]:
+    match = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+
+def _content_range_total(response: requests.Response) -> Optional[int]:
+    match = re.match(r"bytes [\d*-]+/(\d+)", response.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
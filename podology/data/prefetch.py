@@ -0,0 +1,189 @@
+"""
+Bulk download of episode audio ahead of transcription.
+
+Each transcription job waits for its episode's download job, which keeps the
+transcription service idle whenever a download is slow. Prefetching fetches the audio
+of many episodes beforehand, several at a time, over one keep-alive connection pool
+per host, and optionally under a bandwidth cap shared by all downloads.
+
+Run from the command line:
+
+    python -m podology.data.prefetch -n 20 --workers 4 --max-bandwidth 5
+
+or enqueue the same as a job on the "download" queue with `--enqueue`.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+from loguru import logger
+import requests
+from requests.adapters import HTTPAdapter
+
+from podology.data.Episode import Episode, Status
+from config import PREFETCH_MAX_BANDWIDTH, PREFETCH_WORKERS
+
+
+class TokenBucket:
+    """Bandwidth cap shared between threads.
+
+    Called with a number of bytes received, it blocks for as long as needed to keep
+    the average rate at `rate` bytes per second, allowing bursts of up to `burst`
+    bytes (by default a tenth of a second's worth).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate / 10
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, n: int):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Tokens may go negative; whoever comes next waits for the debt, too:
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+class HostSessions:
+    """One requests.Session per host, shared by all download threads, so that
+    connections to the same host are kept alive and reused.
+    """
+
+    def __init__(self, pool_size: int):
+        self.pool_size = pool_size
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+
+
+def prefetch(
+    episode_store,
+    episodes: Iterable[Episode],
+    workers: int = PREFETCH_WORKERS,
+    max_bandwidth: Optional[float] = PREFETCH_MAX_BANDWIDTH,
+) -> dict[str, Status]:
+    """Download the audio of the given episodes, `workers` at a time.
+
+    :param episode_store: The episode store to download into.
+    :param episodes: Episodes whose audio to download; those that have it are skipped.
+    :param workers: Number of concurrent downloads.
+    :param max_bandwidth: Cap on the total download rate in bytes per second, or
+      None for no cap.
+    :return: Audio status of each episode afterwards, by eid.
+    """
+    sessions = HostSessions(pool_size=workers)
+    throttle = TokenBucket(max_bandwidth) if max_bandwidth else None
+
+    def fetch(episode: Episode) -> Status:
+        episode_store.ensure_audio(
+            episode, session=sessions(episode.url), throttle=throttle
+        )
+        return episode.audio.status
+
+    episodes = list(episodes)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            statuses = list(executor.map(fetch, episodes))
+    finally:
+        sessions.close()
+
+    return {episode.eid: status for episode, status in zip(episodes, statuses)}
+
+
+def episodes_to_prefetch(episode_store, n: Optional[int] = None) -> list[Episode]:
+    """The newest `n` untranscribed episodes without audio."""
+    episodes = [
+        ep for ep in episode_store if not ep.transcript.status and not ep.audio.status
+    ]
+    episodes.sort(key=lambda ep: ep.pub_date or "", reverse=True)
+
+    return episodes[:n]
+
+
+def prefetch_worker(
+    eids: Optional[list[str]] = None,
+    n: Optional[int] = None,
+    workers: int = PREFETCH_WORKERS,
+    max_bandwidth: Optional[float] = PREFETCH_MAX_BANDWIDTH,
+):
+    """RQ job: prefetch the given episodes, or the newest n that need audio."""
+    from podology.data.EpisodeStore import EpisodeStore
+
+    episode_store = EpisodeStore()
+    if eids is None:
+        episodes = episodes_to_prefetch(episode_store, n)
+    else:
+        episodes = [episode_store[eid] for eid in eids]
+
+    statuses = prefetch(episode_store, episodes, workers, max_bandwidth)
+    failed = [eid for eid, status in statuses.items() if status is Status.ERROR]
+    logger.info(f"Prefetched audio of {len(statuses) - len(failed)} episodes")
+    if failed:
+        logger.warning(f"Audio download failed for: {', '.join(failed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the audio of untranscribed episodes ahead of time."
+    )
+    parser.add_argument("eids", nargs="*", help="episodes (default: newest first)")
+    parser.add_argument("-n", type=int, default=None, help="number of episodes")
+    parser.add_argument("--workers", type=int, default=PREFETCH_WORKERS)
+    parser.add_argument(
+        "--max-bandwidth",
+        type=float,
+        default=None,
+        help="cap on the total download rate, in MB/s",
+    )
+    parser.add_argument(
+        "--enqueue", action="store_true", help="run as a job on the download queue"
+    )
+    args = parser.parse_args()
+
+    kwargs = dict(
+        eids=args.eids or None,
+        n=args.n,
+        workers=args.workers,
+        max_bandwidth=(
+            args.max_bandwidth * 1e6 if args.max_bandwidth else PREFETCH_MAX_BANDWIDTH
+        ),
+    )
+    if args.enqueue:
+        from podology.data.EpisodeStore import download_q
+
+        job = download_q.enqueue(prefetch_worker, kwargs=kwargs, job_timeout=28800)
+        logger.info(f"Prefetch job {job.id} enqueued")
+    else:
+        prefetch_worker(**kwargs)
+
+
+if __name__ == "__main__":
+    main()
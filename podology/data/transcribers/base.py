@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import Dict, Optional
 
 
 class Transcriber(ABC):
@@ -24,6 +25,24 @@ class Transcriber(ABC):
         This is useful for asynchronous processing.
         """
 
+    def transcribe_many(
+        self, audio_paths: Dict[str, Path]
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        Transcribe several audio files, by eid. Returns, for each eid, None on success
+        or the exception raised. Transcribers that can submit several files at once
+        override this; by default, they are submitted one after the other.
+        """
+        errors = {}
+        for eid, audio_path in audio_paths.items():
+            try:
+                self.submit_job(audio_path=audio_path, job_id=eid)
+                errors[eid] = None
+            except Exception as e:
+                errors[eid] = e
+
+        return errors
+
     @abstractmethod
     def get_status(self, eid: str) -> dict:
         """
@@ -1,62 +1,211 @@
-import time
+"""
+RQ jobs that take an episode from its feed entry to a processed transcript.
+
+Each stage has its own queue, so that each kind of resource gets its own workers:
+
+- "download": fetch the audio (network-bound),
+- "transcribe": send it to the transcription service (waits on the GPU),
+- "postprocess": index, embed and compute the stats of the transcript (CPU-bound).
+
+EpisodeStore.enqueue_transcription_job() chains the three with `depends_on`, so a slow
+post-processing stage no longer holds up the next transcription. A job raises when
+its stage fails, which leaves the stages depending on it unqueued.
+
+EpisodeStore.enqueue_transcription_batch() instead has several episodes transcribed
+by one job (see podology.data.batching), which queues the post-processing of each
+episode it transcribed.
+
+Each job records when it was enqueued, started and finished in the `job_stages`
+table; run this module to report the throughput of each queue from it.
+"""
+
+import argparse
+from functools import wraps
 
 from loguru import logger
 
 from podology.data.Episode import Status
 from podology.data.transcribers.base import Transcriber
+from podology.stats.db import connection, job_finished, job_started, stage_throughput
 from podology.stats.preparation import post_process_pipeline
 from podology.data.transcribers.whisperx import WhisperXTranscriber
 from config import TRANSCRIBER_ARGS
 
+STAGE_DOWNLOAD = "download"
+STAGE_TRANSCRIBE = "transcribe"
+STAGE_POSTPROCESS = "postprocess"
 
-def transcription_worker(eid: str, timeout: int = 28800, interval: int = 5):
-    """Worker function for transcription jobs.
 
-    Runs in a background worker process, typically managed by RQ (Redis Queue).
-    Instantiates a transcriber object of the class specified in config.py,
-    which is interchangeable to use different transcription services, models, or APIs.
-    The transcriber object handles sending the audio file to the transcription service,
-    polling for the job's completion, saving the resulting transcript to disk, and
-    post-processing the transcript (e.g., generating stats, enqueueing scrollvid worker).
-    """
+def tracked(stage: str):
+    """Record the start and end of the decorated job (taking an eid) in job_stages."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(eid: str, *args, **kwargs):
+            conn = connection()
+            with conn:
+                job_started(conn, eid, stage)
+            ok = False
+            try:
+                result = func(eid, *args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with conn:
+                    job_finished(conn, eid, stage, ok)
+
+        return wrapper
+
+    return decorator
+
+
+@tracked(STAGE_DOWNLOAD)
+def download_worker(eid: str):
+    """Download the episode's audio, unless it is there already."""
     from podology.data.EpisodeStore import EpisodeStore
-    
+
     episode_store = EpisodeStore()
     episode = episode_store[eid]
-    
-    try:
-        transcriber: Transcriber = WhisperXTranscriber(**TRANSCRIBER_ARGS)
-    except Exception as e:
-        episode.transcript.status = Status.ERROR
-        episode_store.add_or_update(episode)
-        raise
-
-    audio_path = episode_store.audio_dir / f"{episode.eid}.mp3"
 
-    # 1. Download audio if not already done
     episode_store.ensure_audio(episode)
     if episode.audio.status != Status.DONE:
-        logger.error(f"{eid}: Failed to download audio.")
-        return
+        raise RuntimeError(f"{eid}: Failed to download audio.")
+
+
+@tracked(STAGE_TRANSCRIBE)
+def transcribe_worker(eid: str):
+    """Have the episode transcribed.
+
+    Instantiates a transcriber object of the class specified in config.py, which is
+    interchangeable to use different transcription services, models, or APIs. The
+    transcriber object handles sending the audio file to the transcription service,
+    waiting for the job's completion, and saving the resulting transcript to disk.
+    """
+    from podology.data.EpisodeStore import EpisodeStore
+
+    episode_store = EpisodeStore()
+    episode = episode_store[eid]
 
-    # 2. Submit job to API
-    # The transcriber object here is of the kind that we select in config.py; it's
-    # interchangeable, so the API doing the work is abstracted away.
     if episode.transcript.status == Status.DONE:
         logger.info(f"{eid}: Transcript already exists, skipping transcription.")
         return
 
+    episode.transcript.status = Status.PROCESSING
+    episode_store.add_or_update(episode)
+
     logger.debug(f"{eid}: Submitting transcription job for episode")
     try:
-        transcriber.submit_job(audio_path=audio_path, job_id=eid)
-        episode.transcript.status = Status.DONE
+        transcriber: Transcriber = WhisperXTranscriber(**TRANSCRIBER_ARGS)
+        transcriber.submit_job(
+            audio_path=episode_store.audio_dir / f"{eid}.mp3", job_id=eid
+        )
     except Exception as e:
         logger.error(f"{eid}: Transcription job failed: {e}")
         episode.transcript.status = Status.ERROR
         episode_store.add_or_update(episode)
-        return
+        raise
 
-    post_process_pipeline(episode_store, [episode])
+    episode.transcript.status = Status.DONE
     episode_store.add_or_update(episode)
     logger.debug(f"{eid}: Transcription job completed successfully.")
+
+
+def transcribe_batch_worker(eids: list[str]):
+    """Have several episodes transcribed at once, and queue their post-processing.
+
+    Episodes whose audio is missing (because their download failed) are not sent.
+    Once the others are through, the job raises if any episode failed.
+    """
+    from podology.data.EpisodeStore import EpisodeStore
+
+    episode_store = EpisodeStore()
+    episodes = [episode_store[eid] for eid in eids]
+    conn = connection()
+    with conn:
+        for eid in eids:
+            job_started(conn, eid, STAGE_TRANSCRIBE)
+
+    errors = {}
+    audio_paths = {}
+    for episode in episodes:
+        audio_path = episode_store.audio_dir / f"{episode.eid}.mp3"
+        if episode.transcript.status == Status.DONE:
+            logger.info(f"{episode.eid}: Transcript already exists, skipping it.")
+        elif not audio_path.exists():
+            errors[episode.eid] = RuntimeError(
+                f"{episode.eid}: No audio to transcribe."
+            )
+        else:
+            audio_paths[episode.eid] = audio_path
+            episode.transcript.status = Status.PROCESSING
+            episode_store.add_or_update(episode)
+
+    logger.debug(f"Submitting a batch of {len(audio_paths)} episodes")
+    try:
+        transcriber: Transcriber = WhisperXTranscriber(**TRANSCRIBER_ARGS)
+        errors.update(transcriber.transcribe_many(audio_paths))
+    except Exception as e:
+        errors.update({eid: e for eid in audio_paths})
+
+    for episode in episodes:
+        error = errors.get(episode.eid)
+        if error is None:
+            if episode.transcript.status != Status.DONE:
+                episode.transcript.status = Status.DONE
+                episode_store.add_or_update(episode)
+            episode_store.enqueue_postprocessing(episode.eid)
+        else:
+            logger.error(f"{episode.eid}: Transcription job failed: {error}")
+            episode.transcript.status = Status.ERROR
+            episode_store.add_or_update(episode)
+        with conn:
+            job_finished(conn, episode.eid, STAGE_TRANSCRIBE, error is None)
+
+    failed = [eid for eid in eids if errors.get(eid) is not None]
+    if failed:
+        raise RuntimeError(f"Transcription failed for: {', '.join(failed)}")
+
+
+@tracked(STAGE_POSTPROCESS)
+def postprocess_worker(eid: str):
+    """Run the analysis pipeline on the episode's transcript."""
+    from podology.data.EpisodeStore import EpisodeStore
+
+    episode_store = EpisodeStore()
+    episode = episode_store[eid]
+
+    post_process_pipeline(episode_store, [episode])
     episode_store.add_or_update(episode)
+    logger.debug(f"{eid}: Post-processing completed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the throughput of the download, transcribe and "
+        "postprocess queues."
+    )
+    parser.add_argument(
+        "--days", type=float, default=7, help="over jobs finished in the last days"
+    )
+    args = parser.parse_args()
+
+    rows = stage_throughput(connection(), days=args.days)
+    if not rows:
+        print(f"No jobs finished in the last {args.days:g} days.")
+        return
+
+    print(
+        f"{'queue':<12}{'jobs':>6}{'failed':>8}{'wait (s)':>10}{'run (s)':>10}"
+        f"{'jobs/h':>8}{'audio h/h':>11}"
+    )
+    for row in rows:
+        hours = max(row["span_s"], 1) / 3600
+        print(
+            f"{row['stage']:<12}{row['jobs']:>6}{row['failed']:>8}"
+            f"{row['mean_wait_s'] or 0:>10.0f}{row['mean_run_s']:>10.0f}"
+            f"{row['jobs'] / hours:>8.1f}{(row['audio_h'] or 0) / hours:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
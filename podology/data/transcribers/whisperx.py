@@ -1,20 +1,39 @@
 """
 The transcriber class that sends audio files directly to a WhisperX microservice for transcription.
+
+If the service offers it, jobs are asynchronous, so that no request is held open for
+the length of a transcription and several jobs can be in flight at once:
+
+- `POST /jobs` uploads an audio file (with its SHA-256 as `audio_sha256`) and the
+  transcription options, and returns `{"job_id": ..., "status": ...}`;
+- `GET /jobs?audio_sha256=...` returns the job for that audio, or 404;
+- `GET /jobs/<job_id>` returns `{"job_id": ..., "status": ..., "error": ...}`, where
+  status is one of "queued", "processing", "done" or "failed";
+- `GET /jobs/<job_id>/result` returns the transcript of a job that is done;
+- `POST /jobs/batch` uploads several files (`audio_files`, with an `audio_sha256`
+  each, in the same order) as one request, and returns `{"jobs": [...]}`, a job per
+  file, in order. Services without it get the files one by one.
+
+Before uploading, the transcriber looks the audio up by its hash, so that a retried
+or repeated submission joins the existing job instead of uploading the file again.
+Services without `/jobs` get the file posted to the synchronous `/asr` endpoint.
 """
 
+from contextlib import ExitStack
 import os
-import json
 import tempfile
 from pathlib import Path
 import time
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from dotenv import find_dotenv, load_dotenv
 
 from loguru import logger
 import requests
 
+from podology.data.download import file_sha256
+from podology.data.transcript_io import write_transcript
 from podology.data.transcribers.base import Transcriber
-from config import TRANSCRIPT_DIR, TRANSCRIBER_ARGS
+from config import AUDIO_DIR, TRANSCRIPT_DIR, TRANSCRIBER_ARGS
 
 load_dotenv(find_dotenv(), override=True)
 
@@ -33,6 +52,7 @@ class WhisperXTranscriber(Transcriber):
         model: str = "base",
         min_speakers: int = 2,
         max_speakers: int = 5,
+        poll_interval: float = 10,
     ):
         self.whisperx_url = whisperx_url.rstrip("/")
         self.use_gpu = use_gpu
@@ -44,6 +64,11 @@ class WhisperXTranscriber(Transcriber):
         self.model = model
         self.min_speakers = min_speakers
         self.max_speakers = max_speakers
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        # Whether the service offers /jobs and /jobs/batch; None until tried:
+        self.async_jobs: Optional[bool] = None
+        self.batch_jobs: Optional[bool] = None
 
         logger.debug(
             f"Initialized WhisperXTranscriber (url={self.whisperx_url}, gpu={self.use_gpu})"
@@ -68,43 +93,265 @@ class WhisperXTranscriber(Transcriber):
         """
         Submit audio file for transcription and wait for completion.
         """
+        errors = self.transcribe_many({job_id: audio_path})
+        if errors[job_id] is not None:
+            raise errors[job_id]
+
+    def transcribe_many(
+        self, audio_paths: Dict[str, Path], timeout: float = 28800
+    ) -> Dict[str, Optional[Exception]]:
+        """Transcribe several audio files, and store their results.
+
+        With an asynchronous service, all files are submitted first (in one request,
+        if the service takes batches) and then polled together, so that the service
+        can work on them back to back.
+
+        :param audio_paths: Audio file of each episode, by eid.
+        :param timeout: Seconds to wait for all transcripts.
+        :return: For each eid, None if the transcript was stored, or the exception
+          that kept it from being stored.
+        """
+        errors: Dict[str, Optional[Exception]] = {}
+        pending: Dict[str, str] = {}
+        if self.async_jobs is not False:
+            try:
+                pending, errors = self.submit_many(audio_paths)
+            except _AsyncUnsupported:
+                logger.info("WhisperX service has no /jobs, transcribing in sync")
+
+        for eid, audio_path in audio_paths.items():
+            if eid in pending or eid in errors:
+                continue
+            try:
+                logger.info(f"{eid}: Submitting transcription job")
+                self._store_result(eid, self._transcribe_audio(audio_path))
+                errors[eid] = None
+            except Exception as e:
+                logger.error(f"Transcription failed for job {eid}: {e}")
+                errors[eid] = e
+
+        deadline = time.monotonic() + timeout
+        resubmitted = set()
+        while pending:
+            for eid, job_id in list(pending.items()):
+                try:
+                    status = self.job_status(job_id)
+                    if status["status"] == "done":
+                        self._store_result(eid, self.fetch_result(job_id))
+                        errors[eid] = None
+                    elif status["status"] == "failed":
+                        errors[eid] = RuntimeError(
+                            f"WhisperX job {job_id} failed: {status.get('error')}"
+                        )
+                    else:
+                        continue
+                except requests.exceptions.HTTPError as e:
+                    if e.response is None or e.response.status_code != 404:
+                        logger.warning(f"{eid}: Polling job {job_id} failed: {e}")
+                        continue
+                    if eid in resubmitted:
+                        errors[eid] = RuntimeError(f"WhisperX lost job {job_id}")
+                    else:
+                        # The service forgets its jobs when it restarts; submit the
+                        # audio again (or find the job it has for it by now):
+                        logger.warning(f"{eid}: Job {job_id} was lost, resubmitting")
+                        resubmitted.add(eid)
+                        try:
+                            pending[eid] = self.submit(audio_paths[eid])
+                            continue
+                        except Exception as resubmit_error:
+                            errors[eid] = resubmit_error
+                except requests.exceptions.RequestException as e:
+                    # Polling is idempotent; try again next round:
+                    logger.warning(f"{eid}: Polling job {job_id} failed: {e}")
+                    continue
+                except Exception as e:
+                    # E.g. a result that can't be stored; the other episodes go on:
+                    logger.error(f"Transcription failed for job {eid}: {e}")
+                    errors[eid] = e
+                del pending[eid]
+
+            if pending and time.monotonic() > deadline:
+                for eid, job_id in pending.items():
+                    errors[eid] = TimeoutError(f"WhisperX job {job_id} timed out")
+                break
+            if pending:
+                time.sleep(self.poll_interval)
+
+        return errors
+
+    def submit(self, audio_path: Path, audio_sha256: Optional[str] = None) -> str:
+        """Submit an audio file as an asynchronous job, unless it is already.
+
+        :param audio_path: The audio file.
+        :param audio_sha256: Its SHA-256 hex digest, if known.
+        :return: The service's job ID.
+        :raises _AsyncUnsupported: If the service has no /jobs endpoint.
+        """
         if not audio_path.exists():
             raise FileNotFoundError(f"Audio file not found: {audio_path}")
+        audio_sha256 = audio_sha256 or file_sha256(audio_path)
 
-        logger.info(f"{job_id}: Submitting transcription job")
+        existing = self.find_job(audio_sha256)
+        if existing is not None and existing["status"] != "failed":
+            return existing["job_id"]
 
-        try:
-            result = self._transcribe_audio(audio_path)
+        return self._upload(audio_path, audio_sha256)
 
-            # Store result locally with job_id
-            self._store_result(job_id, result)
+    def submit_many(
+        self, audio_paths: Dict[str, Path]
+    ) -> Tuple[Dict[str, str], Dict[str, Exception]]:
+        """Submit several audio files as asynchronous jobs, unless they are already.
 
-            logger.info(f"Transcription completed for job {job_id}")
+        Files without a job are uploaded in one request to `/jobs/batch` if the
+        service has it, or one by one otherwise.
 
-        except Exception as e:
-            logger.error(f"Transcription failed for job {job_id}: {e}")
-            # Store error status
-            raise
+        :param audio_paths: Audio file of each episode, by eid.
+        :return: The job ID of each submitted episode, and the exception that kept
+          each of the others from being submitted, both by eid.
+        :raises _AsyncUnsupported: If the service has no /jobs endpoint.
+        """
+        job_ids: Dict[str, str] = {}
+        errors: Dict[str, Exception] = {}
+        uploads: Dict[str, Tuple[Path, str]] = {}
+        for eid, audio_path in audio_paths.items():
+            try:
+                audio_sha256 = file_sha256(audio_path)
+                existing = self.find_job(audio_sha256)
+            except (OSError, requests.exceptions.RequestException) as e:
+                logger.error(f"{eid}: Submission failed: {e}")
+                errors[eid] = e
+                continue
+            if existing is not None and existing["status"] != "failed":
+                job_ids[eid] = existing["job_id"]
+                logger.info(f"{eid}: Already submitted as job {job_ids[eid]}")
+            else:
+                uploads[eid] = (audio_path, audio_sha256)
+
+        if len(uploads) > 1 and self.batch_jobs is not False:
+            try:
+                job_ids.update(self._upload_batch(uploads))
+                logger.info(f"Submitted {len(uploads)} files as one batch")
+                uploads = {}
+            except _AsyncUnsupported:
+                logger.info("WhisperX service has no /jobs/batch, uploading singly")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Batch submission failed: {e}")
+                errors.update({eid: e for eid in uploads})
+                uploads = {}
+
+        for eid, (audio_path, audio_sha256) in uploads.items():
+            try:
+                job_ids[eid] = self._upload(audio_path, audio_sha256)
+                logger.info(f"{eid}: Submitted as job {job_ids[eid]}")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"{eid}: Submission failed: {e}")
+                errors[eid] = e
+
+        return job_ids, errors
+
+    def _upload(self, audio_path: Path, audio_sha256: str) -> str:
+        with open(audio_path, "rb") as audio_file:
+            response = self.session.post(
+                f"{self.whisperx_url}/jobs",
+                files={"audio_file": (audio_path.name, audio_file, "audio/mpeg")},
+                data={**self._form_data(), "audio_sha256": audio_sha256},
+                params=self._params(),
+                headers=self.headers,
+                timeout=600,
+            )
+        if response.status_code in (404, 405):
+            self.async_jobs = False
+            raise _AsyncUnsupported()
+        response.raise_for_status()
+        self.async_jobs = True
+
+        return response.json()["job_id"]
+
+    def _upload_batch(self, uploads: Dict[str, Tuple[Path, str]]) -> Dict[str, str]:
+        with ExitStack() as stack:
+            files = [
+                (
+                    "audio_files",
+                    (path.name, stack.enter_context(open(path, "rb")), "audio/mpeg"),
+                )
+                for path, _ in uploads.values()
+            ]
+            response = self.session.post(
+                f"{self.whisperx_url}/jobs/batch",
+                files=files,
+                data={
+                    **self._form_data(),
+                    "audio_sha256": [sha for _, sha in uploads.values()],
+                },
+                params=self._params(),
+                headers=self.headers,
+                timeout=600 * len(uploads),
+            )
+        if response.status_code in (404, 405):
+            self.batch_jobs = False
+            raise _AsyncUnsupported()
+        response.raise_for_status()
+        self.async_jobs = self.batch_jobs = True
+
+        jobs = response.json()["jobs"]
+        return {eid: job["job_id"] for eid, job in zip(uploads, jobs)}
+
+    def find_job(self, audio_sha256: str) -> Optional[Dict]:
+        """The service's job for this audio and these options, if there is one."""
+        response = self.session.get(
+            f"{self.whisperx_url}/jobs",
+            params={**self._params(), "audio_sha256": audio_sha256},
+            headers=self.headers,
+            timeout=30,
+        )
+        if response.status_code in (404, 405):
+            return None
+        response.raise_for_status()
+
+        return response.json()
+
+    def job_status(self, job_id: str) -> Dict:
+        response = self.session.get(
+            f"{self.whisperx_url}/jobs/{job_id}", headers=self.headers, timeout=30
+        )
+        response.raise_for_status()
+
+        return response.json()
+
+    def fetch_result(self, job_id: str) -> Dict:
+        response = self.session.get(
+            f"{self.whisperx_url}/jobs/{job_id}/result",
+            headers=self.headers,
+            timeout=300,
+        )
+        response.raise_for_status()
+
+        return self._fix_microservice_format(response.json())
+
+    def _form_data(self) -> Dict:
+        return {
+            "task": "transcribe",
+            "language": self.language,
+            "model": self.model,
+        }
+
+    def _params(self) -> Dict:
+        return {
+            "output": "json",
+            "diarize": True,
+            "min_speakers": self.min_speakers,
+            "max_speakers": self.max_speakers,
+            "align_model": "WAV2VEC2_ASR_LARGE_LV60K_960H",
+        }
 
     def _transcribe_audio(self, audio_path: Path) -> Dict:
         """Call the WhisperX service for transcription"""
 
         with open(audio_path, "rb") as audio_file:
             files = {"audio_file": (audio_path.name, audio_file, "audio/mpeg")}
-
-            data = {
-                "task": "transcribe",
-                "language": self.language,
-                "model": self.model,
-            }
-
-            params = {
-                "output": "json",
-                "diarize": True,
-                "min_speakers": self.min_speakers,
-                "max_speakers": self.max_speakers,
-                "align_model": "WAV2VEC2_ASR_LARGE_LV60K_960H",
-            }
+            data = self._form_data()
+            params = self._params()
 
             logger.debug(f"Calling WhisperX service: POST {self.whisperx_url}/asr")
 
@@ -163,66 +410,60 @@ class WhisperXTranscriber(Transcriber):
         """Store transcription result locally"""
         result_file = TRANSCRIPT_DIR / f"{job_id}.json"
 
-        with open(result_file, "w") as f:
-            json.dump(result, f, indent=2)
+        write_transcript(result_file, result)
 
         logger.debug(f"Stored result for job {job_id} at {result_file}")
 
     def get_status(self, eid: str) -> Dict:
-        """Get status of the transcription job by checking local storage.
+        """Get status of the transcription job.
 
-        If it does not exist, return not_found. If it exists then if it is a
-        dict as returned by _store_error(), return the status. Else assumed to
-        be a completed transcription result.
+        A transcript in local storage means the job is done. Otherwise, the service
+        is asked for the job of the episode's audio, if it has one.
         """
         result_file = TRANSCRIPT_DIR / f"{eid}.json"
-
-        if not result_file.exists():
-            return {"status": "not_found", "job_id": eid}
+        if result_file.exists():
+            return {"status": "done", "job_id": eid}
 
         try:
-            with open(result_file, "r") as f:
-                result = json.load(f)
-                # bit hacky: if "status" key is not present, we assume all OK
-                if "status" not in result:
-                    return {"status": "done"}
-
-            return {
-                "status": result["status"],
-                "job_id": eid,
-                "timestamp": result.get("timestamp"),
-                "error_message": result.get("error"),
-            }
-        except Exception as e:
-            logger.error(f"Error reading result file for job {eid}: {e}")
+            job = self._remote_job(eid)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error getting status of job {eid}: {e}")
             return {"status": "failed", "job_id": eid, "error_message": str(e)}
 
-    def download_transcript(self, eid: str, dest_path: Path) -> None:
-        """Download the transcription result to specified path"""
-        result_file = TRANSCRIPT_DIR / f"{eid}.json"
-
-        if not result_file.exists():
-            raise FileNotFoundError(f"No result found for job {eid}")
+        if job is None:
+            return {"status": "not_found", "job_id": eid}
 
-        try:
-            with open(result_file, "r") as f:
-                result = json.load(f)
+        return {
+            "status": job["status"],
+            "job_id": eid,
+            "remote_job_id": job["job_id"],
+            "error_message": job.get("error"),
+        }
 
-            if result["status"] != "completed":
-                raise RuntimeError(
-                    f"Job {eid} is not completed (status: {result['status']})"
-                )
+    def download_transcript(self, eid: str, dest_path: Path) -> None:
+        """Download the transcription result of the episode's job to dest_path"""
+        job = self._remote_job(eid)
+        if job is None:
+            raise FileNotFoundError(f"No job found for {eid}")
+        if job["status"] != "done":
+            raise RuntimeError(f"Job {eid} is not done (status: {job['status']})")
 
-            # Copy the transcription result to destination
-            dest_path.parent.mkdir(parents=True, exist_ok=True)
+        result = self.fetch_result(job["job_id"])
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        write_transcript(dest_path, result)
 
-            with open(dest_path, "w") as f:
-                json.dump(result["transcription"], f, indent=2)
+        logger.info(f"Downloaded transcript for job {eid} to {dest_path}")
 
-            logger.info(f"Downloaded transcript for job {eid} to {dest_path}")
+    def _remote_job(self, eid: str) -> Optional[Dict]:
+        audio_path = AUDIO_DIR / f"{eid}.mp3"
+        if not audio_path.exists():
+            return None
 
-        except Exception as e:
-            raise RuntimeError(f"Failed to download transcript for job {eid}: {e}")
+        return self.find_job(file_sha256(audio_path))
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(url={self.whisperx_url}, gpu={self.use_gpu})"
+
+
+class _AsyncUnsupported(Exception):
+    """The service has no /jobs (or /jobs/batch) endpoint."""
@@ -0,0 +1,222 @@
+"""
+Reading and writing transcript files.
+
+Transcripts used to be stored as the transcription service returns them, indented: a
+list of segments, each with its text and a dict per word (text, start, end, score,
+speaker), plus all words once more as "word_segments". Most of that is repeated.
+Transcripts are now written compact, minified, with a list per field:
+
+    {
+      "layout": "columns/1",
+      "language": "en",
+      "segments": {"start": [...], "end": [...], "speaker": [...],
+                   "n_words": [...], "text": [...]},
+      "words": {"word": [...], "start": [...], "end": [...], "score": [...],
+                "speaker": [...]}
+    }
+
+Fields a segment or word doesn't have are null, with two exceptions that keep the
+common case small:
+
+- A segment's text is null if it is its words joined by spaces, or [leading,
+  trailing] if it is that with whitespace around it (WhisperX starts texts with a
+  space).
+- A word's speaker is null if it is its segment's, and false if the word has none
+  while its segment has one.
+
+"word_segments" is dropped; read_transcript() gives back everything else as it was
+written.
+
+read_transcript() reads either layout and returns the legacy one, which is what every
+reader works with. Convert existing transcripts with
+
+    python -m podology.data.transcript_io
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger
+
+from config import TRANSCRIPT_DIR
+
+LAYOUT = "columns/1"
+
+
+def read_transcript(path: Path) -> dict:
+    """Read a transcript file of either layout, in the legacy layout."""
+    with open(path, "r") as f:
+        transcript = json.load(f)
+
+    if transcript.get("layout") == LAYOUT:
+        return expand(transcript)
+    return transcript
+
+
+def write_transcript(path: Path, transcript: dict) -> None:
+    """Write a transcript (of either layout) to path in the compact layout.
+
+    The file is replaced in one go, so that readers never see half of it.
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(compact(transcript), f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def compact(transcript: dict) -> dict:
+    """Convert a transcript in the legacy layout to the compact one."""
+    if transcript.get("layout") == LAYOUT:
+        return transcript
+
+    segments = transcript.get("segments", [])
+    seg_words = [segment.get("words", []) for segment in segments]
+
+    segment_columns = _columns(segments, exclude={"words", "text"})
+    segment_columns["n_words"] = [len(words) for words in seg_words]
+    segment_columns["text"] = [
+        _compact_text(segment.get("text"), words)
+        for segment, words in zip(segments, seg_words)
+    ]
+
+    words = [word for words in seg_words for word in words]
+    word_columns = _columns(words, exclude={"speaker"})
+    # Without the column, words would take their segment's speaker:
+    if any("speaker" in item for item in words + segments):
+        word_columns["speaker"] = [
+            _compact_speaker(word.get("speaker"), segment.get("speaker"))
+            for segment, words in zip(segments, seg_words)
+            for word in words
+        ]
+
+    other = {
+        key: value
+        for key, value in transcript.items()
+        if key not in ("segments", "word_segments")
+    }
+    return {
+        "layout": LAYOUT,
+        **other,
+        "segments": segment_columns,
+        "words": word_columns,
+    }
+
+
+def expand(transcript: dict) -> dict:
+    """Convert a transcript in the compact layout to the legacy one."""
+    segment_columns = dict(transcript["segments"])
+    n_words = segment_columns.pop("n_words")
+    texts = segment_columns.pop("text")
+    words = _rows(transcript["words"], sum(n_words))
+
+    segments = []
+    first = 0
+    for i, n in enumerate(n_words):
+        segment = _row(segment_columns, i)
+        segment_words = words[first : first + n]
+        first += n
+        for word in segment_words:
+            # Missing (null) is the segment's speaker, false is none:
+            speaker = word.pop("speaker", segment.get("speaker"))
+            if speaker is not None and speaker is not False:
+                word["speaker"] = speaker
+        segment["text"] = _expand_text(texts[i], segment_words)
+        segment["words"] = segment_words
+        segments.append(segment)
+
+    other = {
+        key: value
+        for key, value in transcript.items()
+        if key not in ("layout", "segments", "words")
+    }
+    return {**other, "segments": segments}
+
+
+def _joined(words: list[dict]) -> str:
+    return " ".join(word.get("word", "") for word in words)
+
+
+def _compact_text(text: str | None, words: list[dict]) -> str | list[str] | None:
+    joined = _joined(words)
+    if text == joined:
+        return None
+    if text is not None and joined and text.strip() == joined:
+        start = text.index(joined)
+        return [text[:start], text[start + len(joined) :]]
+    return text
+
+
+def _expand_text(text: str | list[str] | None, words: list[dict]) -> str:
+    if text is None:
+        return _joined(words)
+    if isinstance(text, list):
+        leading, trailing = text
+        return leading + _joined(words) + trailing
+    return text
+
+
+def _compact_speaker(
+    speaker: str | None, segment_speaker: str | None
+) -> str | bool | None:
+    if speaker == segment_speaker:
+        return None
+    if speaker is None:
+        return False
+    return speaker
+
+
+def _columns(rows: list[dict], exclude: set[str]) -> dict[str, list]:
+    keys = [
+        key
+        for key in dict.fromkeys(k for row in rows for k in row)
+        if key not in exclude
+    ]
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def _row(columns: dict[str, list], i: int) -> dict:
+    return {key: column[i] for key, column in columns.items() if column[i] is not None}
+
+
+def _rows(columns: dict[str, list], n: int) -> list[dict]:
+    return [_row(columns, i) for i in range(n)]
+
+
+def convert(paths: Iterable[Path]) -> tuple[int, int]:
+    """Rewrite transcript files in the compact layout.
+
+    :return: Total size of the files before and after, in bytes.
+    """
+    before = after = 0
+    for path in paths:
+        size = path.stat().st_size
+        write_transcript(path, read_transcript(path))
+        before += size
+        after += path.stat().st_size
+        logger.debug(f"{path.stem}: {size} -> {path.stat().st_size} bytes")
+
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rewrite transcript files in the compact layout."
+    )
+    parser.add_argument(
+        "paths", nargs="*", type=Path, help="transcript files (default: all)"
+    )
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(TRANSCRIPT_DIR.glob("*.json"))
+    before, after = convert(paths)
+    print(
+        f"Converted {len(paths)} transcripts: {before / 1e6:.1f} MB -> "
+        f"{after / 1e6:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
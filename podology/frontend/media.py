@@ -0,0 +1,267 @@
+"""
+Flask routes for the media files that the dashboard loads outside of Dash callbacks:
+episode audio and its renditions, word cloud images and word cloud data, and scroll
+animation tickers.
+
+Directories are resolved against the working directory, like everywhere else in the
+app, rather than against the Flask app's root path.
+"""
+
+from contextlib import closing
+from functools import lru_cache
+import gzip
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    redirect,
+    request,
+    send_from_directory,
+    url_for,
+)
+from werkzeug.security import safe_join
+import werkzeug.utils
+
+from podology.data.audio import RENDITIONS, rendition_path
+from podology.frontend.renderers.wordticker import get_ticker_payload
+from podology.stats.db import (
+    STAGE_NAMED_ENTITY_TOKENS,
+    STAGE_NAMED_ENTITY_TYPES,
+    insert_ticker_payload,
+    is_done,
+    ticker_etag,
+    ticker_payload,
+    top_named_entities,
+)
+from config import (
+    AUDIO_ACCEL_PREFIX,
+    AUDIO_DIR,
+    AUDIO_OFFLOAD,
+    AUDIO_STREAMS_MAX,
+    DB_PATH,
+    RENDITIONS_ACCEL_PREFIX,
+    RENDITIONS_DIR,
+    TICKER_WINDOW_WIDTH,
+    WORDCLOUD_DIR,
+    WORDCLOUD_TOP_N,
+)
+
+media = Blueprint("media", __name__)
+
+# Audio files and renditions are large, and only replaced when an episode is reset:
+AUDIO_MAX_AGE = 7 * 24 * 3600
+
+# Streams of audio that the app sends itself, see AUDIO_STREAMS_MAX:
+_audio_streams = threading.BoundedSemaphore(AUDIO_STREAMS_MAX)
+
+# Word cloud files are named by the hash of their content, so they never change and
+# browsers may keep them for good:
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Entity counts only change when an episode is reprocessed; after this, browsers
+# revalidate with the ETag:
+WORDCLOUD_DATA_MAX_AGE = 3600
+
+
+@media.route("audio/<eid>")
+def serve_audio(eid):
+    """The episode's audio file.
+
+    Supports Range requests (seeking in the player) and conditional requests
+    (ETag/Last-Modified), and may be cached by browsers for a week. With
+    AUDIO_OFFLOAD set, only the headers are sent, and the proxy streams the file;
+    otherwise, requests beyond AUDIO_STREAMS_MAX concurrent streams get a 503.
+
+    The query parameter `q` selects a rendition: "low" for the low-bitrate file, or
+    "hls" for a redirect to the HLS playlist. Episodes without the rendition get the
+    original.
+    """
+    quality = request.args.get("q")
+    if quality in RENDITIONS and rendition_path(eid, quality).exists():
+        if quality == "hls":
+            return redirect(
+                url_for(".serve_hls", eid=eid, filename=RENDITIONS["hls"][0])
+            )
+        filename, mimetype = RENDITIONS[quality]
+        return _send_audio(
+            RENDITIONS_DIR, f"{eid}/{filename}", mimetype, RENDITIONS_ACCEL_PREFIX
+        )
+
+    return _send_audio(AUDIO_DIR, f"{eid}.mp3", "audio/mpeg", AUDIO_ACCEL_PREFIX)
+
+
+@media.route("audio/<eid>/hls/<filename>")
+def serve_hls(eid, filename):
+    """HLS playlist and segments of the episode's low-bitrate rendition."""
+    if filename.endswith(".m3u8"):
+        mimetype = RENDITIONS["hls"][1]
+    else:
+        mimetype = "video/mp2t"
+
+    return _send_audio(
+        RENDITIONS_DIR, f"{eid}/{filename}", mimetype, RENDITIONS_ACCEL_PREFIX
+    )
+
+
+def _send_audio(directory, filename, mimetype, accel_prefix):
+    if AUDIO_OFFLOAD == "x-accel-redirect":
+        path = safe_join(str(directory.resolve()), filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = accel_prefix + quote(filename)
+        response.cache_control.public = True
+        response.cache_control.max_age = AUDIO_MAX_AGE
+        return response
+
+    streaming = not AUDIO_OFFLOAD
+    if streaming and not _audio_streams.acquire(blocking=False):
+        response = Response("Too many audio streams", status=503)
+        response.retry_after = 5
+        return response
+
+    try:
+        # Werkzeug's rather than Flask's, which would take use_x_sendfile from the
+        # app config:
+        response = werkzeug.utils.send_from_directory(
+            directory.resolve(),
+            filename,
+            request.environ,
+            mimetype=mimetype,
+            max_age=AUDIO_MAX_AGE,
+            conditional=True,
+            etag=True,
+            use_x_sendfile=AUDIO_OFFLOAD == "x-sendfile",
+            response_class=current_app.response_class,
+        )
+    except BaseException:
+        if streaming:
+            _audio_streams.release()
+        raise
+
+    if streaming:
+        _call_on_close(response, _audio_streams.release)
+    return response
+
+
+def _call_on_close(response, callback):
+    """Have the server call `callback` once it is done with the response, i.e. the
+    file is sent or the client is gone.
+
+    Files are passed through to the server as they are, so that it may use
+    sendfile(); it then closes the file wrapper rather than the response.
+    """
+    body = response.response
+    if not response.direct_passthrough or not hasattr(body, "close"):
+        response.call_on_close(callback)
+        return
+
+    close = body.close
+
+    def close_body():
+        try:
+            close()
+        finally:
+            callback()
+
+    body.close = close_body
+
+
+@media.route("wordclouds/<filename>")
+def serve_wordcloud(filename):
+    response = send_from_directory(
+        WORDCLOUD_DIR.resolve(), filename, max_age=IMMUTABLE_MAX_AGE, etag=False
+    )
+    response.cache_control.immutable = True
+
+    return response
+
+
+@media.route("wordcloud-data/<eid>")
+def serve_wordcloud_data(eid):
+    """The episode's most frequent named entities as a JSON list of [name, count]."""
+    # A connection per request, as the server's threads can't share one:
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        if not is_done(conn, eid, STAGE_NAMED_ENTITY_TYPES):
+            abort(404)
+        entities = top_named_entities(conn, eid, WORDCLOUD_TOP_N)
+
+    response = jsonify(entities)
+    response.cache_control.public = True
+    response.cache_control.max_age = WORDCLOUD_DATA_MAX_AGE
+    response.add_etag()
+
+    return response.make_conditional(request)
+
+
+@media.route("ticker/<eid>/<int:window_width>")
+def serve_ticker(eid, window_width):
+    """The episode's ticker dict as JSON.
+
+    Tickers are precomputed by the stats pipeline, for the window width set in
+    config.py only; one that is missing is computed and stored on first request, once
+    the episode's named entities are. Browsers revalidate with the ETag on every
+    request, so a ticker is only downloaded again if it has changed.
+    """
+    if window_width != TICKER_WINDOW_WIDTH:
+        abort(404)
+
+    payload = None
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        etag = ticker_etag(conn, eid, window_width)
+        if etag is None:
+            etag, payload = _store_ticker(conn, eid, window_width)
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        if payload is None:
+            try:
+                payload = _ticker_payload(eid, window_width, etag)
+            except KeyError:
+                # Deleted or replaced since, as the episode is being reprocessed:
+                with closing(sqlite3.connect(DB_PATH)) as conn:
+                    etag, payload = _store_ticker(conn, eid, window_width)
+        if "gzip" in request.accept_encodings:
+            response = Response(payload, mimetype="application/json")
+            response.content_encoding = "gzip"
+        else:
+            response = Response(gzip.decompress(payload), mimetype="application/json")
+
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.no_cache = True
+
+    return response
+
+
+def _store_ticker(conn, eid, window_width):
+    """Compute and store the episode's ticker, and return its ETag and payload."""
+    # Otherwise an empty ticker would be stored, and the pipeline would skip the
+    # episode as done:
+    if not is_done(conn, eid, STAGE_NAMED_ENTITY_TOKENS):
+        abort(404)
+    payload = get_ticker_payload(eid, window_width)
+    with conn:
+        etag = insert_ticker_payload(conn, eid, window_width, payload)
+
+    return etag, payload
+
+
+@lru_cache(maxsize=64)
+def _ticker_payload(eid: str, window_width: int, etag: str) -> bytes:
+    # The etag is part of the cache key, so that a recomputed ticker isn't served
+    # from the cache.
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        payload = ticker_payload(conn, eid, window_width, etag)
+    # Raised rather than returned, so that the cache doesn't keep the miss:
+    if payload is None:
+        raise KeyError((eid, window_width, etag))
+    return payload
@@ -1,10 +1,16 @@
 from typing import List
+import bisect
+import gzip
+import heapq
+import json
 import sqlite3
 
 from config import DB_PATH
 
 
 class Appearance:
+    __slots__ = ("term", "apid", "start", "end", "width")
+
     def __init__(
         self,
         term,
@@ -105,13 +111,33 @@ class Appearance:
 
 
 class Ticker:
+    """Appearances of terms placed in lanes, so that they don't overlap.
+
+    Lane placement is the greedy interval partitioning: appearances added in order of
+    their start go to the lowest lane that is free by then. A heap of (end, lane) of
+    the busy lanes and a heap of free lane indices make this O(log lanes) per
+    appearance. Appearances added out of order fall back to scanning all lanes.
+
+    Appearances are also indexed by apid, and by start for time window queries.
+    """
 
     def __init__(self):
         self.lanes = []
         self.fps = 24
 
+        self._busy_lanes = []  # heap of (end of last appearance, lane index)
+        self._free_lanes = []  # heap of lane indices
+        self._last_start = float("-inf")
+        self._in_order = True
+
+        self._by_apid = {}
+        self._starts = []  # sorted starts of all appearances...
+        self._by_start = []  # ...and the appearances in that order
+        self._max_width = 0.0
+
     def add_lane(self):
         """Add a new lane for a term."""
+        heapq.heappush(self._free_lanes, len(self.lanes))
         self.lanes.append([])
 
     def add_appearance(self, appearance: Appearance):
@@ -122,27 +148,75 @@ class Ticker:
         such lane exists, create a new one. This method takes care
         that appearances do not overlap.
         """
-        # Try to place in existing lanes:
+        if appearance.start < self._last_start:
+            self._in_order = False
+        self._last_start = appearance.start
+
+        if self._in_order:
+            lane_idx = self._place_in_order(appearance)
+        else:
+            lane_idx = self._place_by_scan(appearance)
+
+        if lane_idx == len(self.lanes):
+            self.lanes.append([appearance])
+        else:
+            self.lanes[lane_idx].append(appearance)
+
+        self._index(appearance)
+
+    def _place_in_order(self, appearance: Appearance) -> int:
+        """Lane index for an appearance that starts no earlier than all previous."""
+        # Lanes whose last appearance has ended by now stay free for all later ones:
+        while self._busy_lanes and self._busy_lanes[0][0] <= appearance.start:
+            _, lane_idx = heapq.heappop(self._busy_lanes)
+            heapq.heappush(self._free_lanes, lane_idx)
+
+        if self._free_lanes:
+            lane_idx = heapq.heappop(self._free_lanes)
+        else:
+            lane_idx = len(self.lanes)
+
+        heapq.heappush(self._busy_lanes, (appearance.end, lane_idx))
+
+        return lane_idx
+
+    def _place_by_scan(self, appearance: Appearance) -> int:
+        """Lane index for an appearance in any order: the lowest suitable lane."""
         for i, lane in enumerate(self.lanes):
-            if lane == []:
-                self.lanes[i].append(appearance)
-                return
-            else:
-                this_lanes_last: Appearance = lane[-1]
-                if this_lanes_last.end <= appearance.start:
-                    self.lanes[i].append(appearance)
-                    return
-
-        # If no suitable lane found, create a new one
-        self.lanes.append([appearance])
+            if lane == [] or lane[-1].end <= appearance.start:
+                return i
+
+        return len(self.lanes)
+
+    def _index(self, appearance: Appearance):
+        self._by_apid[appearance.apid] = appearance
+        self._max_width = max(self._max_width, appearance.end - appearance.start)
+
+        if not self._starts or self._starts[-1] <= appearance.start:
+            self._starts.append(appearance.start)
+            self._by_start.append(appearance)
+        else:
+            i = bisect.bisect_right(self._starts, appearance.start)
+            self._starts.insert(i, appearance.start)
+            self._by_start.insert(i, appearance)
 
     def get_value(self, apid, t) -> float:
         """Get the value of an appearance at time t."""
-        for lane in self.lanes:
-            for appearance in lane:
-                if appearance.apid == apid:
-                    return appearance.frame(t)
-        return 0.0
+        appearance = self._by_apid.get(apid)
+        if appearance is None:
+            return 0.0
+        return appearance.frame(t)
+
+    def appearances_between(self, t0: float, t1: float) -> List[Appearance]:
+        """All appearances that overlap the time window [t0, t1], by start.
+
+        Only appearances starting within the longest appearance's width before t0
+        can reach into the window, so only these are looked at.
+        """
+        lo = bisect.bisect_left(self._starts, t0 - self._max_width)
+        hi = bisect.bisect_right(self._starts, t1)
+
+        return [a for a in self._by_start[lo:hi] if a.end >= t0]
 
     def to_dict(self):
         """Convert the ticker to a JSON-serializable dict."""
@@ -233,6 +307,12 @@ def ticker_from_timed_naments(named_entities: List[tuple], envelope_width: int =
     the tokens are placed as Appearances with the set envelope width, taking care of
     overlaps.
 
+    Overlapping appearances of the same token are merged into one envelope that
+    keeps the apid of the first. This is done on arrays: sorted by token and time,
+    a new envelope begins wherever the token changes or the running maximum of the
+    envelope ends falls short of the next start. Appearance objects are only made
+    for the merged envelopes.
+
     Args:
         named_entities (List[tuple]): list of tuples (token: str, center: float)
             [temporal center of the appearance]
@@ -240,51 +320,56 @@ def ticker_from_timed_naments(named_entities: List[tuple], envelope_width: int =
     Returns:
         Ticker: A Ticker object with lanes filled with Appearances.
     """
-    import pandas as pd
-
-    df = pd.DataFrame(named_entities, columns=["token", "center"])
-    df.sort_values(["token", "center"], inplace=True)
-    df["enum"] = df.groupby("token").cumcount()
-    df["apid"] = (
-        df.token.str.replace(" ", "_").str.lower() + "." + df["enum"].astype(str)
-    )
+    import numpy as np
 
-    appearances = []
+    ticker = Ticker()
+    if len(named_entities) == 0:
+        ticker.end = 0.0
+        return ticker
 
-    for type, grp in df.groupby("token"):
-        # In app_group, all tokens have an Appearance, even if they overlap temporally:
-        app_group = [
+    tokens, centers = zip(*named_entities)
+    token_names, token_codes = np.unique(
+        np.array(tokens, dtype=object), return_inverse=True
+    )
+    centers = np.asarray(centers, dtype=float)
+
+    # Sort by token, then time:
+    order = np.lexsort((centers, token_codes))
+    token_codes = token_codes[order]
+    starts = centers[order] - envelope_width / 2
+    ends = centers[order] + envelope_width / 2
+    n = len(order)
+
+    # Running number of each appearance within its token, for the apids:
+    new_token = np.ones(n, dtype=bool)
+    new_token[1:] = token_codes[1:] != token_codes[:-1]
+    token_first = np.maximum.accumulate(np.where(new_token, np.arange(n), 0))
+    enum = np.arange(n) - token_first
+
+    # Running maximum of the ends within each token. As the envelopes all have the
+    # same width, ends are sorted along with the centers, so the running maximum at
+    # i - 1 is simply ends[i - 1]:
+    new_envelope = new_token.copy()
+    new_envelope[1:] |= ends[:-1] < starts[1:]
+
+    # Each envelope spans from its first appearance's start to its last one's end:
+    first = np.flatnonzero(new_envelope)
+    last = np.append(first[1:], n) - 1
+    env_starts = starts[first]
+    env_ends = ends[last]
+
+    ticker_order = np.argsort(env_starts, kind="stable")
+    for i in ticker_order.tolist():
+        j = first[i]
+        term = token_names[token_codes[j]]
+        ticker.add_appearance(
             Appearance(
-                term=type,
-                apid=row["apid"],
-                timestamp=row["center"],
-                width=envelope_width,
+                term=term,
+                apid=f"{term.replace(' ', '_').lower()}.{enum[j]}",
+                start=float(env_starts[i]),
+                end=float(env_ends[i]),
             )
-            for _, row in grp.iterrows()
-        ]
-        app_group.sort(key=lambda x: x.start)
-
-        # Merge overlapping appearances within the appearance group:
-        # Look at first and second appearance, if 1st is untouched; send to
-        # result list; if 2nd overlaps with 1st, merge them and continue with the next
-        # appearance (which may also overlap with the merged one) until no more
-        # overlaps are found - send the merged appearance to the result list.
-        merged_group = []
-        current = app_group[0]
-        for nxt in app_group[1:]:
-            if current.end < nxt.start:
-                merged_group.append(current)
-                current = nxt
-            else:
-                current = Appearance.merge(current, nxt)
-        merged_group.append(current)
-        appearances.extend(merged_group)
-
-    appearances.sort(key=lambda x: x.start)
-
-    ticker = Ticker()
-    for appearance in appearances:
-        ticker.add_appearance(appearance)
+        )
 
     ticker.update_last_frame()
 
@@ -318,6 +403,23 @@ def get_ticker_dict(eid: str, window_width: int = 120) -> dict:
     ticker = ticker_from_timed_naments(naments, envelope_width=window_width)
     return ticker.to_dict()
 
+
+def get_ticker_payload(eid: str, window_width: int = 120) -> bytes:
+    """Get the ticker dict of an episode as gzipped, compact JSON, ready to be
+    stored and sent as is.
+
+    Args:
+        eid (str): Episode ID
+        window_width (int): Width of the visible window in seconds
+
+    Returns:
+        bytes: gzip-compressed JSON of the ticker dict
+    """
+    ticker_json = json.dumps(get_ticker_dict(eid, window_width), separators=(",", ":"))
+
+    # mtime=0, so that equal tickers give equal bytes (and ETags):
+    return gzip.compress(ticker_json.encode("utf-8"), compresslevel=9, mtime=0)
+
 def plot_ticker_at_time(
     ticker_dict: dict, time_code: float, window_width: int = 120
 ) -> "go.Figure":
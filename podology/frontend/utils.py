@@ -107,3 +107,25 @@ def format_duration(duration: float) -> str:
     if hours:
         return f"{hours}:{minutes:02}:{seconds:02}"
     return f"{minutes}:{seconds:02}"
+
+
+def format_eta(seconds: float) -> str:
+    """
+    Format a span of time in seconds roughly, as in "2 d 5 h", "3 h 20 min" or "7 min".
+    """
+    days, remainder = divmod(int(seconds), 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes = remainder // 60
+    if days:
+        return f"{days} d {hours} h"
+    if hours:
+        return f"{hours} h {minutes} min"
+    return f"{minutes} min"
+
+
+def format_job_statuses(statuses: dict[str, str]) -> str:
+    """
+    Format the status of an episode's job on each queue, as in "download: done,
+    transcribe: processing"; empty if no job was ever enqueued.
+    """
+    return ", ".join(f"{stage}: {status.lower()}" for stage, status in statuses.items())
@@ -16,6 +16,7 @@ from elastic_transport import ConnectionError
 
 from config import PROJECT_NAME, TRANSCRIPT_DIR, CHUNKS_DIR, EMBEDDER_ARGS, ES_PORT
 from podology.data.Episode import Episode
+from podology.data.transcript_io import read_transcript
 from podology.search.utils import make_index_name
 
 
@@ -132,7 +133,7 @@ def index_segment(episode: Episode) -> None:
         return
 
     # Index segments
-    segments = json.load(open(TRANSCRIPT_DIR / f"{episode.eid}.json", "r"))["segments"]
+    segments = read_transcript(TRANSCRIPT_DIR / f"{episode.eid}.json")["segments"]
     logger.debug(f"{episode.eid}: Indexing segmentsin Elasticsearch")
 
     actions = []
@@ -0,0 +1,834 @@
+"""
+Schema and bookkeeping of the stats database.
+
+The stats tables live in the same SQLite file as the episode table (DB_PATH). Their
+schema is versioned through SQLite's `user_version` pragma: each entry in MIGRATIONS
+brings the database from version i to i + 1 and is applied exactly once, inside a
+single transaction together with the version bump.
+
+Which pipeline stage is done for which episode is recorded in `stage_status`, so that
+"already done?" checks are primary key lookups instead of scans over the data tables.
+
+Finally, the module is the data access layer for the pipeline's workers: each process
+(and each thread in it) holds one connection (see `connection()`), and queries are
+module-level constants with placeholders, so sqlite3's per-connection statement cache
+prepares each of them only once per process.
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+from loguru import logger
+
+from config import DB_PATH
+
+# Pipeline stages tracked in stage_status, with the version of their current
+# implementation. Bump a version to have the stage redone for all episodes.
+STAGE_NAMED_ENTITY_TOKENS = "named_entity_tokens"
+STAGE_NAMED_ENTITY_TYPES = "named_entity_types"
+STAGE_TYPE_PROXIMITY = "type_proximity"
+
+STAGE_VERSIONS = {
+    STAGE_NAMED_ENTITY_TOKENS: 1,
+    STAGE_NAMED_ENTITY_TYPES: 1,
+    STAGE_TYPE_PROXIMITY: 1,
+}
+
+# MIGRATIONS[i] upgrades the schema from version i to i + 1. Never edit a migration
+# that has been shipped; append a new one instead.
+MIGRATIONS = [
+    # 1: The original, unkeyed tables.
+    (
+        """
+        CREATE TABLE IF NOT EXISTS word_count (
+            eid TEXT PRIMARY KEY,
+            count INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS named_entity_tokens (
+            eid TEXT,
+            timestamp FLOAT,
+            token TEXT
+        )
+        """,
+        # Readers filter tokens by episode and mostly group by token:
+        """
+        CREATE INDEX IF NOT EXISTS idx_named_entity_tokens_eid_token
+        ON named_entity_tokens (eid, token)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS named_entity_types (
+            eid TEXT,
+            type TEXT,
+            count INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS type_proximity_episode (
+            eid TEXT,
+            type TEXT,
+            other_type TEXT,
+            proximity REAL
+        )
+        """,
+    ),
+    # 2: Primary keys on the per-episode tables, and the stage_status table,
+    # backfilled from what the data tables already contain.
+    (
+        """
+        CREATE TABLE named_entity_types_new (
+            eid TEXT NOT NULL,
+            type TEXT NOT NULL,
+            count INTEGER,
+            PRIMARY KEY (eid, type)
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO named_entity_types_new (eid, type, count)
+        SELECT eid, type, count FROM named_entity_types
+        """,
+        "DROP TABLE named_entity_types",
+        "ALTER TABLE named_entity_types_new RENAME TO named_entity_types",
+        """
+        CREATE TABLE type_proximity_episode_new (
+            eid TEXT NOT NULL,
+            type TEXT NOT NULL,
+            other_type TEXT NOT NULL,
+            proximity REAL,
+            PRIMARY KEY (eid, type, other_type)
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO type_proximity_episode_new
+            (eid, type, other_type, proximity)
+        SELECT eid, type, other_type, proximity FROM type_proximity_episode
+        """,
+        "DROP TABLE type_proximity_episode",
+        "ALTER TABLE type_proximity_episode_new RENAME TO type_proximity_episode",
+        """
+        CREATE TABLE stage_status (
+            eid TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            finished_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (stage, eid)
+        )
+        """,
+        f"""
+        INSERT OR IGNORE INTO stage_status (eid, stage, version)
+        SELECT DISTINCT eid, '{STAGE_NAMED_ENTITY_TOKENS}', 1 FROM named_entity_tokens
+        """,
+        f"""
+        INSERT OR IGNORE INTO stage_status (eid, stage, version)
+        SELECT DISTINCT eid, '{STAGE_NAMED_ENTITY_TYPES}', 1 FROM named_entity_types
+        """,
+        f"""
+        INSERT OR IGNORE INTO stage_status (eid, stage, version)
+        SELECT DISTINCT eid, '{STAGE_TYPE_PROXIMITY}', 1 FROM type_proximity_episode
+        """,
+    ),
+    # 3: Corpus-wide aggregate of type proximity, one row per unordered type pair
+    # (type < other_type), backfilled from the per-episode table. Per-episode
+    # proximities are logs of sums of 1/d², so the aggregate sums their exponents.
+    (
+        """
+        CREATE TABLE type_proximity_corpus (
+            type TEXT NOT NULL,
+            other_type TEXT NOT NULL,
+            score_sum REAL NOT NULL,
+            episode_count INTEGER NOT NULL,
+            proximity_max REAL NOT NULL,
+            PRIMARY KEY (type, other_type)
+        )
+        """,
+        # The primary key serves lookups by `type`; this one serves `other_type`:
+        """
+        CREATE INDEX idx_type_proximity_corpus_other_type
+        ON type_proximity_corpus (other_type)
+        """,
+        """
+        INSERT INTO type_proximity_corpus
+            (type, other_type, score_sum, episode_count, proximity_max)
+        SELECT
+            MIN(type, other_type) AS a,
+            MAX(type, other_type) AS b,
+            SUM(EXP(proximity)),
+            COUNT(*),
+            MAX(proximity)
+        FROM type_proximity_episode
+        GROUP BY a, b
+        """,
+    ),
+    # 4: Word cloud image of each episode. Images are content-addressed: `digest`
+    # hashes the entity counts and render settings, and names the file.
+    (
+        """
+        CREATE TABLE wordclouds (
+            eid TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            filename TEXT NOT NULL
+        )
+        """,
+    ),
+    # 5: Precomputed ticker dicts of the scroll animation, as gzipped JSON, per
+    # episode and window width. `etag` is a hash of the payload.
+    (
+        """
+        CREATE TABLE ticker_payloads (
+            eid TEXT NOT NULL,
+            window_width INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            etag TEXT NOT NULL,
+            PRIMARY KEY (eid, window_width)
+        )
+        """,
+    ),
+    # 6: Loudness envelope of each episode's audio at a few resolutions (`bins` over
+    # the whole episode): peak and RMS level per bin, as uint8 arrays.
+    (
+        """
+        CREATE TABLE audio_envelopes (
+            eid TEXT NOT NULL,
+            bins INTEGER NOT NULL,
+            duration REAL NOT NULL,
+            peak BLOB NOT NULL,
+            rms BLOB NOT NULL,
+            PRIMARY KEY (eid, bins)
+        )
+        """,
+    ),
+    # 7: Jobs of the download, transcribe and postprocess queues, one row per
+    # episode and queue, with their status and when they were enqueued, started and
+    # finished, as Julian days (see podology.data.transcribers.transcription_worker).
+    (
+        """
+        CREATE TABLE job_stages (
+            eid TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            enqueued_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            PRIMARY KEY (stage, eid)
+        )
+        """,
+    ),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+SELECT_TOKEN_TIMESTAMPS = """
+    SELECT token, timestamp
+    FROM named_entity_tokens
+    WHERE eid = ?
+    ORDER BY token, timestamp
+"""
+SELECT_NAMED_ENTITY_COUNTS = """
+    SELECT type, count
+    FROM named_entity_types
+    WHERE eid = ?
+"""
+DELETE_NAMED_ENTITY_TOKENS = """
+    DELETE FROM named_entity_tokens
+    WHERE eid = ?
+"""
+INSERT_NAMED_ENTITY_TOKEN = """
+    INSERT INTO named_entity_tokens (eid, timestamp, token)
+    VALUES (?, ?, ?)
+"""
+DELETE_NAMED_ENTITY_TYPES = """
+    DELETE FROM named_entity_types
+    WHERE eid = ?
+"""
+INSERT_NAMED_ENTITY_TYPE = """
+    INSERT INTO named_entity_types (eid, type, count)
+    VALUES (?, ?, ?)
+"""
+SELECT_TYPE_PROXIMITY = """
+    SELECT type, other_type, proximity
+    FROM type_proximity_episode
+    WHERE eid = ?
+"""
+DELETE_TYPE_PROXIMITY = """
+    DELETE FROM type_proximity_episode
+    WHERE eid = ?
+"""
+INSERT_TYPE_PROXIMITY = """
+    INSERT INTO type_proximity_episode (eid, type, other_type, proximity)
+    VALUES (?, ?, ?, ?)
+"""
+UPSERT_TYPE_PROXIMITY_CORPUS = """
+    INSERT INTO type_proximity_corpus
+        (type, other_type, score_sum, episode_count, proximity_max)
+    VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT (type, other_type) DO UPDATE SET
+        score_sum = score_sum + excluded.score_sum,
+        episode_count = episode_count + 1,
+        proximity_max = MAX(proximity_max, excluded.proximity_max)
+"""
+# Takes one episode's score out of a pair's aggregate, after its row is deleted from
+# the per-episode table, which the maximum is then taken over:
+SUBTRACT_TYPE_PROXIMITY_CORPUS = """
+    UPDATE type_proximity_corpus
+    SET
+        score_sum = score_sum - :score,
+        episode_count = episode_count - 1,
+        proximity_max = COALESCE(
+            (
+                SELECT MAX(proximity)
+                FROM type_proximity_episode
+                WHERE (type = :type AND other_type = :other_type)
+                    OR (type = :other_type AND other_type = :type)
+            ),
+            proximity_max
+        )
+    WHERE type = :type AND other_type = :other_type
+"""
+DELETE_EMPTY_TYPE_PROXIMITY_CORPUS = """
+    DELETE FROM type_proximity_corpus
+    WHERE episode_count <= 0
+"""
+SELECT_TOP_NEIGHBOURS = """
+    SELECT other_type, score_sum, episode_count, proximity_max
+    FROM type_proximity_corpus
+    WHERE type = ?
+    UNION ALL
+    SELECT type, score_sum, episode_count, proximity_max
+    FROM type_proximity_corpus
+    WHERE other_type = ?
+    ORDER BY score_sum DESC
+    LIMIT ?
+"""
+
+SELECT_TOP_NAMED_ENTITIES = """
+    SELECT type, count
+    FROM named_entity_types
+    WHERE eid = ?
+    ORDER BY count DESC, type
+    LIMIT ?
+"""
+SELECT_WORDCLOUD = """
+    SELECT digest, filename
+    FROM wordclouds
+    WHERE eid = ?
+"""
+UPSERT_WORDCLOUD = """
+    INSERT INTO wordclouds (eid, digest, filename)
+    VALUES (?, ?, ?)
+    ON CONFLICT (eid) DO UPDATE SET
+        digest = excluded.digest,
+        filename = excluded.filename
+"""
+COUNT_WORDCLOUD_FILENAME = """
+    SELECT COUNT(*)
+    FROM wordclouds
+    WHERE filename = ?
+"""
+
+SELECT_TICKER_ETAG = """
+    SELECT etag
+    FROM ticker_payloads
+    WHERE eid = ? AND window_width = ?
+"""
+SELECT_TICKER_PAYLOAD = """
+    SELECT payload
+    FROM ticker_payloads
+    WHERE eid = ? AND window_width = ? AND etag = ?
+"""
+SELECT_TICKER_EIDS = """
+    SELECT eid
+    FROM ticker_payloads
+    WHERE window_width = ?
+"""
+UPSERT_TICKER_PAYLOAD = """
+    INSERT INTO ticker_payloads (eid, window_width, payload, etag)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (eid, window_width) DO UPDATE SET
+        payload = excluded.payload,
+        etag = excluded.etag
+"""
+DELETE_TICKER_PAYLOADS = """
+    DELETE FROM ticker_payloads
+    WHERE eid = ?
+"""
+
+SELECT_ENVELOPE = """
+    SELECT peak, rms
+    FROM audio_envelopes
+    WHERE eid = ? AND bins = ?
+"""
+SELECT_ENVELOPE_EIDS = """
+    SELECT DISTINCT eid
+    FROM audio_envelopes
+"""
+UPSERT_ENVELOPE = """
+    INSERT INTO audio_envelopes (eid, bins, duration, peak, rms)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (eid, bins) DO UPDATE SET
+        duration = excluded.duration,
+        peak = excluded.peak,
+        rms = excluded.rms
+"""
+
+UPSERT_JOB_ENQUEUED = """
+    INSERT INTO job_stages (eid, stage, status, enqueued_at)
+    VALUES (?, ?, 'QUEUED', julianday('now'))
+    ON CONFLICT (stage, eid) DO UPDATE SET
+        status = 'QUEUED',
+        enqueued_at = excluded.enqueued_at,
+        started_at = NULL,
+        finished_at = NULL
+"""
+UPSERT_JOB_STARTED = """
+    INSERT INTO job_stages (eid, stage, status, started_at)
+    VALUES (?, ?, 'PROCESSING', julianday('now'))
+    ON CONFLICT (stage, eid) DO UPDATE SET
+        status = 'PROCESSING',
+        started_at = excluded.started_at,
+        finished_at = NULL
+"""
+UPDATE_JOB_FINISHED = """
+    UPDATE job_stages
+    SET status = ?, finished_at = julianday('now')
+    WHERE eid = ? AND stage = ?
+"""
+SELECT_JOB_STATUSES = """
+    SELECT stage, status
+    FROM job_stages
+    WHERE eid = ?
+    ORDER BY COALESCE(enqueued_at, started_at)
+"""
+# Per stage, over the jobs finished in the last ? days: number of jobs (and failed
+# ones), mean time waiting in the queue and running in seconds, and the hours of
+# audio processed:
+SELECT_STAGE_THROUGHPUT = """
+    SELECT
+        j.stage,
+        COUNT(*),
+        SUM(j.status = 'ERROR'),
+        AVG(j.started_at - j.enqueued_at) * 86400,
+        AVG(j.finished_at - j.started_at) * 86400,
+        (MAX(j.finished_at) - MIN(j.started_at)) * 86400,
+        SUM(CASE WHEN j.status = 'DONE' THEN e.duration ELSE 0 END) / 3600
+    FROM job_stages j
+    LEFT JOIN episodes e ON e.eid = j.eid
+    WHERE j.finished_at >= julianday('now') - ?
+    GROUP BY j.stage
+    ORDER BY j.stage
+"""
+# Hours of audio of the episodes queued for transcription, and of all episodes not
+# transcribed yet:
+SELECT_BACKLOG = """
+    SELECT
+        SUM(CASE WHEN transcript_status IN ('QUEUED', 'PROCESSING')
+            THEN duration ELSE 0 END) / 3600,
+        SUM(CASE WHEN transcript_status IS NOT 'DONE' THEN duration ELSE 0 END) / 3600
+    FROM episodes
+"""
+
+# One connection per process and thread, keyed by PID so that forked pool workers
+# don't share the parent's connection, and by thread so that the dashboard's request
+# threads don't share one (sqlite3 connections refuse use from other threads):
+_connections: dict[tuple[int, int], sqlite3.Connection] = {}
+
+
+def migrate(db_path: Path = DB_PATH) -> int:
+    """Bring the stats schema in `db_path` up to SCHEMA_VERSION.
+
+    Pending migrations are applied in one IMMEDIATE transaction, so concurrent
+    processes (dashboard, RQ workers) cannot apply the same migration twice.
+
+    :param db_path: Path to the SQLite database.
+    :return: The schema version after migrating.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Not every SQLite build has the math functions that migrations use:
+    conn.create_function("exp", 1, math.exp, deterministic=True)
+    try:
+        # WAL lets readers proceed while a worker writes:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+        if version >= SCHEMA_VERSION:
+            conn.execute("COMMIT")
+            return version
+
+        try:
+            pending = enumerate(MIGRATIONS[version:], start=version + 1)
+            for target, statements in pending:
+                logger.info(f"Migrating stats database to schema version {target}")
+                for statement in statements:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+        return SCHEMA_VERSION
+
+    finally:
+        conn.close()
+
+
+def done_eids(conn: sqlite3.Connection, stage: str) -> set[str]:
+    """Return the IDs of all episodes for which `stage` is done in its current
+    version."""
+    rows = conn.execute(
+        "SELECT eid FROM stage_status WHERE stage = ? AND version >= ?",
+        (stage, STAGE_VERSIONS[stage]),
+    )
+    return {row[0] for row in rows}
+
+
+def is_done(conn: sqlite3.Connection, eid: str, stage: str) -> bool:
+    """Check whether `stage` is done for episode `eid` in its current version."""
+    cursor = conn.execute(
+        "SELECT 1 FROM stage_status WHERE stage = ? AND eid = ? AND version >= ?",
+        (stage, eid, STAGE_VERSIONS[stage]),
+    )
+    return cursor.fetchone() is not None
+
+
+def mark_done(conn: sqlite3.Connection, eid: str, stage: str) -> None:
+    """Record that `stage` has been completed for episode `eid`.
+
+    Call this in the same transaction that writes the stage's results.
+    """
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO stage_status (eid, stage, version, finished_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        """,
+        (eid, stage, STAGE_VERSIONS[stage]),
+    )
+
+
+def connection() -> sqlite3.Connection:
+    """Return this thread's connection to the stats database.
+
+    The connection is opened on first use and kept for the lifetime of the process,
+    so its statement cache survives between calls. Use it as a context manager
+    (`with connection() as conn:`) to commit or roll back a unit of work.
+    """
+    key = (os.getpid(), threading.get_ident())
+    conn = _connections.get(key)
+    if conn is None:
+        # Parallel workers write to the same file; wait for locks instead of failing:
+        conn = sqlite3.connect(DB_PATH, timeout=60, cached_statements=256)
+        _connections[key] = conn
+
+    return conn
+
+
+def token_timestamps(
+    conn: sqlite3.Connection, eid: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """Read the named entity tokens of an episode.
+
+    :param conn: Connection to the stats database.
+    :param eid: Episode ID.
+    :return: Two aligned arrays, tokens (str) and their timestamps (float), sorted by
+        token and then timestamp.
+    """
+    rows = conn.execute(SELECT_TOKEN_TIMESTAMPS, (eid,)).fetchall()
+    if not rows:
+        return np.array([], dtype=str), np.array([], dtype=float)
+
+    tokens, timestamps = zip(*rows)
+
+    return np.array(tokens, dtype=str), np.array(timestamps, dtype=float)
+
+
+def named_entity_counts(conn: sqlite3.Connection, eid: str) -> dict[str, int]:
+    """Read the number of occurrences of each named entity in an episode."""
+    return dict(conn.execute(SELECT_NAMED_ENTITY_COUNTS, (eid,)).fetchall())
+
+
+def insert_named_entity_tokens(
+    conn: sqlite3.Connection, eid: str, timed_entities: Iterable[tuple[str, float]]
+) -> None:
+    """Store the named entity tokens of an episode, replacing any it had.
+
+    :param timed_entities: Tuples (entity_name, timestamp).
+    """
+    conn.execute(DELETE_NAMED_ENTITY_TOKENS, (eid,))
+    conn.executemany(
+        INSERT_NAMED_ENTITY_TOKEN,
+        ((eid, float(ts), entity_name) for entity_name, ts in timed_entities),
+    )
+
+
+def insert_named_entity_types(
+    conn: sqlite3.Connection, eid: str, types: Iterable[str], counts: Iterable[int]
+) -> None:
+    """Store the per-type counts of named entities of an episode, replacing any it
+    had."""
+    conn.execute(DELETE_NAMED_ENTITY_TYPES, (eid,))
+    conn.executemany(
+        INSERT_NAMED_ENTITY_TYPE,
+        ((eid, t, int(c)) for t, c in zip(types, counts)),
+    )
+
+
+def insert_type_proximity(
+    conn: sqlite3.Connection, eid: str, edges: Iterable[tuple[str, str, float]]
+) -> None:
+    """Store the type proximity scores of an episode, replacing any it had.
+
+    The scores are also folded into the corpus-wide aggregate, after taking the
+    episode's previous ones out of it; call this in the transaction that marks the
+    stage done. Proximities are logs of sums of 1/d² over token pairs; the aggregate
+    adds up the sums.
+
+    :param edges: Tuples (type, other_type, proximity).
+    """
+    delete_type_proximity(conn, eid)
+
+    edges = [(t, o, float(p)) for t, o, p in edges]
+    conn.executemany(INSERT_TYPE_PROXIMITY, ((eid, t, o, p) for t, o, p in edges))
+    conn.executemany(
+        UPSERT_TYPE_PROXIMITY_CORPUS,
+        ((min(t, o), max(t, o), math.exp(p), p) for t, o, p in edges),
+    )
+
+
+def delete_type_proximity(conn: sqlite3.Connection, eid: str) -> None:
+    """Delete the type proximity scores of an episode, and take them out of the
+    corpus-wide aggregate."""
+    previous = conn.execute(SELECT_TYPE_PROXIMITY, (eid,)).fetchall()
+    conn.execute(DELETE_TYPE_PROXIMITY, (eid,))
+    conn.executemany(
+        SUBTRACT_TYPE_PROXIMITY_CORPUS,
+        (
+            {"type": min(t, o), "other_type": max(t, o), "score": math.exp(p)}
+            for t, o, p in previous
+        ),
+    )
+    conn.execute(DELETE_EMPTY_TYPE_PROXIMITY_CORPUS)
+
+
+def top_neighbours(
+    conn: sqlite3.Connection, entity: str, k: int = 10
+) -> list[tuple[str, float, int, float]]:
+    """Return the entities most closely related to `entity` across the corpus.
+
+    Only reads the aggregate rows of `entity` (two index lookups), however many
+    episodes there are.
+
+    :param conn: Connection to the stats database.
+    :param entity: A named entity (type) as stored in named_entity_types.
+    :param k: Number of neighbours to return.
+    :return: Up to k tuples (neighbour, proximity, episode_count, proximity_max), by
+        descending proximity. `proximity` is over the whole corpus, on the same log
+        scale as the per-episode ones, whose maximum is `proximity_max`.
+    """
+    rows = conn.execute(SELECT_TOP_NEIGHBOURS, (entity, entity, k))
+    return [
+        (neighbour, math.log(score_sum), episode_count, proximity_max)
+        for neighbour, score_sum, episode_count, proximity_max in rows
+    ]
+
+
+def top_named_entities(
+    conn: sqlite3.Connection, eid: str, n: int
+) -> list[tuple[str, int]]:
+    """Return the n most frequent named entities of an episode with their counts."""
+    return conn.execute(SELECT_TOP_NAMED_ENTITIES, (eid, n)).fetchall()
+
+
+def wordcloud(conn: sqlite3.Connection, eid: str) -> tuple[str, str] | None:
+    """Return (digest, filename) of the current word cloud of an episode, if any."""
+    return conn.execute(SELECT_WORDCLOUD, (eid,)).fetchone()
+
+
+def set_wordcloud(
+    conn: sqlite3.Connection, eid: str, digest: str, filename: str
+) -> str | None:
+    """Record the word cloud image of an episode.
+
+    :return: The filename of the episode's previous image if no episode uses it any
+        longer, so that the caller can delete it.
+    """
+    previous = wordcloud(conn, eid)
+    conn.execute(UPSERT_WORDCLOUD, (eid, digest, filename))
+
+    if previous is None or previous[1] == filename:
+        return None
+    if conn.execute(COUNT_WORDCLOUD_FILENAME, (previous[1],)).fetchone()[0]:
+        return None
+
+    return previous[1]
+
+
+def wordcloud_files(conn: sqlite3.Connection) -> dict[str, str]:
+    """Map each episode's eid to the filename of its word cloud.
+
+    Returns an empty dict if the schema has not been migrated yet, as callers outside
+    the pipeline may ask before it first runs.
+    """
+    try:
+        return dict(conn.execute("SELECT eid, filename FROM wordclouds").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def ticker_eids(conn: sqlite3.Connection, window_width: int) -> set[str]:
+    """Return the eids of all episodes with a stored ticker for this window width."""
+    return {row[0] for row in conn.execute(SELECT_TICKER_EIDS, (window_width,))}
+
+
+def ticker_etag(conn: sqlite3.Connection, eid: str, window_width: int) -> str | None:
+    """Return the ETag of an episode's stored ticker, if there is one."""
+    row = conn.execute(SELECT_TICKER_ETAG, (eid, window_width)).fetchone()
+    return None if row is None else row[0]
+
+
+def ticker_payload(
+    conn: sqlite3.Connection, eid: str, window_width: int, etag: str
+) -> bytes | None:
+    """Return the gzipped JSON of an episode's stored ticker with the given ETag, if
+    it is (still) there."""
+    row = conn.execute(SELECT_TICKER_PAYLOAD, (eid, window_width, etag)).fetchone()
+    return None if row is None else row[0]
+
+
+def insert_ticker_payload(
+    conn: sqlite3.Connection, eid: str, window_width: int, payload: bytes
+) -> str:
+    """Store the gzipped JSON of an episode's ticker.
+
+    :return: The ETag of the payload.
+    """
+    etag = hashlib.sha1(payload).hexdigest()
+    conn.execute(UPSERT_TICKER_PAYLOAD, (eid, window_width, payload, etag))
+
+    return etag
+
+
+def delete_ticker_payloads(conn: sqlite3.Connection, eid: str) -> None:
+    """Delete the stored tickers of an episode, of all window widths."""
+    conn.execute(DELETE_TICKER_PAYLOADS, (eid,))
+
+
+def envelope_eids(conn: sqlite3.Connection) -> set[str]:
+    """Return the eids of all episodes with a stored audio envelope."""
+    return {row[0] for row in conn.execute(SELECT_ENVELOPE_EIDS)}
+
+
+def audio_envelope(
+    conn: sqlite3.Connection, eid: str, bins: int
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """Return an episode's audio envelope at this resolution, if there is one.
+
+    :return: Peak and RMS level per bin, from 0 to 1.
+    """
+    row = conn.execute(SELECT_ENVELOPE, (eid, bins)).fetchone()
+    if row is None:
+        return None
+
+    peak, rms = (np.frombuffer(blob, dtype=np.uint8) / 255 for blob in row)
+    return peak, rms
+
+
+def insert_audio_envelope(
+    conn: sqlite3.Connection,
+    eid: str,
+    duration: float,
+    levels: dict[int, tuple[np.ndarray, np.ndarray]],
+) -> None:
+    """Store an episode's audio envelope.
+
+    :param duration: Duration of the decoded audio in seconds.
+    :param levels: Peak and RMS level per bin (from 0 to 1) by number of bins.
+    """
+    conn.executemany(
+        UPSERT_ENVELOPE,
+        [
+            (eid, bins, duration, _quantize(peak), _quantize(rms))
+            for bins, (peak, rms) in levels.items()
+        ],
+    )
+
+
+def _quantize(levels: np.ndarray) -> bytes:
+    return np.round(np.clip(levels, 0, 1) * 255).astype(np.uint8).tobytes()
+
+
+def job_enqueued(conn: sqlite3.Connection, eid: str, stage: str) -> None:
+    conn.execute(UPSERT_JOB_ENQUEUED, (eid, stage))
+
+
+def job_started(conn: sqlite3.Connection, eid: str, stage: str) -> None:
+    conn.execute(UPSERT_JOB_STARTED, (eid, stage))
+
+
+def job_finished(conn: sqlite3.Connection, eid: str, stage: str, ok: bool) -> None:
+    conn.execute(UPDATE_JOB_FINISHED, ("DONE" if ok else "ERROR", eid, stage))
+
+
+def job_statuses(conn: sqlite3.Connection, eid: str) -> dict[str, str]:
+    """Return the status of the episode's job on each queue, by queue name."""
+    return dict(conn.execute(SELECT_JOB_STATUSES, (eid,)).fetchall())
+
+
+def stage_throughput(conn: sqlite3.Connection, days: float = 7) -> list[dict]:
+    """Throughput of each queue over the jobs that finished in the last `days` days.
+
+    :return: One dict per queue, with the number of jobs and failed jobs, the mean
+      seconds spent waiting and running, the seconds from the first start to the last
+      finish, and the hours of audio of the successful jobs.
+    """
+    keys = (
+        "stage",
+        "jobs",
+        "failed",
+        "mean_wait_s",
+        "mean_run_s",
+        "span_s",
+        "audio_h",
+    )
+    rows = conn.execute(SELECT_STAGE_THROUGHPUT, (days,)).fetchall()
+
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def backlog_projection(
+    conn: sqlite3.Connection, days: float = 7, stage: str = "transcribe"
+) -> dict:
+    """Project when the transcription backlog is through, at the rate of the last days.
+
+    The rate is the hours of audio that `stage` got through in the last `days` days,
+    per hour from its first job's start to its last job's finish.
+
+    :return: Hours of audio queued and not transcribed yet ("queued_h",
+      "remaining_h"), hours of audio per hour ("rate"), and the seconds it takes to
+      get through each at that rate ("queued_eta_s", "remaining_eta_s"), which are
+      None while there is no rate to go by.
+    """
+    queued_h, remaining_h = conn.execute(SELECT_BACKLOG).fetchone()
+    row = next((r for r in stage_throughput(conn, days) if r["stage"] == stage), None)
+
+    rate = None
+    if row is not None and row["audio_h"] and row["span_s"]:
+        rate = row["audio_h"] / (row["span_s"] / 3600)
+
+    def eta(hours):
+        return hours / rate * 3600 if rate else None
+
+    return {
+        "queued_h": queued_h or 0,
+        "remaining_h": remaining_h or 0,
+        "rate": rate,
+        "queued_eta_s": eta(queued_h or 0),
+        "remaining_eta_s": eta(remaining_h or 0),
+    }
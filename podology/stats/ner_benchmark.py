@@ -0,0 +1,158 @@
+"""
+Offline comparison of the NER backends on already transcribed episodes.
+
+NLTKBackend is taken as the reference. For each sampled episode, a GazetteerBackend is
+built from the named entity tokens of all *other* episodes (so that the episode under
+test cannot leak its own names into the gazetteer), and both backends are run on the
+episode's segments. Reported are precision, recall and F1 of the gazetteer against the
+reference, matched on (entity name, first word index), and the throughput of both
+backends in words per second.
+
+Run from the project root after the stats pipeline has filled the database, e.g.
+
+    python -m podology.stats.ner_benchmark --episodes 5 --min-count 2
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+from typing import Optional
+
+from loguru import logger
+
+from podology.data.EpisodeStore import EpisodeStore
+from podology.data.Transcript import Transcript
+from podology.stats.nlp import (
+    GazetteerBackend,
+    NERBackend,
+    NLTKBackend,
+    get_stop_words,
+    segment_words,
+)
+
+
+def run_backend(
+    backend: NERBackend, segments: list[tuple[int, list[str]]]
+) -> tuple[set[tuple[str, int]], float]:
+    """
+    Run a backend on the segments of an episode.
+
+    :return: The set of (entity_name, word index) found, and the seconds it took.
+    """
+    stop_words = get_stop_words()
+    start = time.perf_counter()
+    found = set()
+    for first_wid, words in segments:
+        for entity_name, offset in backend.entities(words):
+            if entity_name.lower() not in stop_words:
+                found.add((entity_name, first_wid + offset))
+
+    return found, time.perf_counter() - start
+
+
+def scores(found: set, reference: set) -> tuple[float, float, float]:
+    """Precision, recall and F1 of `found` against `reference`."""
+    true_positives = len(found & reference)
+    precision = true_positives / len(found) if found else 0.0
+    recall = true_positives / len(reference) if reference else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    return precision, recall, f1
+
+
+def benchmark(
+    n_episodes: int = 5,
+    min_count: int = 2,
+    capitalization: bool = True,
+    seed: int = 0,
+    episode_store: Optional[EpisodeStore] = None,
+    reference_backend: Optional[NERBackend] = None,
+) -> list[dict]:
+    """
+    Compare GazetteerBackend to NLTKBackend on a random sample of episodes.
+
+    :param n_episodes: Number of transcribed episodes to sample.
+    :param min_count: Passed on to GazetteerBackend.from_db.
+    :param capitalization: Passed on to GazetteerBackend.from_db.
+    :param seed: Seed of the episode sample.
+    :param episode_store: Where to take the episodes from; by default, the project's.
+    :param reference_backend: Backend to compare to; by default, NLTKBackend.
+    :return: One dict of results per episode.
+    """
+    episode_store = episode_store or EpisodeStore()
+    episodes = [ep for ep in episode_store if ep.transcript.status]
+    random.Random(seed).shuffle(episodes)
+    episodes = episodes[:n_episodes]
+
+    reference_backend = reference_backend or NLTKBackend()
+    results = []
+
+    with sqlite3.connect(episode_store.db_path) as conn:
+        for episode in episodes:
+            transcript = Transcript(episode)
+            segments = segment_words(transcript)
+            n_words = len(transcript.word_df)
+
+            gazetteer_backend = GazetteerBackend.from_db(
+                conn,
+                min_count=min_count,
+                exclude_eid=episode.eid,
+                capitalization=capitalization,
+            )
+
+            reference, reference_seconds = run_backend(reference_backend, segments)
+            found, gazetteer_seconds = run_backend(gazetteer_backend, segments)
+            precision, recall, f1 = scores(found, reference)
+
+            result = {
+                "eid": episode.eid,
+                "words": n_words,
+                "gazetteer_size": gazetteer_backend.size,
+                "precision": precision,
+                "recall": recall,
+                "f1": f1,
+                "nltk_words_per_s": n_words / reference_seconds,
+                "gazetteer_words_per_s": n_words / gazetteer_seconds,
+            }
+            logger.info(
+                f"{episode.eid}: P={precision:.3f} R={recall:.3f} F1={f1:.3f}, "
+                f"{result['nltk_words_per_s']:.0f} vs. "
+                f"{result['gazetteer_words_per_s']:.0f} words/s"
+            )
+            results.append(result)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the gazetteer NER backend to NLTK on transcribed episodes."
+    )
+    parser.add_argument("--episodes", type=int, default=5)
+    parser.add_argument("--min-count", type=int, default=2)
+    parser.add_argument("--no-capitalization", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = benchmark(
+        n_episodes=args.episodes,
+        min_count=args.min_count,
+        capitalization=not args.no_capitalization,
+        seed=args.seed,
+    )
+    if not results:
+        logger.warning("No transcribed episodes to benchmark.")
+        return
+
+    total_words = sum(r["words"] for r in results)
+    for key in ("precision", "recall", "f1"):
+        mean = sum(r[key] * r["words"] for r in results) / total_words
+        print(f"{key:>24}: {mean:.3f}")
+    for key in ("nltk_words_per_s", "gazetteer_words_per_s"):
+        seconds = sum(r["words"] / r[key] for r in results)
+        print(f"{key:>24}: {total_words / seconds:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,215 +1,519 @@
 """NLP-related computations"""
 
-import os
-from typing import List
+import hashlib
+import json
+import re
+import sqlite3
+import string
+from abc import ABC, abstractmethod
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, List, Optional
 import multiprocessing
 
-import nltk
+import numpy as np
 
-nltk_data_dir = os.getenv("NLTK_DATA", "~/nltk_data")
+from config import (
+    DB_PATH,
+    STOPWORDS,
+    PROXIMITY_WINDOW,
+    WORDCLOUD_WIDTH,
+    WORDCLOUD_HEIGHT,
+    WORDCLOUD_FORMAT,
+    get_ner_backend,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from PIL.Image import Image
+    from podology.data.Transcript import Transcript
+
+
+WORDCLOUD_BACKGROUND = "white"
+
+# NLTK resources used here, as (path for nltk.data.find, package for the downloader).
+# They are baked into the Docker image (see NLTK_DATA); elsewhere, install them once
+# with the command in the error message of `require_nltk_resources`.
+NLTK_RESOURCES = [
+    ("corpora/stopwords", "stopwords"),
+    ("corpora/words", "words"),
+    ("taggers/averaged_perceptron_tagger_eng", "averaged_perceptron_tagger_eng"),
+    ("chunkers/maxent_ne_chunker_tab", "maxent_ne_chunker_tab"),
+]
+
+
+@lru_cache(maxsize=None)
+def require_nltk_resources() -> None:
+    """
+    Check once per process that all NLTK resources are installed. Never downloads
+    anything, so that workers and the dashboard don't touch the network.
 
-if not os.path.exists(os.path.join(nltk_data_dir, "tokenizers", "punkt_tab")):
-    nltk.download("punkt_tab", quiet=True)
+    :raises RuntimeError: Listing the missing resources and how to install them.
+    """
+    import nltk
 
-nltk.download("stopwords", quiet=True)
-nltk.download("punkt", quiet=True)
-nltk.download("averaged_perceptron_tagger", quiet=True)
-nltk.download("averaged_perceptron_tagger_eng", quiet=True)
-nltk.download("maxent_ne_chunker_tab", quiet=True)
-nltk.download("words", quiet=True)
+    missing = []
+    for path, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(package)
 
-from nltk import word_tokenize, pos_tag, ne_chunk, Tree
-from nltk.corpus import stopwords
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-from wordcloud import WordCloud
-import numpy as np
-import pandas as pd
+    if missing:
+        raise RuntimeError(
+            f"Missing NLTK resources: {', '.join(missing)}. Install them with\n"
+            f"    python -m nltk.downloader -d <dir> {' '.join(missing)}\n"
+            f"and point NLTK_DATA to <dir> if it is not a default location."
+        )
 
-from podology.data.Episode import Episode
-from podology.data.Transcript import Transcript
 
-# from podology.frontend.scrollvid.wordticker import ticker_from_eid
-from config import STOPWORDS
+@lru_cache(maxsize=None)
+def get_stop_words() -> frozenset[str]:
+    """English stopwords plus those set in config.py."""
+    require_nltk_resources()
+    from nltk.corpus import stopwords
 
-stop_words = set(stopwords.words("english"))
-stop_words.update(STOPWORDS)
+    return frozenset(stopwords.words("english")) | frozenset(STOPWORDS)
 
 
-def named_entities_whole_text(text) -> list[tuple[str, str]]:
-    """
-    Extract named entities from the given text using NLTK's named entity chunker.
-    Returns a list of tuples containing the entity name and its type.
+@lru_cache(maxsize=None)
+def _word_tokenizer():
+    from nltk.tokenize import NLTKWordTokenizer
+
+    return NLTKWordTokenizer()
 
-    :param text: The whole contiguous input text from which to extract named entities.
-    :return: A list of tuples, where each tuple contains the entity name and its type.
-    """
-    tokens = word_tokenize(text)
-    pos_tags = pos_tag(tokens)
 
-    # Chunk the tokens into named entities:
-    chunked = ne_chunk(pos_tags)
+@lru_cache(maxsize=None)
+def _pos_tagger():
+    require_nltk_resources()
+    from nltk.tag import PerceptronTagger
 
-    named_entities = []
+    return PerceptronTagger()
 
-    for subtree in chunked:
-        if isinstance(subtree, Tree):  # Named Entity subtree
-            entity_name = " ".join(token for token, pos in subtree.leaves())
-            entity_type = subtree.label()
 
-            if entity_name.lower() not in stop_words:
-                named_entities.append((entity_name, entity_type))
+@lru_cache(maxsize=None)
+def _ne_chunker():
+    # nltk.ne_chunk() would unpickle the chunker on every call
+    require_nltk_resources()
+    from nltk.chunk import ne_chunker
 
-    return named_entities
+    return ne_chunker()
 
 
-def get_wordcloud(episode: Episode) -> Figure:
+def wordcloud_digest(frequencies: dict[str, int]) -> str:
     """
-    Create a word cloud Figure for the given episode.
+    Content hash of the word cloud that `get_wordcloud` makes from `frequencies` with
+    the current settings. Identical digests mean identical images.
+    """
+    settings = [
+        WORDCLOUD_WIDTH,
+        WORDCLOUD_HEIGHT,
+        WORDCLOUD_FORMAT,
+        WORDCLOUD_BACKGROUND,
+    ]
+    payload = json.dumps([settings, sorted(frequencies.items())], ensure_ascii=False)
+
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
 
-    :param episode: The episode object for which to create the word cloud.
-    :return: A matplotlib Figure object containing the word cloud.
+def get_wordcloud(frequencies: dict[str, int]) -> "Image":
     """
-    # Plain text of transcript without speaker labels:
-    transcript = Transcript(episode)
-    text = " ".join(transcript.segments()["text"])
-    names = named_entities_whole_text(text)
-    names = [i[0] for i in names]
+    Create a word cloud image from named entity frequencies, at the size it is
+    displayed at.
 
-    # Get word counts:
-    namedict = {}
-    for i in names:
-        namedict[i] = namedict.get(i, 0) + 1
+    :param frequencies: Named entities and their number of occurrences in an episode.
+    :return: A PIL Image of the word cloud.
+    """
+    from wordcloud import WordCloud
 
     # Catch empty dict case:
-    if len(namedict) == 0:
-        namedict = {"No named entities found": 1}
+    if len(frequencies) == 0:
+        frequencies = {"No named entities found": 1}
 
-    # Make the cloud:
+    # Fixed random_state, so that the same frequencies always give the same image:
     wordcloud = WordCloud(
-        width=800, height=400, background_color="white"
-    ).generate_from_frequencies(namedict)
-
-    fig, ax = plt.subplots(figsize=(4, 2))
-    ax.imshow(wordcloud, interpolation="bilinear")
-    ax.axis("off")
-    fig.tight_layout()
+        width=WORDCLOUD_WIDTH,
+        height=WORDCLOUD_HEIGHT,
+        background_color=WORDCLOUD_BACKGROUND,
+        random_state=0,
+    ).generate_from_frequencies(frequencies)
 
-    return fig
+    return wordcloud.to_image()
 
 
-def type_proximity(type_token_dict: dict) -> pd.DataFrame:
+def type_proximity(
+    type_token_dict: dict, window: Optional[float] = PROXIMITY_WINDOW
+) -> "pd.DataFrame":
+    """
+    Type proximity score: Expresses how closely related two dictionary entries are in a
+    given transcript. For each token of TYPE_A, if >0 tokens of TYPE_B are within a
+    maximum perimeter, we take the squared distances in words and do 1/x with each.
+    Then, the sum of these scores is the proximity SCORE(A, B).
+
+    All timestamps are sorted once; walking the sorted array, each token is only paired
+    with the tokens that follow it within `window`. As 1/d² decays fast, the sum is
+    dominated by near neighbours: leaving out the far pairs lowers the summed score of
+    types A and B by at most n_A × n_B / window² (before taking the log), while time
+    and memory grow with the number of close pairs instead of with types² × tokens².
+
+    :param type_token_dict: A dictionary where keys are types and values are a lists of
+        timestamps.
+    :param window: Maximum distance between two tokens to contribute to their types'
+        score. None scores all pairs, as an exhaustive comparison would.
+    :return: A DataFrame containing the half matrix of proximity scores between types
+        in a transcript, as a sparse edge list: one row (type, other_type, proximity)
+        per pair of types that has tokens within `window` of each other, `type` being
+        the one that comes first in `type_token_dict`.
     """
-    Type proximity score: Expresses how closely related two dictionary entries are in a given transcript.
-      For each token of TYPE_A, if >0 tokens of TYPE_B are within a maximum perimeter, we take the squared
-      distances in words and do 1/x with each. Then, the sum of these scores is the proximity SCORE(A, B).
+    import pandas as pd
 
-    :param type_token_dict: A dictionary where keys are types and values are a lists of timestamps.
-    :return: A DataFrame containing the half matrix of proximity scores between between types in a
-        transcript.
+    columns = ["type", "other_type", "proximity"]
+    keys = list(type_token_dict.keys())  # list of type names
+    n_types = len(keys)
+    arrays = [np.asarray(type_token_dict[key], dtype=float) for key in keys]
+
+    if n_types < 2:
+        return pd.DataFrame(columns=columns)
+
+    # All tokens in one timeline, sorted by time, each labelled with its type index:
+    timestamps = np.concatenate(arrays)
+    type_ids = np.repeat(np.arange(n_types), [len(arr) for arr in arrays])
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    type_ids = type_ids[order]
+    n_tokens = len(timestamps)
+
+    # For each token, the position one past its last neighbour within the window:
+    if window is None:
+        reach = np.full(n_tokens, n_tokens)
+    else:
+        reach = np.searchsorted(timestamps, timestamps + window, side="right")
+    max_lag = int((reach - np.arange(n_tokens)).max(initial=1)) - 1
+
+    # Sweep over lags: at lag k, every token i is paired with token i + k, as long as
+    # that one is still within reach:
+    pair_codes = []
+    pair_scores = []
+    for lag in range(1, max_lag + 1):
+        idx = np.arange(n_tokens - lag)
+        within = idx + lag < reach[idx]
+        a = type_ids[idx[within]]
+        b = type_ids[idx[within] + lag]
+        diff = timestamps[idx[within] + lag] - timestamps[idx[within]]
+
+        # Only pairs of different types count:
+        other = a != b
+        a, b, diff = a[other], b[other], diff[other]
+
+        # Here is where we put the mapping function from each distance to a score,
+        # with a small constant to avoid division by zero; a pair is keyed by its
+        # upper triangle cell:
+        pair_codes.append(np.minimum(a, b) * n_types + np.maximum(a, b))
+        pair_scores.append(1 / (diff**2 + 1e-6))
+
+    pair_codes = np.concatenate(pair_codes) if pair_codes else np.array([], dtype=int)
+    pair_scores = np.concatenate(pair_scores) if pair_scores else np.array([])
+
+    # Sum up per type pair:
+    cells, inverse = np.unique(pair_codes, return_inverse=True)
+    typescores = np.bincount(inverse, weights=pair_scores, minlength=len(cells))
+
+    # Use log values, as we deal with many orders of magnitude:
+    keys = np.array(keys, dtype=object)
+    prox_df = pd.DataFrame(
+        {
+            "type": keys[cells // n_types],
+            "other_type": keys[cells % n_types],
+            "proximity": np.log(typescores),
+        },
+        columns=columns,
+    )
+
+    return prox_df
+
+
+class NERBackend(ABC):
+    """
+    Base class for named entity recognition engines. A backend finds the named
+    entities in a sequence of transcript words (typically one segment) and reports
+    where each one starts, so that entities can be timed by their words.
     """
 
-    def proximity_score(arr_i, arr_j):
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}"
+
+    @abstractmethod
+    def entities(self, words: List[str]) -> List[tuple[str, int]]:
         """
-        Given two arrays of timestamps, calculate the proximity score
-        between them. The score is calculated as follows:
-        1. Calculate the absolute differences between each pair of timestamps.
-        2. For each difference, calculate the inverse square (1/difference^2).
-        3. Sum these values to get a score for the type pair.
-        4. Use the logarithm of the score to handle large ranges.
+        Return a list of tuples (entity_name, index of the entity's first word in
+        `words`), in order of appearance.
         """
-        # Start out with the plain distance in tokens or named entities:
-        diff = np.abs(arr_i[:, None] - arr_j).astype(float)
 
-        # Here is where we put the mapping function from each distance to a score:
-        tokenscore = 1 / (
-            diff**2 + 1e-6
-        )  # Add a small constant to avoid division by zero
 
-        # Sum up for this type pair:
-        typescore = np.sum(tokenscore)
+class NLTKBackend(NERBackend):
+    """
+    NLTK's part-of-speech tagger and maximum entropy NE chunker. Accurate, but the
+    most expensive CPU stage of the pipeline.
+    """
 
-        # Use log values, as we deal with many orders of magnitude:
-        typescore = np.log(typescore)
+    def entities(self, words: List[str]) -> List[tuple[str, int]]:
+        # Tokenize each transcript word separately, so that every token can be
+        # traced back to the word it came from:
+        from nltk import Tree
 
-        return typescore
+        tokenizer = _word_tokenizer()
+        tokens = []
+        token_word_idx = []
+        for i, word in enumerate(words):
+            word_tokens = tokenizer.tokenize(word)
+            tokens.extend(word_tokens)
+            token_word_idx.extend([i] * len(word_tokens))
 
-    keys = list(type_token_dict.keys())  # list of type names
-    values = [
-        np.array(type_token_dict[key]) for key in keys
-    ]  # list of arrays of timestamps
-    matrix = np.zeros((len(keys), len(keys)))
-
-    for i, arr_i in enumerate(values):  # arr_i is an array of timestamps for type i
-        # Only calculate upper triangle of matrix:
-        for j in range(i + 1, len(values)):
-            proxscore = proximity_score(arr_i, values[j])
-            matrix[i, j] = proxscore
-
-    # From matrix to tidy df form:
-    matrix_df = pd.DataFrame(matrix, index=keys, columns=keys)
-    upper_triangle = matrix_df.where(
-        np.triu(np.ones(matrix_df.shape), k=1).astype(bool)
-    )
+        if not tokens:
+            return []
 
-    prox_df = upper_triangle.stack().reset_index()
-    prox_df.columns = ["type", "other_type", "proximity"]
+        chunked = _ne_chunker().parse(_pos_tagger().tag(tokens))
 
-    return prox_df
+        named_entities = []
+        position = 0  # index of the current subtree's first token
 
+        for subtree in chunked:
+            if isinstance(subtree, Tree):  # Named Entity subtree
+                leaves = subtree.leaves()
+                entity_name = " ".join(token for token, pos in leaves)
+                named_entities.append((entity_name, token_word_idx[position]))
+                position += len(leaves)
+            else:
+                position += 1
 
-def timed_named_entity_tokens(transcript: Transcript) -> list:
-    """
-    Extract named entities from the given transcript and associate them with timestamps.
+        return named_entities
 
-    Args:
-        transcript (Transcript): A Transcript object containing segment information.
 
-    Returns:
-        list: A list of tuples (entity_name, entity_type, word_index).
+class GazetteerBackend(NERBackend):
     """
-    argslist = []
-    for _, segment in transcript.segments()[["text", "start", "end"]].iterrows():
-        timestamp = round((segment["start"] + segment["end"]) / 2, 2)
-        argslist.append((segment["text"], timestamp))
+    Rule-based backend: matches the transcript against a gazetteer of known entity
+    names with a token trie (longest match wins), and optionally takes runs of
+    capitalized words in mid-sentence for entities not in the gazetteer.
 
-    with multiprocessing.Pool(processes=multiprocessing.cpu_count() - 2) as pool:
-        results = pool.map(process_segment_wrapper, argslist)
+    The gazetteer is built from what NLTKBackend found in previous episodes (see
+    `from_db`), so it knows the names that a podcast keeps returning to. No tagging
+    is involved, which makes it orders of magnitude faster than NLTK.
+    """
 
-    flat_results = [item for sublist in results for item in sublist]
+    def __init__(
+        self,
+        names: Optional[Iterable[str]] = None,
+        min_count: int = 2,
+        capitalization: bool = True,
+    ):
+        """
+        :param names: Entity names, tokens separated by spaces as in NLTK's output. If
+            None, the gazetteer is read from the stats database (see `from_db`).
+        :param min_count: Only used when reading names from the database.
+        :param capitalization: Whether to also take unknown capitalized words in
+            mid-sentence for entities.
+        """
+        if names is None:
+            with sqlite3.connect(DB_PATH) as conn:
+                names = _gazetteer_names(conn, min_count)
+
+        self.capitalization = capitalization
+        self.trie: dict = {}
+        self.size = 0
+
+        for name in names:
+            node = self.trie
+            for token in name.split():
+                node = node.setdefault(token, {})
+            if _TRIE_END not in node:
+                node[_TRIE_END] = name
+                self.size += 1
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.size} names)"
+
+    @classmethod
+    def from_db(
+        cls,
+        conn: sqlite3.Connection,
+        min_count: int = 2,
+        exclude_eid: Optional[str] = None,
+        capitalization: bool = True,
+    ) -> "GazetteerBackend":
+        """Build the gazetteer from the named entity tokens in the stats database.
+
+        :param conn: Connection to the stats database.
+        :param min_count: Minimum number of occurrences in the corpus for a name to be
+            included. Names found once are often tagging errors.
+        :param exclude_eid: Leave out the tokens of this episode (for benchmarking).
+        :param capitalization: See `__init__`.
+        """
+        names = _gazetteer_names(conn, min_count, exclude_eid)
+        return cls(names, capitalization=capitalization)
+
+    def entities(self, words: List[str]) -> List[tuple[str, int]]:
+        tokens = [_strip_word(word) for word in words]
+        n_words = len(words)
+
+        named_entities = []
+        i = 0
+        while i < n_words:
+            # Longest gazetteer match starting at word i:
+            match = None
+            node = self.trie
+            j = i
+            while j < n_words and tokens[j] and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if _TRIE_END in node:
+                    match = (node[_TRIE_END], j)
+                # Punctuation after a word ends the name:
+                if tokens[j - 1] != words[j - 1].strip():
+                    break
+
+            if match is None and self.capitalization:
+                match = self._capitalized_run(words, tokens, i)
+
+            if match is None:
+                i += 1
+            else:
+                name, j = match
+                named_entities.append((name, i))
+                i = j
+
+        return named_entities
+
+    @staticmethod
+    def _capitalized_run(words, tokens, i) -> Optional[tuple[str, int]]:
+        """A run of capitalized words starting at i, if it is not sentence-initial."""
+        sentence_start = i == 0 or words[i - 1].rstrip().endswith((".", "?", "!"))
+        if sentence_start or not _is_capitalized(tokens[i]):
+            return None
+
+        j = i
+        while j < len(words) and _is_capitalized(tokens[j]):
+            j += 1
+            if tokens[j - 1] != words[j - 1].strip():
+                break
+
+        name = " ".join(tokens[i:j])
+        if name.lower() in get_stop_words():
+            return None
+
+        return name, j
+
+
+def _gazetteer_names(
+    conn: sqlite3.Connection, min_count: int, exclude_eid: Optional[str] = None
+) -> list[str]:
+    rows = conn.execute(
+        """
+        SELECT token
+        FROM named_entity_tokens
+        WHERE eid != ?
+        GROUP BY token
+        HAVING COUNT(*) >= ?
+        """,
+        (exclude_eid or "", min_count),
+    )
+    return [row[0] for row in rows]
 
-    return flat_results
 
+_TRIE_END = ""  # key for the entity name in a trie node; empty tokens never match
+_POSSESSIVE = re.compile(r"['’]s$")
 
-def process_segment_wrapper(argslist):
-    """
-    Wrapper function to unpack arguments for multiprocessing.
+
+def _strip_word(word: str) -> str:
+    """Transcript word to gazetteer token: drop surrounding punctuation and 's."""
+    return _POSSESSIVE.sub("", word.strip().strip(string.punctuation + "“”‘’"))
+
+
+def _is_capitalized(token: str) -> bool:
+    return len(token) > 1 and token[0].isupper() and not token.startswith("I'")
+
+
+def segment_words(transcript: "Transcript") -> List[tuple[int, List[str]]]:
+    """The words of each segment, with the index of the segment's first word."""
+    words = transcript.word_df["word"]
+    segment_df = transcript.segment_df
+
+    return [
+        (int(first), words.loc[first:last].tolist())
+        for first, last in zip(
+            segment_df["first_word_idx"], segment_df["last_word_idx"]
+        )
+    ]
+
+
+def named_entities_with_word_index(task: tuple[int, List[str]]) -> List[tuple]:
+    """Extract named entities from the words of a segment.
+
+    Uses the backend set up in this process by `_init_ner_worker`.
+
+    :param task: Tuple (index of the segment's first word, list of its words).
+    :return: A list of tuples (entity_name, index of the entity's first word).
     """
-    return process_segment_with_word_index(*argslist)
+    first_wid, words = task
+    stop_words = get_stop_words()
 
+    return [
+        (entity_name, first_wid + offset)
+        for entity_name, offset in _ner_backend.entities(words)
+        if entity_name.lower() not in stop_words
+    ]
 
-def process_segment_with_word_index(segment: str, timestamp: float) -> List[tuple]:
-    """Extract named entities from a timed segment.
 
-    Identifies named entities, returns a list of tuples containing the entity name and its type,
-    along with the start time of the segment.
-    (There's still room to be more precise, we have word timestamps.)
+_ner_backend: NERBackend = NLTKBackend()
 
-    :param segment: A string of normal spoken text.
-    :param timestamp: A timestamp, typically locating the segment (start or mid time).
-    :return: A list of tuples (entity_name, segment start time).
+
+def _init_ner_worker(backend: NERBackend):
+    """Pool initializer: ship the backend to each worker process once."""
+    global _ner_backend
+    _ner_backend = backend
+
+
+def episode_named_entities(
+    transcript: "Transcript", backend: Optional[NERBackend] = None
+) -> tuple[list[tuple[str, float]], dict[str, int]]:
     """
-    # Tokenize the segment text
-    tokens = word_tokenize(segment)
-    pos_tags = pos_tag(tokens)
-    chunked = ne_chunk(pos_tags)
+    Extract the named entities of a whole episode in a single pass.
 
-    named_entities = []
+    Every word of the transcript is tokenized and tagged once. Segments are tagged in
+    parallel (each one is a sentence-like unit, which is what the tagger and chunker
+    expect), and submitted to the pool in chunks to keep task overhead low. Each entity
+    keeps the index of its first word, so it is timed by that word's own timestamp.
 
-    for subtree in chunked:
-        if isinstance(subtree, Tree):  # Named Entity subtree
-            entity_name = " ".join(token for token, pos in subtree.leaves())
-            if entity_name.lower() not in stop_words:
-                named_entities.append((entity_name, timestamp))
+    Args:
+        transcript (Transcript): A Transcript object containing word information.
+        backend (NERBackend, optional): The NER engine to use. Defaults to the one set
+            in config.py.
 
-    return named_entities
+    Returns:
+        tuple: A list of tuples (entity_name, timestamp) in order of appearance, for
+            the ticker and type proximity; and a dict {entity_name: count}, for the
+            word cloud and type frequencies.
+    """
+    if backend is None:
+        backend = get_ner_backend()
+
+    word_df = transcript.word_df
+
+    # One task per segment: (index of its first word, its words):
+    tasks = segment_words(transcript)
+
+    processes = max(1, multiprocessing.cpu_count() - 2)
+    chunksize = max(1, len(tasks) // (processes * 4))
+    with multiprocessing.Pool(
+        processes=processes, initializer=_init_ner_worker, initargs=(backend,)
+    ) as pool:
+        results = pool.map(named_entities_with_word_index, tasks, chunksize=chunksize)
+
+    starts = word_df["start"]
+    timed_entities = [
+        (entity_name, float(starts.loc[wid]))
+        for segment_entities in results
+        for entity_name, wid in segment_entities
+    ]
+    frequencies = dict(Counter(entity_name for entity_name, _ in timed_entities))
+
+    return timed_entities, frequencies
@@ -2,6 +2,7 @@
 Plotting functions
 """
 
+from contextlib import closing
 import os
 from typing import List
 import sqlite3
@@ -18,6 +19,7 @@ from podology.data.EpisodeStore import EpisodeStore
 from podology.data.Episode import Episode
 from podology.data.Transcript import Transcript
 from podology.search.search_classes import ResultSet
+from podology.stats.db import audio_envelope
 from podology.stats.preparation import DB_PATH
 from podology.frontend.utils import colorway, empty_term_hit_fig
 from config import HITS_PLOT_BINS, EMBEDDER_ARGS
@@ -231,11 +233,63 @@ def plot_transcript_hits_es(
     allbins_df.set_index("bin", inplace=True)
 
     # Create plot (same as before)
-    return _create_term_hits_plot(allbins_df, term_colid_tuples)
+    return _create_term_hits_plot(
+        allbins_df, term_colid_tuples, envelope=_get_envelope(eid, nbins)
+    )
+
+
+def plot_audio_envelope(eid: str, nbins: int = HITS_PLOT_BINS) -> go.Figure:
+    """The transcript hits column without hits: just the episode's loudness."""
+    envelope = _get_envelope(eid, nbins)
+    if envelope is None:
+        return empty_term_hit_fig
+
+    fig = go.Figure(empty_term_hit_fig)
+    _add_envelope_traces(fig, envelope)
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        yaxis_range=[-(nbins - 1), 0],
+    )
+
+    return fig
+
+
+def _get_envelope(eid: str, nbins: int):
+    """Peak and RMS loudness of the episode in nbins bins, if the pipeline stored it."""
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        return audio_envelope(conn, eid, nbins)
+
+
+def _add_envelope_traces(fig: go.Figure, envelope: tuple[np.ndarray, np.ndarray]):
+    """Draw the loudness envelope as light grey areas behind the other traces."""
+    y = -np.arange(len(envelope[0]))
+    for level, alpha in zip(envelope, (0.12, 0.2)):
+        fig.add_trace(
+            go.Scatter(
+                y=y,
+                x=level,
+                mode="lines",
+                line_width=0,
+                fill="tozerox",
+                fillcolor=f"rgba(128,128,128,{alpha})",
+                hoverinfo="skip",
+                xaxis="x3",
+            )
+        )
+    fig.update_layout(
+        xaxis3=dict(
+            showgrid=False,
+            showticklabels=False,
+            zeroline=False,
+            range=[0, 1],
+            overlaying="x",
+            domain=[0, 1],
+        ),
+    )
 
 
 def _create_term_hits_plot(
-    allbins_df: pd.DataFrame, term_colid_tuples: list[list]
+    allbins_df: pd.DataFrame, term_colid_tuples: list[list], envelope=None
 ) -> go.Figure:
     """
     Create a bar plot for the hit counts of each term.
@@ -243,6 +297,7 @@ def _create_term_hits_plot(
     Args:
         allbins_df: DataFrame with hit counts for each term and bin
         term_colid_dict: Dictionary mapping term names to color IDs
+        envelope: Peak and RMS loudness per bin, drawn in the background
 
     Returns:
         Plotly Figure object
@@ -258,6 +313,8 @@ def _create_term_hits_plot(
     # allbins_df[semantic_cols] = allbins_df[semantic_cols].apply(np.exp)
 
     fig = go.Figure()
+    if envelope is not None:
+        _add_envelope_traces(fig, envelope)
 
     # col is at the same time part of the tuples (we surmise):
     for i, col in enumerate(allbins_df.columns):
@@ -6,29 +6,69 @@ by the functions that they apply to the whole corpus.
 
 # pylint: disable=W1514
 import os
-import json
 from pathlib import Path
 from typing import Generator, List, Optional
 import multiprocessing
+import shutil
 import sqlite3
+import subprocess
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from podology.data.EpisodeStore import EpisodeStore
 
-import pandas as pd
+import numpy as np
 from loguru import logger
 from redis import Redis
 import requests
 
-from config import CHUNKS_DIR, DB_PATH, WORDCLOUD_DIR, TRANSCRIPT_DIR, EMBEDDER_ARGS
+from config import (
+    AUDIO_DIR,
+    CHUNKS_DIR,
+    DB_PATH,
+    DUMMY_AUDIO,
+    HITS_PLOT_BINS,
+    WORDCLOUD_DIR,
+    WORDCLOUD_FORMAT,
+    WORDCLOUD_MODE,
+    TICKER_WINDOW_WIDTH,
+    TRANSCRIPT_DIR,
+    EMBEDDER_ARGS,
+)
+from podology.data.audio import audio_envelope
 from podology.data.Episode import Episode, Status
 from podology.data.Transcript import Transcript
+from podology.data.transcript_io import read_transcript
+from podology.stats.db import (
+    STAGE_NAMED_ENTITY_TOKENS,
+    STAGE_NAMED_ENTITY_TYPES,
+    STAGE_TYPE_PROXIMITY,
+    connection,
+    delete_ticker_payloads,
+    done_eids,
+    envelope_eids,
+    insert_audio_envelope,
+    insert_named_entity_tokens,
+    insert_named_entity_types,
+    insert_ticker_payload,
+    insert_type_proximity,
+    is_done,
+    mark_done,
+    migrate,
+    named_entity_counts,
+    set_wordcloud,
+    ticker_eids,
+    token_timestamps,
+    wordcloud,
+)
 from podology.stats.nlp import (
     type_proximity,
     get_wordcloud,
-    timed_named_entity_tokens,
+    wordcloud_digest,
+    episode_named_entities,
+    require_nltk_resources,
 )
+from podology.frontend.renderers.wordticker import get_ticker_payload
 from podology.search.elasticsearch import index_segments, index_chunks, setup_elasticsearch_indices
 
 
@@ -43,9 +83,10 @@ def post_process_pipeline(
       is translated to all episodes that have a transcript.
     :return: None
     """
+    initialize_stats_db()
+
     # Deal with eid parameter:
     if episodes is None:
-        initialize_stats_db()
         episodes = [ep for ep in episode_store if ep.transcript.status]
 
     setup_elasticsearch_indices()
@@ -53,10 +94,12 @@ def post_process_pipeline(
     store_chunk_embeddings(episodes)
     index_chunks(episodes)  # depends on store_chunk_embeddings()
     get_word_counts(episodes)
-    store_wordclouds(episodes)
     store_timed_named_entities(episodes)
-    store_named_entity_types(episodes)
+    store_named_entity_types(episodes)  # depends on store_timed_named_entities()
+    store_wordclouds(episodes)  # depends on store_named_entity_types()
     store_type_proximity(episodes)  # depends on store_timed_named_entities()
+    store_ticker_payloads(episodes)  # depends on store_timed_named_entities()
+    store_audio_envelopes(episodes)
 
     for episode in episodes:
         episode_store.add_or_update(episode)
@@ -95,9 +138,8 @@ def word_count_worker(episode: Episode):
         script_path = TRANSCRIPT_DIR / f"{episode.eid}.json"
 
         try:
-            with open(script_path, "r") as f:
-                segments = json.load(f)["segments"]
-                word_count = sum(len(segment["words"]) for segment in segments)
+            segments = read_transcript(script_path)["segments"]
+            word_count = sum(len(segment["words"]) for segment in segments)
 
             with sqlite3.connect(DB_PATH) as conn:
                 conn.execute(
@@ -117,50 +159,143 @@ def word_count_worker(episode: Episode):
 
 def store_wordclouds(episodes: List[Episode]):
     """
-    Create a png word cloud file for each given episode.
-    Exclude episodes that are not transcribed or already have a word cloud file.
+    Create a word cloud image for each given episode that has named entity types.
+    Episodes whose entity counts are unchanged since their last image are skipped.
+
+    In the "json" WORDCLOUD_MODE, the browser renders the word cloud from the entity
+    counts, so episodes only need those to have their word cloud.
 
     :param episodes: List of episodes to process.
     :return: None
     """
-    # Filter: only do word clouds for transcribed episodes without a cloud png:
-    transcribed_episodes = [ep for ep in episodes if ep.transcript.status]
+    with sqlite3.connect(DB_PATH) as conn:
+        typed_eids = done_eids(conn, STAGE_NAMED_ENTITY_TYPES)
 
     ep_to_do = [
         episode
-        for episode in transcribed_episodes
-        if not (WORDCLOUD_DIR / f"{episode.eid}.png").exists()
+        for episode in episodes
+        if episode.transcript.status and episode.eid in typed_eids
     ]
 
+    if WORDCLOUD_MODE == "json":
+        for episode in ep_to_do:
+            episode.transcript.wcstatus = Status.DONE
+        return
+
     with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
-        pool.map(wordcloud_worker, ep_to_do)
+        rendered = pool.map(wordcloud_worker, [episode.eid for episode in ep_to_do])
 
-    for episode in ep_to_do:
+    for episode, is_new in zip(ep_to_do, rendered):
         # Update the episode's wordcloud status in db:
         episode.transcript.wcstatus = Status.DONE
-        logger.debug(f"{episode.eid}: Word cloud stored")
+        if is_new:
+            logger.debug(f"{episode.eid}: Word cloud stored")
 
 
-def wordcloud_worker(episode: Episode):
-    """Get wordcloud from nlp module, store it...
+def wordcloud_worker(eid: str) -> bool:
+    """Render the word cloud of an episode, unless it is already up to date.
 
-    ...both in the data directory of the current podcast and in the assets directory
-    of the podology package. The latter is for use in the web app.
+    The image is written once, to WORDCLOUD_DIR, under a name derived from the hash
+    of the entity counts and render settings. The web app serves it from there.
 
     Args:
-        episode (Episode): The episode for which to create the word cloud.
+        eid (str): The episode for which to create the word cloud.
+
+    Returns:
+        bool: Whether a new image was rendered.
+    """
+    conn = connection()
+    frequencies = named_entity_counts(conn, eid)
+    digest = wordcloud_digest(frequencies)
+    filename = f"{digest}.{WORDCLOUD_FORMAT}"
+    path = WORDCLOUD_DIR / filename
+
+    current = wordcloud(conn, eid)
+    if current is not None and current[0] == digest and path.exists():
+        return False
+
+    if not path.exists():
+        # Write under a temporary name, so that the app never serves half a file:
+        tmp_path = path.with_name(f".{filename}.{os.getpid()}")
+        get_wordcloud(frequencies).save(tmp_path, format=WORDCLOUD_FORMAT)
+        os.replace(tmp_path, path)
+
+    with conn:
+        unused = set_wordcloud(conn, eid, digest, filename)
+    if unused is not None:
+        (WORDCLOUD_DIR / unused).unlink(missing_ok=True)
+
+    return True
+
+
+def store_ticker_payloads(episodes: List[Episode]):
+    """
+    Precompute the scroll animation's ticker of each given episode, for the window
+    width set in config.py, and store it as gzipped JSON for the web app to serve.
+
+    :param episodes: List of episodes to process.
+    """
+    conn = connection()
+    token_eids = done_eids(conn, STAGE_NAMED_ENTITY_TOKENS)
+    stored_eids = ticker_eids(conn, TICKER_WINDOW_WIDTH)
+
+    for ep in episodes:
+        if ep.eid not in token_eids or ep.eid in stored_eids:
+            continue
+
+        payload = get_ticker_payload(ep.eid, window_width=TICKER_WINDOW_WIDTH)
+        with conn:
+            insert_ticker_payload(conn, ep.eid, TICKER_WINDOW_WIDTH, payload)
+        logger.debug(f"{ep.eid}: Ticker stored ({len(payload)} bytes)")
+
+
+def store_audio_envelopes(episodes: List[Episode]):
+    """
+    Decode the audio of each given episode and store its loudness envelope, for the
+    background of the search hits column.
+
+    :param episodes: List of episodes to process.
+    """
+    if DUMMY_AUDIO:
+        return
+    if shutil.which("ffmpeg") is None:
+        logger.warning("ffmpeg not found, skipping audio envelopes")
+        return
+
+    with sqlite3.connect(DB_PATH) as conn:
+        stored_eids = envelope_eids(conn)
+
+    eids_to_do = [
+        ep.eid
+        for ep in episodes
+        if ep.eid not in stored_eids and (AUDIO_DIR / f"{ep.eid}.mp3").exists()
+    ]
+    if not eids_to_do:
+        return
+
+    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+        pool.map(envelope_worker, eids_to_do)
+
+
+def envelope_worker(eid: str):
     """
-    path = WORDCLOUD_DIR / f"{episode.eid}.png"
-    path.parent.mkdir(parents=True, exist_ok=True)
-    fig = get_wordcloud(episode)
-    fig.savefig(path, bbox_inches="tight", dpi=300)
+    Decode the episode's audio and store its loudness envelope at the resolution of
+    the hits column. Audio that ffmpeg can't decode is logged and skipped.
 
-    wc_assets_dir = Path.cwd() / "podology" / "assets" / "wordclouds"
-    wc_assets_dir.mkdir(parents=True, exist_ok=True)
-    dest_path = wc_assets_dir / f"{episode.eid}.png"
-    dest_path.write_bytes(path.read_bytes())
+    :param eid: The episode ID.
+    """
+    try:
+        duration, levels = audio_envelope(
+            AUDIO_DIR / f"{eid}.mp3", levels=(HITS_PLOT_BINS,)
+        )
+    except subprocess.CalledProcessError as e:
+        logger.error(f"{eid}: Can't decode audio: {e.stderr.decode(errors='replace')}")
+        return
 
-    episode.transcript.wcstatus = Status.DONE
+    conn = connection()
+    with conn:
+        insert_audio_envelope(conn, eid, duration, levels)
+    logger.debug(f"{eid}: Audio envelope stored")
 
 
 def store_named_entity_types(episodes: List[Episode]):
@@ -172,11 +307,7 @@ def store_named_entity_types(episodes: List[Episode]):
     :return: None
     """
     with sqlite3.connect(DB_PATH) as conn:
-
-        # Get all indexed episode IDs
-        indexed_eids = {
-            row[0] for row in conn.execute("SELECT eid FROM named_entity_types")
-        }
+        indexed_eids = done_eids(conn, STAGE_NAMED_ENTITY_TYPES)
 
     ep_to_do = [
         ep for ep in episodes if ep.transcript.status and ep.eid not in indexed_eids
@@ -194,22 +325,13 @@ def nament_types_worker(episode: Episode):
     # Get the named entities:
     logger.debug(f"{episode.eid}: Storing named entity types")
 
-    query = f"""
-        SELECT token, timestamp
-        FROM named_entity_tokens
-        WHERE eid = '{episode.eid}'
-    """
-    with sqlite3.connect(DB_PATH) as conn:
-        nedf = pd.read_sql(sql=query, con=conn)
+    conn = connection()
+    tokens, _ = token_timestamps(conn, episode.eid)
+    types, counts = np.unique(tokens, return_counts=True)
 
-    nedf = nedf.groupby("token").size().reset_index(name="count")
-    nedf["eid"] = episode.eid
-    nedf.rename(columns={"token": "type"}, inplace=True)
-
-    with sqlite3.connect(DB_PATH) as conn:
-        nedf.to_sql(
-            con=conn, if_exists="append", index=False, name="named_entity_types"
-        )
+    with conn:
+        insert_named_entity_types(conn, episode.eid, types.tolist(), counts.tolist())
+        mark_done(conn, episode.eid, STAGE_NAMED_ENTITY_TYPES)
 
 
 def store_type_proximity(episodes: List[Episode]):
@@ -223,13 +345,10 @@ def store_type_proximity(episodes: List[Episode]):
     with sqlite3.connect(DB_PATH) as conn:
 
         # eids where [v] NEs indexed & [ ] proximities indexed:
-        ep_to_do = [
-            row[0]
-            for row in conn.execute(
-                "SELECT DISTINCT eid FROM named_entity_tokens "
-                "WHERE eid NOT IN (SELECT eid FROM type_proximity_episode)"
-            )
-        ]
+        ep_to_do = sorted(
+            done_eids(conn, STAGE_NAMED_ENTITY_TOKENS)
+            - done_eids(conn, STAGE_TYPE_PROXIMITY)
+        )
 
     # Iterate over all episodes and index missing ones
     with multiprocessing.Pool(
@@ -242,125 +361,81 @@ def store_type_proximity(episodes: List[Episode]):
 def type_proximity_worker(eid: str):
     """
     For a given episode, store in the stats database the pairwise proximity
-    scores of its named entities.
+    scores of its named entities, and add them to the corpus-wide aggregate.
     """
+    conn = connection()
+
     # Skip if this episode is already in this table. Not necessary for
     # the ensure function, but who knows where else we might call this later.
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute(
-            """
-            SELECT 1 FROM type_proximity_episode WHERE eid = ? LIMIT 1
-            """,
-            (eid,),
-        )
-        if cursor.fetchone():
-            return
+    if is_done(conn, eid, STAGE_TYPE_PROXIMITY):
+        return
 
-    # Get the named entities:
+    # Get the named entities, grouped into {token: timestamps}. The arrays come
+    # sorted by token, so each token's timestamps are one contiguous slice:
     logger.debug(f"{eid}: Updating type proximity table")
-    query = f"""
-        SELECT token, timestamp
-        FROM named_entity_tokens
-        WHERE eid = '{eid}'
-    """
-    named_entities = pd.read_sql(sql=query, con=sqlite3.connect(DB_PATH))
-    ne_dict = named_entities.groupby("token")["timestamp"].apply(list).to_dict()
+    tokens, timestamps = token_timestamps(conn, eid)
+    types, first_idx = np.unique(tokens, return_index=True)
+    ne_dict = dict(zip(types.tolist(), np.split(timestamps, first_idx[1:])))
 
     # Get the proximity:
     proximity_df = type_proximity(ne_dict)
-    proximity_df["eid"] = eid
+    edges = proximity_df[["type", "other_type", "proximity"]].itertuples(
+        index=False, name=None
+    )
 
     # Store the proximity in the database:
-    with sqlite3.connect(DB_PATH) as conn:
-        proximity_df.to_sql(
-            con=conn, if_exists="append", index=False, name="type_proximity_episode"
-        )
+    with conn:
+        insert_type_proximity(conn, eid, edges)
+        mark_done(conn, eid, STAGE_TYPE_PROXIMITY)
 
 
 def store_timed_named_entities(episodes: List[Episode]):
     """
-    Store named entities for each given episode along with their word index.
+    Store named entities for each given episode along with their timestamps.
     This is for the experimental dynamic word cloud.
 
+    The same NER pass yields the per-type counts, so these are stored right away
+    unless the episode already has them.
+
     :param episodes: List of episodes to process.
     """
     # Get ID of all episodes with named entity tokens:
     with sqlite3.connect(DB_PATH) as conn:
-        indexed_eids = {
-            row[0] for row in conn.execute("SELECT eid FROM named_entity_tokens")
-        }
+        indexed_eids = done_eids(conn, STAGE_NAMED_ENTITY_TOKENS)
     ep_to_do = [
         ep for ep in episodes if ep.transcript.status and ep.eid not in indexed_eids
     ]
 
+    if ep_to_do:
+        # Fail here rather than in every pool worker:
+        require_nltk_resources()
+
+    conn = connection()
     for ep in ep_to_do:
         logger.debug(f"{ep.eid}: Storing timestamped named entity tokens")
 
-        tne = timed_named_entity_tokens(Transcript(ep))
+        timed_entities, frequencies = episode_named_entities(Transcript(ep))
 
-        with sqlite3.connect(DB_PATH) as conn:
-            for token in tne:
-                entity_name, ts = token
-                conn.execute(
-                    """
-                    INSERT INTO named_entity_tokens (eid, timestamp, token)
-                    VALUES (?, ?, ?)
-                    """,
-                    (ep.eid, ts, entity_name),
+        with conn:
+            insert_named_entity_tokens(conn, ep.eid, timed_entities)
+            mark_done(conn, ep.eid, STAGE_NAMED_ENTITY_TOKENS)
+            # Tickers are computed from the tokens; have them recomputed, too:
+            delete_ticker_payloads(conn, ep.eid)
+
+            if not is_done(conn, ep.eid, STAGE_NAMED_ENTITY_TYPES):
+                insert_named_entity_types(
+                    conn, ep.eid, frequencies.keys(), frequencies.values()
                 )
+                mark_done(conn, ep.eid, STAGE_NAMED_ENTITY_TYPES)
 
 
 def initialize_stats_db():
     """
-    Initialize the SQLite database for storing statistics.
+    Initialize the SQLite database for storing statistics, or bring its schema
+    up to date. Cheap if nothing is pending, so it is safe to call on every run.
     """
     logger.info("Initializing stats database")
-
-    with sqlite3.connect(DB_PATH) as conn:
-
-        # Word count by episode:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS word_count (
-                eid TEXT PRIMARY KEY,
-                count INTEGER
-            );
-            """
-        )
-
-        # Named entity tokens by episode:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS named_entity_tokens (
-                eid TEXT,
-                timestamp FLOAT,
-                token TEXT
-            );
-            """
-        )
-
-        # Named entity types by episode:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS named_entity_types (
-                eid TEXT,
-                type TEXT,
-                count INTEGER
-            );
-            """
-        )
-
-        # Type proximity by episode (granularity: term pairs):
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS type_proximity_episode (
-                eid TEXT,
-                type TEXT,
-                other_type TEXT,
-                proximity REAL
-            );
-            """
-        )
+    migrate(DB_PATH)
 
 
 def store_chunk_embeddings(episodes: List[Episode]):
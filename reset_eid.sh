@@ -2,7 +2,8 @@
 EID="$1"
 DB_PATH="data/Knowledge Fight/Knowledge Fight.db"
 T_PATH="data/Knowledge Fight/transcripts/$EID.json"
-WC_PATH="data/Knowledge Fight/wordclouds/$EID.png"
+WC_DIR="data/Knowledge Fight/wordclouds"
+RENDITIONS_DIR="data/Knowledge Fight/renditions/$EID"
 
 if [ -z "$EID" ]; then
     echo "Usage: $0 <episode_id>"
@@ -11,6 +12,12 @@ fi
 
 echo "Cleaning up episode: $EID"
 
+# Word cloud file of the episode, unless another episode has the same one:
+WC_FILE=$(sqlite3 "$DB_PATH" "
+SELECT filename FROM wordclouds WHERE eid = '$EID'
+AND filename NOT IN (SELECT filename FROM wordclouds WHERE eid != '$EID');
+")
+
 sqlite3 "$DB_PATH" "
 DELETE FROM named_entity_tokens WHERE eid = '$EID';
 SELECT changes() as 'Total rows deleted';
@@ -18,11 +25,31 @@ DELETE FROM named_entity_types WHERE eid = '$EID';
 SELECT changes() as 'Total rows deleted';
 DELETE FROM type_proximity_episode WHERE eid = '$EID';
 SELECT changes() as 'Total rows deleted';
+DELETE FROM type_proximity_corpus;
+INSERT INTO type_proximity_corpus
+    (type, other_type, score_sum, episode_count, proximity_max)
+SELECT MIN(type, other_type) AS a, MAX(type, other_type) AS b,
+    SUM(EXP(proximity)), COUNT(*), MAX(proximity)
+FROM type_proximity_episode
+GROUP BY a, b;
 DELETE FROM word_count WHERE eid = '$EID';
 SELECT changes() as 'Total rows deleted';
+DELETE FROM stage_status WHERE eid = '$EID';
+SELECT changes() as 'Total rows deleted';
+DELETE FROM wordclouds WHERE eid = '$EID';
+SELECT changes() as 'Total rows deleted';
+DELETE FROM ticker_payloads WHERE eid = '$EID';
+SELECT changes() as 'Total rows deleted';
+DELETE FROM audio_envelopes WHERE eid = '$EID';
+SELECT changes() as 'Total rows deleted';
+DELETE FROM job_stages WHERE eid = '$EID';
+SELECT changes() as 'Total rows deleted';
 "
 
 rm -f "$T_PATH"
-rm -f "$WC_PATH"
+rm -rf "$RENDITIONS_DIR"
+if [ -n "$WC_FILE" ]; then
+    rm -f "$WC_DIR/$WC_FILE"
+fi
 
 echo "Cleanup complete for episode $EID"
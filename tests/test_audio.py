@@ -0,0 +1,129 @@
+import shutil
+import sqlite3
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from podology.data.audio import (
+    ENVELOPE_SAMPLE_RATE,
+    _FRAME_SAMPLES,
+    _bin_frames,
+    audio_envelope,
+)
+from podology.stats import db as db_module
+from podology.stats import preparation as preparation_module
+from podology.stats.db import audio_envelope as stored_envelope
+from podology.stats.db import envelope_eids, insert_audio_envelope, migrate
+
+
+def test_bin_frames_matches_samples():
+    """Binning per-frame levels gives the levels of the samples in each bin."""
+    rng = np.random.default_rng(0)
+    n_samples = 123 * _FRAME_SAMPLES + 317
+    samples = rng.uniform(-1, 1, n_samples) * rng.uniform(0, 1, n_samples)
+
+    padded = np.pad(samples, (0, -n_samples % _FRAME_SAMPLES))
+    frames = padded.reshape(-1, _FRAME_SAMPLES)
+    counts = np.full(len(frames), _FRAME_SAMPLES)
+    counts[-1] = n_samples % _FRAME_SAMPLES
+
+    bins = 10
+    peak, rms = _bin_frames(
+        np.abs(frames).max(axis=1), np.square(frames).sum(axis=1), counts, bins
+    )
+
+    # Frames are assigned to bins whole, by their centers:
+    centers = np.arange(len(frames)) * _FRAME_SAMPLES + counts / 2
+    frame_bins = np.minimum((centers / n_samples * bins).astype(int), bins - 1)
+    sample_bins = np.repeat(frame_bins, _FRAME_SAMPLES)[:n_samples]
+    for b in range(bins):
+        in_bin = samples[sample_bins == b]
+        assert peak[b] == pytest.approx(np.abs(in_bin).max())
+        assert rms[b] == pytest.approx(np.sqrt(np.mean(in_bin**2)), rel=1e-5)
+
+
+def test_bin_frames_more_bins_than_frames():
+    peak, rms = _bin_frames(
+        np.array([0.5, 1.0]), np.array([1.0, 2.0]), np.array([800, 400]), 6
+    )
+
+    assert len(peak) == len(rms) == 6
+    assert peak.max() == 1.0
+    assert (rms >= 0).all()
+
+
+def test_envelope_roundtrip(tmp_path):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+
+    peak = np.linspace(0, 1, 500)
+    rms = peak / 2
+    with conn:
+        insert_audio_envelope(conn, "ep1", 3600.0, {500: (peak, rms)})
+
+    assert envelope_eids(conn) == {"ep1"}
+    assert stored_envelope(conn, "ep1", 4000) is None
+    stored_peak, stored_rms = stored_envelope(conn, "ep1", 500)
+    np.testing.assert_allclose(stored_peak, peak, atol=1 / 255)
+    np.testing.assert_allclose(stored_rms, rms, atol=1 / 255)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_audio_envelope(tmp_path):
+    # 80 s of silence, then 80 s of a sine wave at half amplitude, across several of
+    # the decoder's blocks:
+    t = np.arange(80 * ENVELOPE_SAMPLE_RATE) / ENVELOPE_SAMPLE_RATE
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+    signal = np.concatenate([np.zeros_like(tone), tone])
+    path = tmp_path / "tone.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(ENVELOPE_SAMPLE_RATE)
+        f.writeframes((signal * 32767).astype("<i2").tobytes())
+
+    duration, levels = audio_envelope(path, levels=(8, 160))
+
+    assert duration == pytest.approx(160, abs=0.1)
+    assert set(levels) == {8, 160}
+    peak, rms = levels[8]
+    np.testing.assert_allclose(peak[:4], 0, atol=1e-3)
+    np.testing.assert_allclose(peak[4:], 0.5, atol=0.01)
+    np.testing.assert_allclose(rms[4:], 0.5 / np.sqrt(2), atol=0.01)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_audio_envelope_corrupt_file(tmp_path):
+    # Enough decoding errors to fill a pipe's buffer, if stderr were one:
+    path = tmp_path / "corrupt.mp3"
+    path.write_bytes(np.random.default_rng(0).bytes(8_000_000))
+
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        audio_envelope(path, levels=(8,))
+    assert excinfo.value.stderr
+
+
+def test_envelope_worker(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(db_module, "_connections", {})
+
+    def decode(path, levels):
+        if path.stem == "broken":
+            raise subprocess.CalledProcessError(1, "ffmpeg", stderr=b"Invalid data")
+        return 60.0, {bins: (np.ones(bins), np.ones(bins) / 2) for bins in levels}
+
+    monkeypatch.setattr(preparation_module, "audio_envelope", decode)
+
+    preparation_module.envelope_worker("ep1")
+    preparation_module.envelope_worker("broken")
+
+    conn = sqlite3.connect(db_path)
+    assert envelope_eids(conn) == {"ep1"}
+    # Stored at the resolution of the hits column:
+    peak, rms = stored_envelope(conn, "ep1", preparation_module.HITS_PLOT_BINS)
+    np.testing.assert_allclose(rms, 0.5, atol=1 / 255)
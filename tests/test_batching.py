@@ -0,0 +1,60 @@
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.data.batching import duration_batches, enqueue_batches
+
+
+def make_episode(eid, minutes):
+    return Episode(
+        eid=eid,
+        url=f"https://example.com/{eid}.mp3",
+        audio=AudioInfo(status=Status.NOT_DONE),
+        transcript=TranscriptInfo(Status.NOT_DONE, Status.NOT_DONE, Status.NOT_DONE),
+        duration=minutes * 60,
+    )
+
+
+def minutes(batch):
+    return sum(ep.duration for ep in batch) / 60
+
+
+def test_batches_fill_up_to_the_cap():
+    episodes = [
+        make_episode(f"ep{i}", m) for i, m in enumerate([30, 150, 90, 60, 120, 20])
+    ]
+
+    batches = duration_batches(episodes, max_seconds=3 * 3600, max_episodes=8)
+
+    assert [minutes(batch) for batch in batches] == [180, 180, 110]
+    assert sorted(ep.eid for batch in batches for ep in batch) == sorted(
+        ep.eid for ep in episodes
+    )
+
+
+def test_long_episodes_and_episode_cap():
+    episodes = [make_episode("long", 300)] + [
+        make_episode(f"short{i}", 10) for i in range(5)
+    ]
+
+    batches = duration_batches(episodes, max_seconds=3 * 3600, max_episodes=2)
+
+    assert [[ep.eid for ep in batch] for batch in batches][0] == ["long"]
+    assert [len(batch) for batch in batches] == [1, 2, 2, 1]
+
+
+def test_unknown_durations_count_as_average():
+    episodes = [make_episode("a", 60), make_episode("b", 120), make_episode("c", 0)]
+
+    batches = duration_batches(episodes, max_seconds=3 * 3600, max_episodes=8)
+
+    # "c" counts as 90 minutes, so it doesn't fit with the other two:
+    assert [[ep.eid for ep in batch] for batch in batches] == [["b", "a"], ["c"]]
+
+
+def test_enqueue_batches_unknown_duration():
+    class StandInStore:
+        def enqueue_transcription_batch(self, episodes):
+            return "+".join(ep.eid for ep in episodes)
+
+    episodes = [make_episode("a", 60), make_episode("b", 0)]
+    episodes[1].duration = None
+
+    assert enqueue_batches(StandInStore(), episodes) == ["a+b"]
@@ -0,0 +1,187 @@
+import sqlite3
+
+import pytest
+
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.stats import db as db_module
+from podology.stats import preparation as preparation_module
+from podology.stats.db import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    STAGE_NAMED_ENTITY_TOKENS,
+    STAGE_NAMED_ENTITY_TYPES,
+    STAGE_TYPE_PROXIMITY,
+    connection,
+    done_eids,
+    insert_named_entity_tokens,
+    is_done,
+    mark_done,
+    migrate,
+)
+
+# The stats tables as initialize_stats_db() used to create them, before migrations:
+BASELINE_SCHEMA = """
+    CREATE TABLE word_count (eid TEXT PRIMARY KEY, count INTEGER);
+    CREATE TABLE named_entity_tokens (eid TEXT, timestamp FLOAT, token TEXT);
+    CREATE TABLE named_entity_types (eid TEXT, type TEXT, count INTEGER);
+    CREATE TABLE type_proximity_episode (
+        eid TEXT, type TEXT, other_type TEXT, proximity REAL
+    );
+"""
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    db_path = tmp_path / "test.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO named_entity_tokens VALUES (?, ?, ?)",
+            [("ep1", 1.0, "Alice"), ("ep1", 2.0, "Bob"), ("ep2", 1.0, "Bob")],
+        )
+        # Episodes that were processed twice have their rows twice:
+        conn.executemany(
+            "INSERT INTO named_entity_types VALUES (?, ?, ?)",
+            [("ep1", "Alice", 1), ("ep1", "Bob", 1), ("ep1", "Bob", 1)],
+        )
+        conn.executemany(
+            "INSERT INTO type_proximity_episode VALUES (?, ?, ?, ?)",
+            [("ep1", "Alice", "Bob", 0.0), ("ep1", "Alice", "Bob", 0.0)],
+        )
+    return db_path
+
+
+def schema(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT type, name, sql FROM sqlite_master ORDER BY name"
+        ).fetchall()
+
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def user_version(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_schema_version():
+    assert SCHEMA_VERSION == len(MIGRATIONS) == 7
+
+
+def test_migrate_baseline(baseline_db):
+    assert migrate(baseline_db) == SCHEMA_VERSION
+    assert user_version(baseline_db) == SCHEMA_VERSION
+
+    conn = sqlite3.connect(baseline_db)
+    # Duplicates are gone, other rows kept:
+    assert count(conn, "named_entity_tokens") == 3
+    assert count(conn, "named_entity_types") == 2
+    assert count(conn, "type_proximity_episode") == 1
+    assert count(conn, "type_proximity_corpus") == 1
+    # What was there is recorded as done:
+    assert done_eids(conn, STAGE_NAMED_ENTITY_TOKENS) == {"ep1", "ep2"}
+    assert done_eids(conn, STAGE_NAMED_ENTITY_TYPES) == {"ep1"}
+    assert done_eids(conn, STAGE_TYPE_PROXIMITY) == {"ep1"}
+
+
+def test_migrate_is_idempotent(baseline_db):
+    migrate(baseline_db)
+    migrated = schema(baseline_db)
+
+    assert migrate(baseline_db) == SCHEMA_VERSION
+    assert schema(baseline_db) == migrated
+    assert user_version(baseline_db) == SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("version", range(len(MIGRATIONS)))
+def test_each_migration_applies(tmp_path, version):
+    """A database left at any version is brought to the same schema as a new one."""
+    new_db = tmp_path / "new.db"
+    migrate(new_db)
+
+    db_path = tmp_path / "old.db"
+    with sqlite3.connect(db_path) as conn:
+        for statements in MIGRATIONS[:version]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {version}")
+
+    assert migrate(db_path) == SCHEMA_VERSION
+    assert user_version(db_path) == SCHEMA_VERSION
+    assert schema(db_path) == schema(new_db)
+
+
+def test_stage_status(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+
+    assert not is_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+    mark_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+    mark_done(conn, "ep2", STAGE_NAMED_ENTITY_TYPES)
+    mark_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+
+    assert is_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+    assert not is_done(conn, "ep2", STAGE_NAMED_ENTITY_TOKENS)
+    assert done_eids(conn, STAGE_NAMED_ENTITY_TOKENS) == {"ep1"}
+    assert done_eids(conn, STAGE_NAMED_ENTITY_TYPES) == {"ep2"}
+
+    # A new version of the stage is to be redone everywhere:
+    monkeypatch.setitem(db_module.STAGE_VERSIONS, STAGE_NAMED_ENTITY_TOKENS, 2)
+    assert not is_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+    assert done_eids(conn, STAGE_NAMED_ENTITY_TOKENS) == set()
+
+
+def test_rerun_after_version_bump(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(preparation_module, "DB_PATH", db_path)
+    monkeypatch.setattr(db_module, "_connections", {})
+    conn = connection()
+    for eid in ("ep1", "ep2"):
+        with conn:
+            insert_named_entity_tokens(
+                conn, eid, [("Alice", 1.0), ("Bob", 2.0), ("Alice", 3.0)]
+            )
+            mark_done(conn, eid, STAGE_NAMED_ENTITY_TOKENS)
+
+    def run_stages():
+        for eid in ("ep1", "ep2"):
+            episode = Episode(
+                eid=eid,
+                url=f"https://example.com/{eid}.mp3",
+                audio=AudioInfo(status=Status.DONE),
+                transcript=TranscriptInfo(
+                    Status.DONE, Status.NOT_DONE, Status.NOT_DONE
+                ),
+            )
+            preparation_module.nament_types_worker(episode)
+            preparation_module.type_proximity_worker(eid)
+        tables = [
+            "named_entity_tokens",
+            "named_entity_types",
+            "type_proximity_episode",
+        ]
+        corpus = conn.execute(
+            "SELECT type, other_type, score_sum, episode_count, proximity_max"
+            " FROM type_proximity_corpus"
+        ).fetchall()
+        return [count(conn, table) for table in tables], corpus
+
+    counts, corpus = run_stages()
+    assert corpus[0][3] == 2
+
+    # A new version redoes the stages in place, without counting episodes twice:
+    monkeypatch.setitem(db_module.STAGE_VERSIONS, STAGE_NAMED_ENTITY_TYPES, 2)
+    monkeypatch.setitem(db_module.STAGE_VERSIONS, STAGE_TYPE_PROXIMITY, 2)
+    assert run_stages() == (counts, corpus)
+    assert is_done(conn, "ep1", STAGE_TYPE_PROXIMITY)
+
+    # Tokens stored again replace the old ones:
+    with conn:
+        insert_named_entity_tokens(conn, "ep1", [("Alice", 1.0)])
+    assert count(conn, "named_entity_tokens") == 4
@@ -0,0 +1,259 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import re
+import threading
+import time
+
+import pytest
+import requests
+
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.data.download import DownloadError, download, part_path
+from podology.data.prefetch import TokenBucket, prefetch
+
+CONTENT = bytes(range(256)) * 4096  # 1 MiB
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves the server's content (404 if None), with Range support unless the
+    server says otherwise.
+
+    With `drop_after` set on the server, the response is cut off after that many
+    bytes of the body (once), as by a dropped connection. With `delay` set, the body
+    is sent in pieces, with that many seconds in between.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        server.connections.add(self.client_address)
+        if server.content is None:
+            self.send_error(404)
+            return
+
+        start = 0
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match and server.ranges:
+            start = int(match.group(1))
+            if start >= len(server.content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(server.content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                f"bytes {start}-{len(server.content) - 1}/{len(server.content)}",
+            )
+        else:
+            self.send_response(200)
+
+        body = server.content[start:]
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if server.drop_after is not None:
+            body = body[: server.drop_after]
+            server.drop_after = None
+            self.wfile.write(body)
+            self.close_connection = True
+            return
+
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            for i in range(0, len(body), 256 * 1024):
+                self.wfile.write(body[i : i + 256 * 1024])
+                time.sleep(server.delay)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    srv.content = CONTENT
+    srv.ranges = True
+    srv.drop_after = None
+    srv.requests = []
+    srv.connections = set()
+    srv.delay = 0
+    srv.lock = threading.Lock()
+    srv.active = srv.max_active = 0
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    srv.url = f"http://127.0.0.1:{srv.server_port}/episode.mp3"
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_download(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+
+    result = download(server.url, path)
+
+    assert path.read_bytes() == CONTENT
+    assert result.size == len(CONTENT)
+    assert result.sha256 == hashlib.sha256(CONTENT).hexdigest()
+    assert not part_path(path).exists()
+
+
+def test_interrupted_download_resumes(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+    server.drop_after = 300_000
+
+    with pytest.raises((requests.RequestException, DownloadError)):
+        download(server.url, path)
+    assert not path.exists()
+    received = part_path(path).read_bytes()
+    assert 0 < len(received) <= 300_000
+    assert CONTENT.startswith(received)
+
+    result = download(server.url, path)
+
+    assert server.requests[-1]["Range"] == f"bytes={len(received)}-"
+    assert path.read_bytes() == CONTENT
+    assert result.sha256 == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_server_without_ranges_starts_over(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+    part_path(path).write_bytes(b"stale bytes")
+    server.ranges = False
+
+    result = download(server.url, path)
+
+    assert path.read_bytes() == CONTENT
+    assert result.size == len(CONTENT)
+
+
+def test_complete_part_file(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+    part_path(path).write_bytes(CONTENT)
+
+    result = download(server.url, path)
+
+    assert server.requests[-1]["Range"] == f"bytes={len(CONTENT)}-"
+    assert path.read_bytes() == CONTENT
+    assert result.sha256 == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_oversized_part_file_starts_over(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+    part_path(path).write_bytes(CONTENT + b"garbage")
+
+    download(server.url, path)
+
+    assert path.read_bytes() == CONTENT
+
+
+def test_http_error(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+    server.content = None
+
+    with pytest.raises(requests.HTTPError):
+        download(server.url, path)
+    assert not path.exists()
+    assert not part_path(path).exists()
+
+
+def test_concurrent_downloads_of_one_file(server, tmp_path):
+    path = tmp_path / "ep1.mp3"
+    server.delay = 0.02
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(download(server.url, path)))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(server.requests) == 1
+    assert path.read_bytes() == CONTENT
+    assert len({r.sha256 for r in results}) == 1
+
+
+class StandInStore:
+    """Just enough of an EpisodeStore for prefetching."""
+
+    def __init__(self, audio_dir):
+        self.audio_dir = audio_dir
+
+    def ensure_audio(self, episode, session=None, throttle=None):
+        result = download(
+            episode.url,
+            self.audio_dir / f"{episode.eid}.mp3",
+            session=session,
+            throttle=throttle,
+        )
+        episode.audio.size = result.size
+        episode.audio.status = Status.DONE
+
+
+def make_episodes(url, n):
+    return [
+        Episode(
+            eid=f"ep{i}",
+            url=f"{url}?ep={i}",
+            audio=AudioInfo(status=Status.NOT_DONE),
+            transcript=TranscriptInfo(
+                Status.NOT_DONE, Status.NOT_DONE, Status.NOT_DONE
+            ),
+        )
+        for i in range(n)
+    ]
+
+
+def test_prefetch_is_concurrent_and_reuses_connections(server, tmp_path):
+    server.delay = 0.02
+    episodes = make_episodes(server.url, 12)
+
+    statuses = prefetch(StandInStore(tmp_path), episodes, workers=4)
+
+    assert statuses == {ep.eid: Status.DONE for ep in episodes}
+    for ep in episodes:
+        assert (tmp_path / f"{ep.eid}.mp3").read_bytes() == CONTENT
+    assert 1 < server.max_active <= 4
+    # Keep-alive: 12 downloads over at most one connection per thread:
+    assert len(server.connections) <= 4
+
+
+def test_token_bucket_caps_rate():
+    throttle = TokenBucket(rate=1e6, burst=1e5)
+
+    t0 = time.monotonic()
+    threads = [
+        threading.Thread(target=lambda: [throttle(50_000) for _ in range(10)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - t0
+
+    # 2 MB at 1 MB/s, less the initial burst:
+    assert 1.8 <= elapsed < 2.5
+
+
+def test_prefetch_bandwidth_cap(server, tmp_path):
+    episodes = make_episodes(server.url, 3)
+
+    t0 = time.monotonic()
+    prefetch(StandInStore(tmp_path), episodes, workers=3, max_bandwidth=2e6)
+
+    # 3 MiB at 2 MB/s:
+    assert time.monotonic() - t0 > 1.3
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from podology.data import EpisodeStore as episode_store_module
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.stats import db as db_module
+from podology.stats.db import connection, job_statuses
+
+
+class StandInJob:
+    def __init__(self, job_id):
+        self.id = job_id
+
+
+class StandInQueue:
+    """Records what is enqueued instead of sending it to Redis."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def enqueue(self, func, *args, **kwargs):
+        self.jobs.append((func.__name__, args, kwargs))
+        return StandInJob(kwargs.get("job_id"))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(db_module, "_connections", {})
+    monkeypatch.setattr(episode_store_module, "DB_PATH", db_path)
+    monkeypatch.setattr(episode_store_module, "AUDIO_RENDITIONS", False)
+    for name in ("download_q", "transcribe_q", "postprocess_q"):
+        monkeypatch.setattr(episode_store_module, name, StandInQueue())
+
+    return episode_store_module.EpisodeStore()
+
+
+def make_episode(eid, audio_status):
+    return Episode(
+        eid=eid,
+        url=f"https://example.com/{eid}.mp3",
+        audio=AudioInfo(status=audio_status),
+        transcript=TranscriptInfo(Status.NOT_DONE, Status.NOT_DONE, Status.NOT_DONE),
+    )
+
+
+def test_enqueue_from_two_threads(store):
+    """Like two dashboard clicks served by different request threads."""
+    episodes = [make_episode("ep1", Status.NOT_DONE), make_episode("ep2", Status.DONE)]
+    for episode in episodes:
+        store.add_or_update(episode)
+    errors = []
+
+    def click(episode):
+        try:
+            store.enqueue_transcription_job(episode)
+        except Exception as e:
+            errors.append(e)
+
+    for episode in episodes:
+        thread = threading.Thread(target=click, args=(episode,))
+        thread.start()
+        thread.join()
+
+    assert errors == []
+    assert job_statuses(connection(), "ep1") == {
+        "download": "QUEUED",
+        "transcribe": "QUEUED",
+        "postprocess": "QUEUED",
+    }
+    assert job_statuses(connection(), "ep2") == {
+        "transcribe": "QUEUED",
+        "postprocess": "QUEUED",
+    }
+    assert store["ep2"].transcript.status == Status.QUEUED
+    assert [job[0] for job in episode_store_module.transcribe_q.jobs] == [
+        "transcribe_worker",
+        "transcribe_worker",
+    ]
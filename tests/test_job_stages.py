@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+
+from podology.frontend.utils import format_job_statuses
+from podology.stats.db import (
+    backlog_projection,
+    job_enqueued,
+    job_finished,
+    job_started,
+    job_statuses,
+    migrate,
+    stage_throughput,
+)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE episodes (eid TEXT PRIMARY KEY, duration FLOAT)")
+    conn.executemany(
+        "INSERT INTO episodes VALUES (?, ?)", [("ep1", 3600.0), ("ep2", 1800.0)]
+    )
+    return conn
+
+
+def shift(conn, eid, stage, column, days):
+    conn.execute(
+        f"UPDATE job_stages SET {column} = {column} - ? WHERE eid = ? AND stage = ?",
+        (days, eid, stage),
+    )
+
+
+def test_job_stage_lifecycle(conn):
+    job_enqueued(conn, "ep1", "download")
+    job_enqueued(conn, "ep1", "transcribe")
+    assert job_statuses(conn, "ep1") == {"download": "QUEUED", "transcribe": "QUEUED"}
+
+    job_started(conn, "ep1", "download")
+    job_finished(conn, "ep1", "download", ok=True)
+    job_started(conn, "ep1", "transcribe")
+    assert job_statuses(conn, "ep1") == {"download": "DONE", "transcribe": "PROCESSING"}
+
+    job_finished(conn, "ep1", "transcribe", ok=False)
+    assert job_statuses(conn, "ep1")["transcribe"] == "ERROR"
+    # As the episode grid shows them, in the order of the queues:
+    assert (
+        format_job_statuses(job_statuses(conn, "ep1"))
+        == "download: done, transcribe: error"
+    )
+    assert format_job_statuses(job_statuses(conn, "ep2")) == ""
+
+    # Enqueuing again starts over:
+    job_enqueued(conn, "ep1", "transcribe")
+    row = conn.execute(
+        "SELECT status, started_at, finished_at FROM job_stages WHERE stage = ?",
+        ("transcribe",),
+    ).fetchone()
+    assert row == ("QUEUED", None, None)
+
+
+def test_stage_throughput(conn):
+    minute = 1 / 1440
+    for eid in ("ep1", "ep2"):
+        job_enqueued(conn, eid, "transcribe")
+        job_started(conn, eid, "transcribe")
+        job_finished(conn, eid, "transcribe", ok=True)
+        # Waited 2 minutes, ran 10:
+        shift(conn, eid, "transcribe", "enqueued_at", 12 * minute)
+        shift(conn, eid, "transcribe", "started_at", 10 * minute)
+    job_enqueued(conn, "ep1", "postprocess")
+    job_started(conn, "ep1", "postprocess")
+    job_finished(conn, "ep1", "postprocess", ok=False)
+    # Long ago, so outside the window:
+    for column in ("enqueued_at", "started_at", "finished_at"):
+        shift(conn, "ep1", "postprocess", column, 30)
+
+    (row,) = stage_throughput(conn, days=7)
+
+    assert row["stage"] == "transcribe"
+    assert row["jobs"] == 2
+    assert row["failed"] == 0
+    assert row["mean_wait_s"] == pytest.approx(120, abs=1)
+    assert row["mean_run_s"] == pytest.approx(600, abs=1)
+    assert row["audio_h"] == pytest.approx(1.5)
+
+
+def test_backlog_projection(conn):
+    conn.execute("ALTER TABLE episodes ADD COLUMN transcript_status TEXT")
+    conn.executemany(
+        "INSERT INTO episodes VALUES (?, ?, ?)",
+        [("ep3", 4.5 * 3600, "QUEUED"), ("ep4", 9 * 3600, "NOT_DONE")],
+    )
+    conn.execute("UPDATE episodes SET transcript_status = 'DONE' WHERE duration < 4000")
+    assert backlog_projection(conn)["queued_eta_s"] is None
+
+    for eid in ("ep1", "ep2"):
+        job_started(conn, eid, "transcribe")
+        job_finished(conn, eid, "transcribe", ok=True)
+        shift(conn, eid, "transcribe", "started_at", 10 / 1440)
+
+    projection = backlog_projection(conn)
+
+    # 1.5 h of audio in 10 minutes:
+    assert projection["rate"] == pytest.approx(9, rel=0.01)
+    assert projection["queued_h"] == pytest.approx(4.5)
+    assert projection["remaining_h"] == pytest.approx(13.5)
+    assert projection["queued_eta_s"] == pytest.approx(1800, rel=0.01)
+    assert projection["remaining_eta_s"] == pytest.approx(5400, rel=0.01)
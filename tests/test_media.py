@@ -0,0 +1,338 @@
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+
+from flask import Flask
+from flask.testing import FlaskClient
+import pytest
+import requests
+from werkzeug.serving import BaseWSGIServer
+
+from podology.data import audio as audio_module
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.frontend import media as media_module
+from podology.stats import db as db_module
+from podology.stats import preparation as preparation_module
+from podology.stats.db import (
+    STAGE_NAMED_ENTITY_TOKENS,
+    insert_ticker_payload,
+    mark_done,
+    migrate,
+    ticker_eids,
+)
+from config import GUNICORN_THREADS, TICKER_WINDOW_WIDTH
+
+AUDIO_SIZE = 4 * 1024 * 1024
+
+
+@pytest.fixture
+def audio_dir(tmp_path, monkeypatch):
+    (tmp_path / "ep1.mp3").write_bytes(bytes(range(256)) * (AUDIO_SIZE // 256))
+    monkeypatch.setattr(media_module, "AUDIO_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def renditions_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "renditions"
+    (directory / "ep1").mkdir(parents=True)
+    (directory / "ep1" / "low.m4a").write_bytes(b"low" * 1000)
+    (directory / "ep1" / "index.m3u8").write_text("#EXTM3U\n")
+    (directory / "ep1" / "seg00000.ts").write_bytes(b"segment")
+    monkeypatch.setattr(media_module, "RENDITIONS_DIR", directory)
+    monkeypatch.setattr(audio_module, "RENDITIONS_DIR", directory)
+    return directory
+
+
+class ClosingClient(FlaskClient):
+    """Reads and closes each response, as a WSGI server does."""
+
+    def open(self, *args, buffered=True, **kwargs):
+        return super().open(*args, buffered=buffered, **kwargs)
+
+
+@pytest.fixture
+def app(audio_dir, monkeypatch):
+    monkeypatch.setattr(
+        media_module,
+        "_audio_streams",
+        threading.BoundedSemaphore(media_module.AUDIO_STREAMS_MAX),
+    )
+    app = Flask(__name__)
+    app.test_client_class = ClosingClient
+    app.register_blueprint(media_module.media, url_prefix="/")
+
+    @app.route("/ping")
+    def ping():
+        return "pong"
+
+    return app
+
+
+class PooledServer(BaseWSGIServer):
+    """Handles requests on GUNICORN_THREADS threads, like a gunicorn gthread worker."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=GUNICORN_THREADS)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+@pytest.fixture
+def server(app):
+    srv = PooledServer("127.0.0.1", 0, app)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+    srv.pool.shutdown(cancel_futures=True)
+
+
+def test_audio_range_request(app, audio_dir):
+    client = app.test_client()
+    content = (audio_dir / "ep1.mp3").read_bytes()
+
+    response = client.get("/audio/ep1", headers={"Range": "bytes=1000-1999"})
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 1000-1999/{AUDIO_SIZE}"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.data == content[1000:2000]
+
+
+def test_audio_conditional_request(app):
+    client = app.test_client()
+
+    response = client.get("/audio/ep1")
+    assert response.status_code == 200
+    assert response.cache_control.public
+    assert response.cache_control.max_age == media_module.AUDIO_MAX_AGE
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    response.close()
+
+    assert client.get("/audio/ep1", headers={"If-None-Match": etag}).status_code == 304
+    assert (
+        client.get(
+            "/audio/ep1", headers={"If-Modified-Since": last_modified}
+        ).status_code
+        == 304
+    )
+    assert client.get("/audio/missing").status_code == 404
+
+
+def test_audio_offload(app, monkeypatch):
+    client = app.test_client()
+
+    monkeypatch.setattr(media_module, "AUDIO_OFFLOAD", "x-accel-redirect")
+    response = client.get("/audio/ep1")
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == "/protected-audio/ep1.mp3"
+    assert response.data == b""
+    assert client.get("/audio/missing").status_code == 404
+
+    monkeypatch.setattr(media_module, "AUDIO_OFFLOAD", "x-sendfile")
+    response = client.get("/audio/ep1")
+    assert response.headers["X-Sendfile"].endswith("ep1.mp3")
+    assert response.data == b""
+
+
+def test_audio_renditions(app, renditions_dir):
+    client = app.test_client()
+
+    response = client.get("/audio/ep1?q=low")
+    assert response.mimetype == "audio/mp4"
+    assert response.data == b"low" * 1000
+
+    response = client.get("/audio/ep1?q=low", headers={"Range": "bytes=0-2"})
+    assert response.status_code == 206
+    assert response.data == b"low"
+
+    response = client.get("/audio/ep1?q=hls")
+    assert response.status_code == 302
+    assert response.location.endswith("/audio/ep1/hls/index.m3u8")
+    response = client.get("/audio/ep1/hls/index.m3u8")
+    assert response.mimetype == "application/vnd.apple.mpegurl"
+    assert client.get("/audio/ep1/hls/seg00000.ts").mimetype == "video/mp2t"
+
+    # Episodes without renditions, and unknown renditions, get the original:
+    (renditions_dir / "ep1" / "low.m4a").unlink()
+    assert client.get("/audio/ep1?q=low").mimetype == "audio/mpeg"
+    assert client.get("/audio/ep1?q=best").mimetype == "audio/mpeg"
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_rendition_worker(audio_dir, renditions_dir, monkeypatch):
+    monkeypatch.setattr(audio_module, "AUDIO_DIR", audio_dir)
+    subprocess.run(
+        [
+            "ffmpeg", "-loglevel", "error", "-f", "lavfi",
+            "-i", "sine=frequency=440:duration=25", "-c:a", "libmp3lame",
+            str(audio_dir / "ep2.mp3"),
+        ],
+        check=True,
+    )  # fmt: skip
+
+    assert audio_module.rendition_worker("ep2")
+
+    low = audio_module.rendition_path("ep2", "low")
+    assert low.stat().st_size < (audio_dir / "ep2.mp3").stat().st_size
+    playlist = audio_module.rendition_path("ep2", "hls").read_text()
+    assert "#EXT-X-ENDLIST" in playlist
+    assert playlist.count(".ts") == 3
+
+
+def test_responsive_while_streaming(server, audio_dir):
+    """More listeners than the app has threads don't hold it up."""
+    # Larger than socket buffers, so that each stream holds its thread:
+    with open(audio_dir / "ep2.mp3", "wb") as f:
+        f.truncate(256 * 1024 * 1024)
+    stop = threading.Event()
+    answered = threading.Semaphore(0)
+    statuses = []
+
+    def listen():
+        with requests.get(f"{server}/audio/ep2", stream=True, timeout=10) as r:
+            statuses.append(r.status_code)
+            if r.status_code == 200:
+                next(r.iter_content(64 * 1024))
+            answered.release()
+            # A slow listener, who doesn't read on until the test is done:
+            stop.wait(10)
+
+    listeners = [threading.Thread(target=listen) for _ in range(2 * GUNICORN_THREADS)]
+    for listener in listeners:
+        listener.start()
+    for _ in listeners:
+        assert answered.acquire(timeout=10)
+
+    latencies = []
+    for _ in range(20):
+        t0 = time.perf_counter()
+        assert requests.get(f"{server}/ping", timeout=5).text == "pong"
+        latencies.append(time.perf_counter() - t0)
+
+    stop.set()
+    for listener in listeners:
+        listener.join()
+
+    assert max(latencies) < 0.5
+    assert statuses.count(200) == media_module.AUDIO_STREAMS_MAX
+    assert statuses.count(503) == len(listeners) - media_module.AUDIO_STREAMS_MAX
+
+    # Streams that ended make room for new ones:
+    for _ in range(10):
+        response = requests.get(f"{server}/audio/ep1", timeout=5)
+        if response.status_code == 200:
+            break
+        time.sleep(0.1)
+    assert response.status_code == 200
+
+
+@pytest.fixture
+def stats_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    monkeypatch.setattr(media_module, "DB_PATH", db_path)
+    monkeypatch.setattr(
+        media_module,
+        "get_ticker_payload",
+        lambda eid, window_width: gzip.compress(b'{"frames":[]}', mtime=0),
+    )
+    media_module._ticker_payload.cache_clear()
+    return db_path
+
+
+def test_ticker(app, stats_db):
+    client = app.test_client()
+    with sqlite3.connect(stats_db) as conn:
+        mark_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+
+    response = client.get(f"/ticker/ep1/{TICKER_WINDOW_WIDTH}")
+    assert response.status_code == 200
+    assert response.json == {"frames": []}
+    with sqlite3.connect(stats_db) as conn:
+        assert ticker_eids(conn, TICKER_WINDOW_WIDTH) == {"ep1"}
+
+    response = client.get(
+        f"/ticker/ep1/{TICKER_WINDOW_WIDTH}",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_ticker_gone_meanwhile(app, stats_db, monkeypatch):
+    client = app.test_client()
+    with sqlite3.connect(stats_db) as conn:
+        mark_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+        etag = insert_ticker_payload(conn, "ep1", TICKER_WINDOW_WIDTH, b"stale")
+        conn.execute("DELETE FROM ticker_payloads")
+    # Reprocessing deleted the ticker after its ETag was looked up:
+    monkeypatch.setattr(media_module, "ticker_etag", lambda *args: etag)
+
+    response = client.get(f"/ticker/ep1/{TICKER_WINDOW_WIDTH}")
+    assert response.status_code == 200
+    assert response.json == {"frames": []}
+    assert response.headers["ETag"] != f'"{etag}"'
+    # The miss isn't cached:
+    assert media_module._ticker_payload.cache_info().currsize == 0
+
+    with sqlite3.connect(stats_db) as conn:
+        conn.execute("DELETE FROM ticker_payloads")
+        conn.execute("DELETE FROM stage_status")
+    assert client.get(f"/ticker/ep1/{TICKER_WINDOW_WIDTH}").status_code == 404
+
+
+def test_ticker_not_computed_on_demand(app, stats_db):
+    client = app.test_client()
+    with sqlite3.connect(stats_db) as conn:
+        mark_done(conn, "ep1", STAGE_NAMED_ENTITY_TOKENS)
+
+    # Other window widths are not precomputed, and not computed either:
+    assert client.get(f"/ticker/ep1/{TICKER_WINDOW_WIDTH + 1}").status_code == 404
+    # Nor tickers of episodes whose named entities aren't stored yet:
+    assert client.get(f"/ticker/ep2/{TICKER_WINDOW_WIDTH}").status_code == 404
+
+    with sqlite3.connect(stats_db) as conn:
+        assert ticker_eids(conn, TICKER_WINDOW_WIDTH) == set()
+        assert ticker_eids(conn, TICKER_WINDOW_WIDTH + 1) == set()
+
+
+def test_reprocessing_clears_ticker(stats_db, monkeypatch):
+    monkeypatch.setattr(preparation_module, "DB_PATH", stats_db)
+    monkeypatch.setattr(db_module, "DB_PATH", stats_db)
+    monkeypatch.setattr(db_module, "_connections", {})
+    monkeypatch.setattr(preparation_module, "require_nltk_resources", lambda: None)
+    monkeypatch.setattr(preparation_module, "Transcript", lambda episode: None)
+    monkeypatch.setattr(
+        preparation_module,
+        "episode_named_entities",
+        lambda transcript: ([("Bob", 1.0)], {"Bob": 1}),
+    )
+    with sqlite3.connect(stats_db) as conn:
+        insert_ticker_payload(conn, "ep1", TICKER_WINDOW_WIDTH, b"stale")
+    episode = Episode(
+        eid="ep1",
+        url="https://example.com/ep1.mp3",
+        audio=AudioInfo(status=Status.DONE),
+        transcript=TranscriptInfo(Status.DONE, Status.NOT_DONE, Status.NOT_DONE),
+    )
+
+    preparation_module.store_timed_named_entities([episode])
+
+    with sqlite3.connect(stats_db) as conn:
+        assert ticker_eids(conn, TICKER_WINDOW_WIDTH) == set()
@@ -0,0 +1,109 @@
+import json
+import sqlite3
+
+import pytest
+
+from podology.data import Transcript as transcript_module
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.data.Transcript import Transcript
+from podology.stats import ner_benchmark
+from podology.stats import nlp as nlp_module
+from podology.stats.db import insert_named_entity_tokens, migrate
+from podology.stats.nlp import NERBackend, episode_named_entities, segment_words
+
+NAMES = {"Alice", "Bob"}
+
+
+class CapitalizedNames(NERBackend):
+    """Stand-in for a real engine: every word in NAMES is an entity."""
+
+    def entities(self, words):
+        return [(word, i) for i, word in enumerate(words) if word in NAMES]
+
+
+def make_segment(start, speaker, words):
+    return {
+        "start": start,
+        "end": start + len(words),
+        "text": " ".join(words),
+        "speaker": speaker,
+        "words": [
+            {"word": word, "start": start + i, "end": start + i + 0.5}
+            for i, word in enumerate(words)
+        ],
+    }
+
+
+@pytest.fixture
+def episode(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcript_module, "TRANSCRIPT_DIR", tmp_path)
+    # Instead of NLTK's list, which needs the NLTK data installed:
+    monkeypatch.setattr(nlp_module, "get_stop_words", lambda: frozenset({"alice"}))
+    segments = [
+        make_segment(0, "SPEAKER_00", ["Alice", "met", "Bob", "today."]),
+        make_segment(10, "SPEAKER_01", ["Did", "she?"]),
+        make_segment(20, "SPEAKER_00", ["Yes,", "and", "Bob", "said", "hi."]),
+    ]
+    (tmp_path / "ep1.json").write_text(json.dumps({"segments": segments}))
+
+    return Episode(
+        eid="ep1",
+        url="https://example.com/ep1.mp3",
+        audio=AudioInfo(status=Status.DONE),
+        transcript=TranscriptInfo(Status.DONE, Status.NOT_DONE, Status.NOT_DONE),
+    )
+
+
+def test_segment_words(episode):
+    assert segment_words(Transcript(episode)) == [
+        (0, ["Alice", "met", "Bob", "today."]),
+        (4, ["Did", "she?"]),
+        (6, ["Yes,", "and", "Bob", "said", "hi."]),
+    ]
+
+
+def test_episode_named_entities(episode):
+    timed_entities, frequencies = episode_named_entities(
+        Transcript(episode), backend=CapitalizedNames()
+    )
+
+    # "Alice" is a stop word:
+    assert timed_entities == [("Bob", 2.0), ("Bob", 22.0)]
+    assert frequencies == {"Bob": 2}
+
+
+class StandInStore:
+    """Just enough of an EpisodeStore for the benchmark."""
+
+    def __init__(self, db_path, episodes):
+        self.db_path = db_path
+        self.episodes = episodes
+
+    def __iter__(self):
+        return iter(self.episodes)
+
+
+def test_ner_benchmark(episode, tmp_path, monkeypatch):
+    monkeypatch.setattr(ner_benchmark, "get_stop_words", lambda: frozenset())
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    with sqlite3.connect(db_path) as conn:
+        # Names known from other episodes:
+        insert_named_entity_tokens(conn, "ep0", [("Bob", 1.0), ("Bob", 5.0)])
+        insert_named_entity_tokens(conn, "ep2", [("Alice", 1.0)])
+
+    (result,) = ner_benchmark.benchmark(
+        n_episodes=5,
+        min_count=2,
+        capitalization=False,
+        episode_store=StandInStore(db_path, [episode]),
+        reference_backend=CapitalizedNames(),
+    )
+
+    assert result["eid"] == "ep1"
+    assert result["words"] == 11
+    assert result["gazetteer_size"] == 1
+    # The gazetteer knows Bob, but not Alice:
+    assert result["precision"] == 1.0
+    assert result["recall"] == pytest.approx(2 / 3)
+    assert result["nltk_words_per_s"] > 0
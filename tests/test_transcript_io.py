@@ -0,0 +1,123 @@
+import json
+
+from podology.data.transcript_io import (
+    compact,
+    convert,
+    expand,
+    read_transcript,
+    write_transcript,
+)
+
+WORDS = [
+    {"word": "Hello", "start": 0.1, "end": 0.4, "score": 0.93, "speaker": "SPEAKER_00"},
+    {
+        "word": "there.",
+        "start": 0.5,
+        "end": 0.8,
+        "score": 0.88,
+        "speaker": "SPEAKER_00",
+    },
+    # Unaligned, as WhisperX leaves numerals:
+    {"word": "1984", "speaker": "SPEAKER_01"},
+    {"word": "was", "start": 1.6, "end": 1.8, "score": 0.75, "speaker": "SPEAKER_01"},
+    {"word": "good", "start": 1.9, "end": 2.2, "score": 0.81},
+]
+
+TRANSCRIPT = {
+    "segments": [
+        {
+            "start": 0.1,
+            "end": 0.8,
+            "text": " Hello there.",
+            "words": WORDS[:2],
+            "speaker": "SPEAKER_00",
+        },
+        {
+            "start": 1.2,
+            "end": 2.2,
+            # Not what the words make:
+            "text": " Nineteen eighty-four was good.",
+            "words": WORDS[2:],
+            "speaker": "SPEAKER_01",
+        },
+        {"start": 3.0, "end": 3.0, "text": "", "words": []},
+    ],
+    "word_segments": WORDS,
+    "language": "en",
+}
+
+
+def test_roundtrip():
+    result = expand(json.loads(json.dumps(compact(TRANSCRIPT))))
+
+    # Everything but the duplicate word list, including the leading whitespace of
+    # texts and words without a speaker:
+    assert result == {k: v for k, v in TRANSCRIPT.items() if k != "word_segments"}
+
+
+def test_roundtrip_speakers():
+    words = [
+        {"word": "Hi", "speaker": "SPEAKER_00"},
+        {"word": "you"},
+        {"word": "two", "speaker": "SPEAKER_01"},
+    ]
+    transcript = {
+        "segments": [
+            {"text": "Hi you two ", "words": words, "speaker": "SPEAKER_00"},
+            # Neither the segment nor its words have a speaker:
+            {"text": "  Bye", "words": [{"word": "Bye"}]},
+        ]
+    }
+
+    data = compact(transcript)
+
+    assert data["words"]["speaker"] == [None, False, "SPEAKER_01", None]
+    assert data["segments"]["text"] == [["", " "], ["  ", ""]]
+    assert expand(json.loads(json.dumps(data))) == transcript
+
+    # The segment has a speaker, but none of its words have:
+    transcript = {
+        "segments": [
+            {
+                "text": "Hi you",
+                "words": [{"word": "Hi"}, {"word": "you"}],
+                "speaker": "SPEAKER_00",
+            }
+        ]
+    }
+
+    data = compact(transcript)
+
+    assert data["words"]["speaker"] == [False, False]
+    assert expand(json.loads(json.dumps(data))) == transcript
+
+
+def test_compact_layout():
+    data = compact(TRANSCRIPT)
+
+    assert data["segments"]["n_words"] == [2, 3, 0]
+    assert data["segments"]["text"] == [
+        [" ", ""],
+        " Nineteen eighty-four was good.",
+        None,
+    ]
+    assert data["words"]["word"] == [w["word"] for w in WORDS]
+    assert data["words"]["start"][2] is None
+    assert data["words"]["speaker"] == [None] * 4 + [False]
+    assert compact(data) is data
+
+
+def test_read_either_layout(tmp_path):
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps(TRANSCRIPT, indent=2))
+    compact_path = tmp_path / "compact.json"
+    write_transcript(compact_path, TRANSCRIPT)
+
+    assert read_transcript(compact_path) == expand(compact(TRANSCRIPT))
+    assert read_transcript(legacy) == TRANSCRIPT
+    assert compact_path.stat().st_size < legacy.stat().st_size / 2
+
+    before, after = convert([legacy])
+
+    assert after < before
+    assert read_transcript(legacy) == read_transcript(compact_path)
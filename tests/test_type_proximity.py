@@ -0,0 +1,138 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from podology.stats.db import MIGRATIONS, insert_type_proximity, migrate, top_neighbours
+from podology.stats.nlp import type_proximity
+
+
+def exhaustive_scores(type_token_dict):
+    """Reference: sum 1/d² over all token pairs of every pair of types."""
+    keys = list(type_token_dict)
+    scores = {}
+    for i, key_i in enumerate(keys):
+        for key_j in keys[i + 1 :]:
+            arr_i = np.array(type_token_dict[key_i], dtype=float)
+            arr_j = np.array(type_token_dict[key_j], dtype=float)
+            diff = np.abs(arr_i[:, None] - arr_j)
+            scores[(key_i, key_j)] = np.sum(1 / (diff**2 + 1e-6))
+    return scores
+
+
+@pytest.fixture
+def type_token_dict():
+    rng = np.random.default_rng(42)
+    return {
+        f"Entity {i}": list(np.round(rng.uniform(0, 3600, rng.integers(1, 15)), 2))
+        for i in range(40)
+    }
+
+
+def test_unbounded_window_matches_exhaustive(type_token_dict):
+    expected = exhaustive_scores(type_token_dict)
+    result = type_proximity(type_token_dict, window=None)
+
+    assert len(result) == len(expected)
+    for row in result.itertuples():
+        assert row.proximity == pytest.approx(
+            np.log(expected[(row.type, row.other_type)])
+        )
+
+
+def test_window_error_is_bounded(type_token_dict):
+    window = 300
+    expected = exhaustive_scores(type_token_dict)
+    result = type_proximity(type_token_dict, window=window)
+
+    for row in result.itertuples():
+        n_pairs = len(type_token_dict[row.type]) * len(type_token_dict[row.other_type])
+        missing = expected[(row.type, row.other_type)] - np.exp(row.proximity)
+        assert -1e-9 <= missing <= n_pairs / window**2 + 1e-9
+
+
+def test_distant_pairs_are_left_out():
+    result = type_proximity({"A": [0.0, 10.0], "B": [15.0], "C": [5000.0]}, window=60)
+
+    assert list(zip(result.type, result.other_type)) == [("A", "B")]
+    assert result.proximity.iloc[0] == pytest.approx(np.log(1 / 225 + 1 / 25))
+
+
+def test_fewer_than_two_types():
+    assert type_proximity({}).empty
+    assert type_proximity({"A": [1.0, 2.0]}).empty
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    return sqlite3.connect(db_path)
+
+
+def test_corpus_aggregate(conn):
+    # Scores below 1 (far apart pairs) have negative logs:
+    insert_type_proximity(conn, "ep1", [("B", "A", np.log(0.5)), ("A", "C", np.log(4))])
+    insert_type_proximity(conn, "ep2", [("A", "B", np.log(0.25))])
+
+    assert top_neighbours(conn, "A") == [
+        ("C", pytest.approx(np.log(4)), 1, pytest.approx(np.log(4))),
+        ("B", pytest.approx(np.log(0.75)), 2, pytest.approx(np.log(0.5))),
+    ]
+    assert top_neighbours(conn, "B") == [
+        ("A", pytest.approx(np.log(0.75)), 2, pytest.approx(np.log(0.5)))
+    ]
+    assert top_neighbours(conn, "A", k=1)[0][0] == "C"
+    assert top_neighbours(conn, "D") == []
+
+
+def test_corpus_aggregate_matches_pooled_scores(conn, type_token_dict):
+    """Summing the episodes' scores is scoring all their token pairs at once."""
+    # Each episode has Entity 0, and about half of the others:
+    rng = np.random.default_rng(0)
+    episodes = [
+        {
+            key: values
+            for key, values in type_token_dict.items()
+            if key == "Entity 0" or rng.random() < 0.5
+        }
+        for _ in range(3)
+    ]
+    for i, episode in enumerate(episodes):
+        result = type_proximity(episode, window=None)
+        insert_type_proximity(conn, f"ep{i}", result.itertuples(index=False))
+
+    expected = {}
+    for episode in episodes:
+        for pair, score in exhaustive_scores(episode).items():
+            expected[pair] = expected.get(pair, 0) + score
+    neighbours = top_neighbours(conn, "Entity 0", k=100)
+    assert any(episode_count > 1 for _, _, episode_count, _ in neighbours)
+    for neighbour, proximity, _, _ in neighbours:
+        pair = tuple(sorted(("Entity 0", neighbour), key=list(type_token_dict).index))
+        assert proximity == pytest.approx(np.log(expected[pair]))
+
+
+def test_migration_backfills_corpus_aggregate(tmp_path):
+    db_path = tmp_path / "test.db"
+    with sqlite3.connect(db_path) as conn:
+        for statements in MIGRATIONS[:2]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute("PRAGMA user_version = 2")
+        conn.executemany(
+            "INSERT INTO type_proximity_episode VALUES (?, ?, ?, ?)",
+            [
+                ("ep1", "B", "A", np.log(0.5)),
+                ("ep2", "A", "B", np.log(0.25)),
+                ("ep2", "A", "C", np.log(4)),
+            ],
+        )
+
+    migrate(db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert top_neighbours(conn, "A") == [
+        ("C", pytest.approx(np.log(4)), 1, pytest.approx(np.log(4))),
+        ("B", pytest.approx(np.log(0.75)), 2, pytest.approx(np.log(0.5))),
+    ]
@@ -0,0 +1,309 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from podology.data.transcribers import whisperx as whisperx_module
+from podology.data.transcript_io import read_transcript
+from podology.data.transcribers.whisperx import WhisperXTranscriber
+
+
+def transcript_of(audio: bytes) -> dict:
+    return {
+        "segments": [
+            {"text": f"{len(audio)} bytes", "start": 0.0, "end": 1.0, "words": []}
+        ],
+        "language": "en",
+    }
+
+
+class StandInWhisperX(BaseHTTPRequestHandler):
+    """Emulates the WhisperX service: /asr, and /jobs unless `async_jobs` is off, and
+    /jobs/batch unless `batch_jobs` is off, too.
+
+    Jobs are done after `polls_until_done` status requests, or fail if their audio is
+    in `failing`. The service restarts, forgetting all jobs, at each status request
+    whose number is in `restarts`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/":
+            return self.reply(200, {"status": "ok"})
+        if not server.async_jobs:
+            return self.reply(404, {"detail": "Not Found"})
+
+        if url.path == "/jobs":
+            job_id = server.by_hash.get(query["audio_sha256"][0])
+            if job_id is None:
+                return self.reply(404, {"detail": "No such job"})
+            return self.reply(200, server.jobs[job_id]["public"])
+
+        match = re.fullmatch(r"/jobs/(\w+)(/result)?", url.path)
+        if match and not match.group(2):
+            server.polls += 1
+            if server.polls in server.restarts:
+                server.jobs.clear()
+                server.by_hash.clear()
+        job = server.jobs.get(match.group(1)) if match else None
+        if job is None:
+            return self.reply(404, {"detail": "No such job"})
+
+        if match.group(2):
+            return self.reply(200, transcript_of(job["audio"]))
+
+        job["polls"] += 1
+        if (
+            job["public"]["status"] == "queued"
+            and job["polls"] >= server.polls_until_done
+        ):
+            if job["audio"] in server.failing:
+                job["public"].update(status="failed", error="CUDA out of memory")
+            else:
+                job["public"]["status"] = "done"
+        return self.reply(200, job["public"])
+
+    def do_POST(self):
+        server = self.server
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        audios = re.findall(
+            rb'name="audio_files?"; filename="[^"]*"\r\nContent-Type: audio/mpeg\r\n\r\n'
+            rb"(.*?)\r\n--",
+            body,
+            re.S,
+        )
+        hashes = re.findall(rb'name="audio_sha256"\r\n\r\n(\w+)\r\n', body)
+
+        if url.path == "/asr":
+            server.sync_uploads += 1
+            return self.reply(200, transcript_of(audios[0]))
+        if not server.async_jobs or url.path == "/jobs/batch" and not server.batch_jobs:
+            return self.reply(404, {"detail": "Not Found"})
+
+        server.uploads += 1
+        server.uploaded_files += len(audios)
+        jobs = []
+        for audio, audio_sha256 in zip(audios, hashes, strict=True):
+            audio_sha256 = audio_sha256.decode()
+            assert audio_sha256 == hashlib.sha256(audio).hexdigest()
+
+            job_id = f"job{len(server.jobs)}"
+            server.jobs[job_id] = {
+                "audio": audio,
+                "polls": 0,
+                "public": {"job_id": job_id, "status": "queued"},
+            }
+            server.by_hash[audio_sha256] = job_id
+            jobs.append(server.jobs[job_id]["public"])
+
+        if url.path == "/jobs/batch":
+            return self.reply(202, {"jobs": jobs})
+        self.reply(202, jobs[0])
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def service():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandInWhisperX)
+    srv.async_jobs = srv.batch_jobs = True
+    srv.polls_until_done = 2
+    srv.failing = set()
+    srv.restarts = set()
+    srv.jobs, srv.by_hash = {}, {}
+    srv.uploads = srv.uploaded_files = srv.sync_uploads = srv.polls = 0
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    audio_dir = tmp_path / "audio"
+    transcript_dir = tmp_path / "transcripts"
+    audio_dir.mkdir()
+    transcript_dir.mkdir()
+    monkeypatch.setattr(whisperx_module, "AUDIO_DIR", audio_dir)
+    monkeypatch.setattr(whisperx_module, "TRANSCRIPT_DIR", transcript_dir)
+    for i in range(3):
+        (audio_dir / f"ep{i}.mp3").write_bytes(b"ID3" + bytes([i]) * (1000 * (i + 1)))
+    return audio_dir, transcript_dir
+
+
+@pytest.fixture
+def transcriber(service):
+    return WhisperXTranscriber(
+        whisperx_url=f"http://127.0.0.1:{service.server_port}", poll_interval=0.01
+    )
+
+
+def stored(transcript_dir, eid):
+    return read_transcript(transcript_dir / f"{eid}.json")
+
+
+def test_jobs_in_flight_together(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+
+    errors = transcriber.transcribe_many(
+        {f"ep{i}": audio_dir / f"ep{i}.mp3" for i in range(3)}
+    )
+
+    assert errors == {"ep0": None, "ep1": None, "ep2": None}
+    # One request for all three files:
+    assert service.uploads == 1
+    assert service.uploaded_files == 3
+    assert len(service.jobs) == 3
+    # All three were submitted before polling, so two rounds of polls suffice:
+    assert service.polls == 6
+    assert stored(transcript_dir, "ep1")["segments"][0]["text"] == "2003 bytes"
+    assert stored(transcript_dir, "ep1")["segments"][0]["speaker"] == "SPEAKER_00"
+
+
+def test_batch_only_uploads_new_files(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+    transcriber.submit(audio_dir / "ep0.mp3")
+
+    errors = transcriber.transcribe_many(
+        {f"ep{i}": audio_dir / f"ep{i}.mp3" for i in range(3)}
+    )
+
+    assert errors == {"ep0": None, "ep1": None, "ep2": None}
+    assert service.uploads == 2
+    assert service.uploaded_files == 3
+    assert stored(transcript_dir, "ep0")["segments"][0]["text"] == "1003 bytes"
+
+
+def test_without_batch_endpoint(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+    service.batch_jobs = False
+
+    errors = transcriber.transcribe_many(
+        {f"ep{i}": audio_dir / f"ep{i}.mp3" for i in range(3)}
+    )
+
+    assert errors == {"ep0": None, "ep1": None, "ep2": None}
+    assert transcriber.batch_jobs is False
+    assert service.uploads == service.uploaded_files == 3
+    assert stored(transcript_dir, "ep2")["segments"][0]["text"] == "3003 bytes"
+
+
+def test_resubmission_is_idempotent(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+
+    first = transcriber.submit(audio_dir / "ep0.mp3")
+    second = transcriber.submit(audio_dir / "ep0.mp3")
+    transcriber.submit_job(audio_dir / "ep0.mp3", job_id="ep0")
+
+    assert first == second
+    assert service.uploads == 1
+    assert stored(transcript_dir, "ep0")["language"] == "en"
+
+
+def test_failed_job(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+    service.failing.add((audio_dir / "ep1.mp3").read_bytes())
+
+    errors = transcriber.transcribe_many(
+        {"ep0": audio_dir / "ep0.mp3", "ep1": audio_dir / "ep1.mp3"}
+    )
+
+    assert errors["ep0"] is None
+    assert "CUDA out of memory" in str(errors["ep1"])
+    assert not (transcript_dir / "ep1.json").exists()
+    with pytest.raises(RuntimeError):
+        transcriber.submit_job(audio_dir / "ep1.mp3", job_id="ep1")
+
+
+def test_lost_job_is_resubmitted(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+    service.restarts.add(1)
+
+    errors = transcriber.transcribe_many(
+        {"ep0": audio_dir / "ep0.mp3", "ep1": audio_dir / "ep1.mp3"}
+    )
+
+    assert errors == {"ep0": None, "ep1": None}
+    # Both jobs were lost, and both files uploaded again:
+    assert service.uploaded_files == 4
+    assert stored(transcript_dir, "ep1")["segments"][0]["text"] == "2003 bytes"
+
+
+def test_job_lost_twice(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+    service.restarts.update({1, 2})
+
+    errors = transcriber.transcribe_many({"ep0": audio_dir / "ep0.mp3"})
+
+    assert "lost" in str(errors["ep0"])
+    assert service.uploaded_files == 2
+    assert not (transcript_dir / "ep0.json").exists()
+
+
+def test_unstorable_result(service, transcriber, dirs, monkeypatch):
+    audio_dir, transcript_dir = dirs
+    write_transcript = whisperx_module.write_transcript
+
+    def write_or_fail(path, transcript):
+        if path.stem == "ep1":
+            raise OSError("No space left on device")
+        write_transcript(path, transcript)
+
+    monkeypatch.setattr(whisperx_module, "write_transcript", write_or_fail)
+
+    errors = transcriber.transcribe_many(
+        {f"ep{i}": audio_dir / f"ep{i}.mp3" for i in range(3)}
+    )
+
+    assert errors["ep0"] is None and errors["ep2"] is None
+    assert isinstance(errors["ep1"], OSError)
+    assert stored(transcript_dir, "ep2")["segments"][0]["text"] == "3003 bytes"
+
+
+def test_status_and_download(service, transcriber, dirs, tmp_path):
+    audio_dir, _ = dirs
+
+    assert transcriber.get_status("ep2")["status"] == "not_found"
+    transcriber.submit(audio_dir / "ep2.mp3")
+    assert transcriber.get_status("ep2")["status"] == "queued"
+    service.polls_until_done = 1
+    transcriber.job_status("job0")
+
+    assert transcriber.get_status("ep2")["status"] == "done"
+    transcriber.download_transcript("ep2", tmp_path / "out" / "ep2.json")
+    result = read_transcript(tmp_path / "out" / "ep2.json")
+    assert result["segments"][0]["text"] == "3003 bytes"
+
+
+def test_falls_back_to_sync(service, transcriber, dirs):
+    audio_dir, transcript_dir = dirs
+    service.async_jobs = False
+
+    errors = transcriber.transcribe_many(
+        {f"ep{i}": audio_dir / f"ep{i}.mp3" for i in range(3)}
+    )
+
+    assert errors == {"ep0": None, "ep1": None, "ep2": None}
+    assert transcriber.async_jobs is False
+    assert service.sync_uploads == 3
+    assert stored(transcript_dir, "ep2")["segments"][0]["text"] == "3003 bytes"
@@ -0,0 +1,153 @@
+import sqlite3
+
+from flask import Flask
+import pytest
+
+from podology.data import EpisodeStore as episode_store_module
+from podology.data.Episode import AudioInfo, Episode, Status, TranscriptInfo
+from podology.frontend import media as media_module
+from podology.stats import db as db_module
+from podology.stats import preparation as preparation_module
+from podology.stats.db import (
+    STAGE_NAMED_ENTITY_TYPES,
+    insert_named_entity_types,
+    mark_done,
+    migrate,
+    wordcloud,
+)
+from podology.stats.nlp import wordcloud_digest
+from podology.stats.preparation import store_wordclouds, wordcloud_worker
+
+
+@pytest.fixture
+def stats_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test.db"
+    migrate(db_path)
+    for module in (db_module, preparation_module, media_module):
+        monkeypatch.setattr(module, "DB_PATH", db_path)
+    monkeypatch.setattr(db_module, "_connections", {})
+    return db_path
+
+
+@pytest.fixture
+def wordcloud_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "wordclouds"
+    directory.mkdir()
+    monkeypatch.setattr(preparation_module, "WORDCLOUD_DIR", directory)
+    monkeypatch.setattr(media_module, "WORDCLOUD_DIR", directory)
+    return directory
+
+
+def store_types(db_path, eid, frequencies):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM named_entity_types WHERE eid = ?", (eid,))
+        insert_named_entity_types(conn, eid, frequencies.keys(), frequencies.values())
+        mark_done(conn, eid, STAGE_NAMED_ENTITY_TYPES)
+
+
+def make_episode(eid):
+    return Episode(
+        eid=eid,
+        url=f"https://example.com/{eid}.mp3",
+        audio=AudioInfo(status=Status.DONE),
+        transcript=TranscriptInfo(Status.DONE, Status.NOT_DONE, Status.NOT_DONE),
+    )
+
+
+def test_wordcloud_worker(stats_db, wordcloud_dir):
+    frequencies = {"Alice": 3, "Bob": 1}
+    store_types(stats_db, "ep1", frequencies)
+    store_types(stats_db, "ep2", frequencies)
+
+    assert wordcloud_worker("ep1")
+    assert wordcloud_worker("ep2")
+    # Named by the hash of the counts, so that equal word clouds are one file:
+    filename = f"{wordcloud_digest(frequencies)}.{preparation_module.WORDCLOUD_FORMAT}"
+    assert [path.name for path in wordcloud_dir.iterdir()] == [filename]
+    with sqlite3.connect(stats_db) as conn:
+        assert wordcloud(conn, "ep2")[1] == filename
+
+    # Unchanged counts are not rendered again:
+    assert not wordcloud_worker("ep1")
+
+    # The old file is deleted once no episode uses it any longer:
+    store_types(stats_db, "ep1", {"Alice": 3})
+    store_types(stats_db, "ep2", {"Alice": 3})
+    assert wordcloud_worker("ep1")
+    assert (wordcloud_dir / filename).exists()
+    assert wordcloud_worker("ep2")
+    assert not (wordcloud_dir / filename).exists()
+    assert len(list(wordcloud_dir.iterdir())) == 1
+
+
+def test_store_wordclouds_json_mode(stats_db, wordcloud_dir, monkeypatch):
+    monkeypatch.setattr(preparation_module, "WORDCLOUD_MODE", "json")
+    store_types(stats_db, "ep1", {"Alice": 3})
+    episodes = [make_episode("ep1"), make_episode("ep2")]
+
+    store_wordclouds(episodes)
+
+    # Nothing to render, but the entity counts are there to serve:
+    assert [episode.transcript.wcstatus for episode in episodes] == [
+        Status.DONE,
+        Status.NOT_DONE,
+    ]
+    assert list(wordcloud_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("mode", ["image", "json"])
+def test_update_from_files(stats_db, wordcloud_dir, tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(episode_store_module, "DB_PATH", stats_db)
+    monkeypatch.setattr(episode_store_module, "WORDCLOUD_MODE", mode)
+    store = episode_store_module.EpisodeStore()
+    store.audio_dir = store.transcript_dir = store.chunks_dir = tmp_path
+    store.wordcloud_dir = wordcloud_dir
+    store.add_or_update(make_episode("ep1"))
+    (tmp_path / "ep1.json").write_text("{}")
+    store_types(stats_db, "ep1", {"Alice": 3})
+
+    store.update_from_files()
+
+    # Images need rendering, JSON word clouds only the entity counts:
+    expected = Status.DONE if mode == "json" else Status.NOT_DONE
+    assert store["ep1"].transcript.wcstatus == expected
+
+
+@pytest.fixture
+def client(stats_db, wordcloud_dir):
+    app = Flask(__name__)
+    app.register_blueprint(media_module.media, url_prefix="/")
+    return app.test_client()
+
+
+def test_wordcloud_data(client, stats_db, monkeypatch):
+    monkeypatch.setattr(media_module, "WORDCLOUD_TOP_N", 2)
+    store_types(stats_db, "ep1", {"Alice": 3, "Bob": 1, "Carol": 2})
+
+    response = client.get("/wordcloud-data/ep1")
+    assert response.status_code == 200
+    assert response.json == [["Alice", 3], ["Carol", 2]]
+    assert response.cache_control.max_age == media_module.WORDCLOUD_DATA_MAX_AGE
+
+    etag = response.headers["ETag"]
+    response = client.get("/wordcloud-data/ep1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Changed counts have another ETag:
+    store_types(stats_db, "ep1", {"Alice": 4})
+    response = client.get("/wordcloud-data/ep1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json == [["Alice", 4]]
+
+    # Episodes whose entities aren't stored yet:
+    assert client.get("/wordcloud-data/ep2").status_code == 404
+
+
+def test_wordcloud_image(client, wordcloud_dir):
+    (wordcloud_dir / "0123abcd.png").write_bytes(b"png")
+
+    response = client.get("/wordclouds/0123abcd.png")
+    assert response.data == b"png"
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == media_module.IMMUTABLE_MAX_AGE
+    assert client.get("/wordclouds/missing.png").status_code == 404
@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from podology.frontend.renderers.wordticker import (
+    Appearance,
+    Ticker,
+    ticker_from_timed_naments,
+)
+
+
+def scan_lanes(appearances):
+    """Reference: place each appearance in the lowest lane it fits in, scanning."""
+    lanes = []
+    for appearance in appearances:
+        for lane in lanes:
+            if lane[-1].end <= appearance.start:
+                lane.append(appearance)
+                break
+        else:
+            lanes.append([appearance])
+    return [[a.apid for a in lane] for lane in lanes]
+
+
+def ticker_from_rows(named_entities, envelope_width):
+    """Reference: one Appearance per row, merged pairwise, as the ticker used to."""
+    rows = sorted(named_entities)
+    enum = {}
+    groups = {}
+    for token, center in rows:
+        apid = f"{token.replace(' ', '_').lower()}.{enum.setdefault(token, 0)}"
+        enum[token] += 1
+        groups.setdefault(token, []).append(
+            Appearance(token, apid, timestamp=center, width=envelope_width)
+        )
+
+    appearances = []
+    for token in sorted(groups):
+        current, *rest = groups[token]
+        for nxt in rest:
+            if current.end < nxt.start:
+                appearances.append(current)
+                current = nxt
+            else:
+                current = Appearance.merge(current, nxt)
+        appearances.append(current)
+    appearances.sort(key=lambda a: a.start)
+
+    ticker = Ticker()
+    for appearance in appearances:
+        ticker.add_appearance(appearance)
+    ticker.update_last_frame()
+    return ticker
+
+
+@pytest.fixture
+def appearances():
+    rng = random.Random(42)
+    result = [
+        Appearance(f"term{i % 50}", f"term{i % 50}.{i}", timestamp=t, width=120)
+        for i, t in enumerate(rng.uniform(0, 7200) for _ in range(2000))
+    ]
+    result.sort(key=lambda a: a.start)
+    return result
+
+
+def test_lanes_match_linear_scan(appearances):
+    ticker = Ticker()
+    for appearance in appearances:
+        ticker.add_appearance(appearance)
+
+    assert [[a.apid for a in lane] for lane in ticker.lanes] == scan_lanes(appearances)
+
+
+def test_out_of_order_appearances_do_not_overlap(appearances):
+    shuffled = appearances[:]
+    random.Random(0).shuffle(shuffled)
+
+    ticker = Ticker()
+    for appearance in shuffled:
+        ticker.add_appearance(appearance)
+
+    for lane in ticker.lanes:
+        for a, b in zip(lane, lane[1:]):
+            assert a.end <= b.start
+
+
+def test_get_value_and_window_queries(appearances):
+    ticker = Ticker()
+    for appearance in appearances:
+        ticker.add_appearance(appearance)
+
+    target = appearances[700]
+    t = (target.start + target.end) / 2
+    assert ticker.get_value(target.apid, t) == target.frame(t)
+    assert ticker.get_value("no such apid", t) == 0.0
+
+    t0, t1 = 3000.0, 3100.0
+    expected = [a for a in appearances if a.end >= t0 and a.start <= t1]
+    assert ticker.appearances_between(t0, t1) == expected
+
+
+def test_ticker_from_timed_naments_matches_rowwise():
+    rng = random.Random(1)
+    # Some 15 appearances per name, so that some merge and some don't:
+    names = [f"Name {i}" for i in range(200)] + ["Alex Jones", "FBI"]
+    named_entities = [
+        (rng.choice(names), round(rng.uniform(0, 3600), 3)) for _ in range(3000)
+    ]
+
+    expected = ticker_from_rows(named_entities, envelope_width=120).to_dict()
+    actual = ticker_from_timed_naments(named_entities, envelope_width=120).to_dict()
+
+    assert actual == expected